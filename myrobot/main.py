@@ -1,160 +1,157 @@
 #!/usr/bin/env python3
 
 # Must-have libraries
-from ev3dev2.motor import MoveSteering, OUTPUT_B, OUTPUT_C
-from ev3dev2.sensor.lego import ColorSensor, GyroSensor
-import time
-
-# Modules assignment
-move_steering = MoveSteering(OUTPUT_B, OUTPUT_C)
-color_sensor = ColorSensor()
-gyro_sensor = GyroSensor()
-
-# Color threshholds
+import os
+import sys
+
+# Make the shared robotlib package in the repository root importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# Imported first, it times the startup phases with ROBOT_STARTUP set (see robotlib/startup.py)
+from robotlib import startup
+from robotlib.robot import Robot, Devices
+from robotlib.tasks import wait
+from robotlib.motion import turn_by, drive_distance, driven
+from robotlib.mission import Mission
+from robotlib import config, follower
+from robotlib.search import LineSearch
+from robotlib.calibration import ColorClasses
+startup.phase('imports')
+
+# Modules assignment, the ev3dev2 devices (or simulated ones with ROBOT_BACKEND=sim)
+# are built when the robot first uses them
+devices = Devices(move_steering=('MoveSteering', 'OUTPUT_B', 'OUTPUT_C'),
+                  color_sensor=('ColorSensor',),
+                  gyro_sensor=('GyroSensor',))
+
+# Color threshholds (the defaults, they are calibrated at startup)
 GREEN_MAX = 20
-GREY_MIN = 30  
+GREY_MIN = 30
 GREY_MAX = 45
 WHITE_MIN = 55
 
-# Movement constants
-FORWARD_SPEED = 35
-TURN_GAIN = 1.0
-OSCILLATION_SPEED = 20
-
-# Global modifiables
-is_line_followed = True
-grey_lines_crossed = 0
-is_program_complete = False
+# The surfaces with their usual reading and the thresholds above. Green and white are
+# fitted to the readings of a sweep over the line at startup and follow the lighting
+# while driving, grey keeps its place between them (see robotlib/calibration.py)
+colors = ColorClasses([
+    ('green', 8, None, GREEN_MAX),
+    ('grey', 38, GREY_MIN, GREY_MAX),
+    ('white', 70, WHITE_MIN, None),
+], anchors=('green', 'white'))
+
+# Settings of the line follower (see robotlib/follower.py) and of the program. Tune them
+# per track with ROBOT_CONFIG, python -m robotlib.tune searches them on the simulator
+#
+# forward_speed     - speed of stepping off the grey cross
+# step_off_distance - cm driven straight on after the 360, off the cross it was done on
+# clear_distance    - cm after the start or the 360 before grey counts as a cross
+# oscillation_speed - turning speed of the line search
+# turn_speed        - top speed of the turns on the spot (see robotlib/motion.py)
+# search_angles     - sweep widths of the line search in degrees (see robotlib/search.py)
+# green_window      - last readings that must all be green to find the line
+# grey_votes        - grey readings among the last grey_window that make a cross
+# white_window      - last readings that must all be white to lose the line
+# mission           - what the robot does at the grey crosses, rows of (state, event,
+#                     next state, action[, guard]) of robotlib/mission.py: a 360 at the
+#                     first cross and the end of the program at the second, each once
+#                     the robot is clear of the place it started or spun at
+SETTINGS = config.load(dict(follower.DEFAULTS,
+                            kp=2.0, kd=0.1, feed_forward=10.0, max_speed=70, min_speed=40,
+                            forward_speed=35, oscillation_speed=20, turn_speed=40,
+                            step_off_distance=8, clear_distance=20,
+                            search_angles=[30, 60, 90, 120, 150, 180],
+                            green_window=7, grey_votes=3, grey_window=5, white_window=12,
+                            mission=[['outbound', 'grey', 'returning', 'spin_around', 'clear_of_cross'],
+                                     ['returning', 'grey', 'done', 'finish', 'clear_of_cross']]))
+FOLLOWER = config.pick(SETTINGS, follower.DEFAULTS)
 
-# A buffer that serves as a sensor values tracker
-recent_values = []
-BUFFER_SIZE = 15
-
-# A method to retrieve a color sensor value
-def get_color():
-    value = color_sensor.reflected_light_intensity
-
-    recent_values.append(value)
-    if len(recent_values) > BUFFER_SIZE:
-        recent_values.pop(0)
-    return value
+# Movement constants
+FORWARD_SPEED = SETTINGS['forward_speed']
+OSCILLATION_SPEED = SETTINGS['oscillation_speed']
+TURN_SPEED = SETTINGS['turn_speed']
+STEP_OFF_DISTANCE = SETTINGS['step_off_distance']
+CLEAR_DISTANCE = SETTINGS['clear_distance']
+
+# Color voting windows
+GREEN_WINDOW = SETTINGS['green_window']
+GREY_VOTES = SETTINGS['grey_votes']
+GREY_WINDOW = SETTINGS['grey_window']
+WHITE_WINDOW = SETTINGS['white_window']
+
+# The robot samples the sensors once per 10 ms control tick, every check below uses
+# that snapshot. Its window of the last 15 color values keeps running counts of the
+# color bands over the voting windows so the checks below are O(1)
+spans = (GREY_WINDOW, GREEN_WINDOW, WHITE_WINDOW)
+robot = Robot(devices, colors,
+              sources=dict(color=lambda: devices.color_sensor.reflected_light_intensity,
+                           gyro=lambda: devices.gyro_sensor.angle,
+                           left_position=lambda: devices.move_steering.left_motor.position,
+                           right_position=lambda: devices.move_steering.right_motor.position),
+              size=max((15,) + spans), spans=spans)
 
 # A method to check if a robot must act upon the color green
-def is_green():
-    # Only consider it green if sensor recieves green consistently
-    if len(recent_values) < BUFFER_SIZE:
-        return get_color() <= GREEN_MAX
-    return all(v <= GREEN_MAX for v in recent_values[-7:])  # Considers green according to last 7 values
+def is_green(snapshot):
+    return robot.steady('green', GREEN_WINDOW, snapshot)  # Considers green according to the last GREEN_WINDOW values
 
 # A method to check if a robot must act upon the color grey
-def is_grey():
-    # Only consider it grey if sensor recieves grey consistently
-    value = get_color()  
-    
-    if GREY_MIN <= value <= GREY_MAX:
-        grey_count = sum(1 for v in recent_values[-5:] if GREY_MIN <= v <= GREY_MAX)
-        return grey_count >= 3 # Considers grey if at least 3 out of last five sensor reads were grey
-    return False
+def is_grey(snapshot):
+    return robot.mostly('grey', GREY_VOTES, GREY_WINDOW, snapshot) # Considers grey if at least GREY_VOTES of the last GREY_WINDOW sensor reads were grey
 
 # A method to check if a robot must act upon the color white
-def is_white():
-    # Only consider it white if sensor recieves white consistently
-    if len(recent_values) < BUFFER_SIZE:
-        return get_color() >= WHITE_MIN
-    return all(v >= WHITE_MIN for v in recent_values[-12:])  # Considers white according to last 12 values
-
-# A method to make a robot follow a green line
-def follow_green_line():
-    # Accessing global constants
-    global is_line_followed, grey_lines_crossed, is_program_complete
-    
-    sensor_value = get_color()
-    error = sensor_value - (GREEN_MAX / 2)
-    
-    # Stop following the green line when lost
-    if is_white():
-        is_line_followed = False
-        return
-    
-    # Found the grey cross
-    if is_grey():
-        # Increment the number of grey lines crossed when faced with one 
-        grey_lines_crossed += 1
-        
-        # If the grey line is first do the 360
-        if grey_lines_crossed == 1:
-            gyro_sensor.reset() # Reset the gyro sensor 
-            move_steering.off() # and stop moving
-            time.sleep(0.3)
-
-            move_steering.on(steering=100, speed=20) # Start spinning
-            while gyro_sensor.angle < 345:           # until the angle is
-                time.sleep(0.01)                     # 360 (355 is chosen for better accuracy)
-
-            move_steering.on(steering=0, speed=FORWARD_SPEED) # Step forward
-            time.sleep(0.3)                                   # for 300ms after 360
-            move_steering.off()                               # to prevent false detection
-
-        # If the grey line is second finalize the program
-        elif grey_lines_crossed >= 2:
-            is_program_complete = True
-            move_steering.off()
-        return
-    
-    steering = error * TURN_GAIN
-    steering = max(-80, min(80, steering))
-    move_steering.on(steering=steering, speed=FORWARD_SPEED)
-
-# A method to make a robot search for the green line (or grey crosses)
-def oscillated_search():
-    # Accessing a global constant
-    global is_line_followed
-    
-    # A range of angles to use while search 
-    angles = [30, 60, 90, 120, 150, 180]
-    
-    # Repeat oscillated search move for each angle in the range until green or grey is found
-    for angle in angles:  
-        # Reset gyro value to zero before starting the counter-clockwise oscillation cycle with a new angle
-        gyro_sensor.reset()   
-        move_steering.on(steering=-100, speed=OSCILLATION_SPEED)
-
-        while gyro_sensor.angle > -angle:
-            # While rotating constantly check a color sensor value for a green line or a grey cross
-            if is_green() or is_grey():
-                is_line_followed = True # Switch back to line following mode if a color match was found
-                return
-            time.sleep(0.01)
-        move_steering.off()
-        
-        # Reset gyro value to zero before proceeding with the clockwise oscillation cycle
-        gyro_sensor.reset()
-        move_steering.on(steering=100, speed=OSCILLATION_SPEED)
-        
-        while gyro_sensor.angle < angle * 2:   #the angle is doubled for completion of the whole rotation 
-            if is_green() or is_grey():
-                is_line_followed = True
-                return
-            time.sleep(0.01)
-        move_steering.off()
-        
-        # Reset gyro as usual and get back to starting position if no match was found
-        gyro_sensor.reset()
-        move_steering.on(steering=-100, speed=OSCILLATION_SPEED)
-        while gyro_sensor.angle > -angle:
-            time.sleep(0.01)
-        move_steering.off()
-        
-    # If no match found at all stop the motors
-    move_steering.off()
-
-# Main part of the program
-while not is_program_complete: 
-    if is_line_followed:    # Keep following the green line until lost
-        follow_green_line()
-    else:                   # Otherwise search for non-white match (green or grey)
-        oscillated_search()
-    time.sleep(0.01)
-
-# Stop movement when the program is complete
-move_steering.off()
\ No newline at end of file
+def is_white(snapshot):
+    return robot.steady('white', WHITE_WINDOW, snapshot)  # Considers white according to the last WHITE_WINDOW values
+
+# A method to act upon a grey cross, the mission knows which one it is
+def on_grey(snapshot):
+    mission.fire('grey', snapshot)
+
+# Where the robot started or the last 360 ended, in cm driven
+spun_at = 0.0
+
+# A task to do the 360 on the first grey cross
+def spin_around(snapshot):
+    global spun_at
+
+    move_steering = devices.move_steering
+    move_steering.off() # Stop moving
+    yield from wait(0.3)
+
+    # Spin a full turn, slowing down before the end so it stops on 360
+    snapshot = yield from turn_by(move_steering, 360, speed=TURN_SPEED)
+
+    # The spin ends right over the cross again, step forward off it by a fixed
+    # distance: a noisy reading can look like the edge of the cross, the wheels can't
+    snapshot = yield from drive_distance(move_steering, STEP_OFF_DISTANCE, speed=FORWARD_SPEED,
+                                         heading=snapshot.gyro)
+    spun_at = driven(snapshot)
+
+# A guard of the mission: grey only counts as the next cross once the robot is clear of
+# the one it spun on, so a cross is never counted twice, and of the start, where the
+# sensor over the edge of the line reads grey as well
+def clear_of_cross(snapshot):
+    return driven(snapshot) - spun_at >= CLEAR_DISTANCE
+
+# A method to end the program at the last grey cross
+def finish(snapshot):
+    robot.finish()
+
+# The grey crosses of the course (see SETTINGS)
+mission = Mission(SETTINGS['mission'], actions=dict(spin_around=spin_around, finish=finish),
+                  guards=dict(clear_of_cross=clear_of_cross), scheduler=robot.scheduler)
+robot.checks.append(mission.tick)
+
+# Steer along the edge of the green line, brighter readings steer right. The robot stops
+# following when it sees white and does the grey cross actions instead of steering
+robot.follow_with(follower.LineFollower(colors.high('green') / 2, **FOLLOWER),
+                  target=lambda: colors.high('green') / 2,
+                  lost=is_white, marks=[(is_grey, on_grey)])
+
+# Sweep for the green line (or a grey cross) when it is lost, starting where it was last
+# seen. If no match is found the motors are stopped and the next tick searches again
+robot.search_with(LineSearch(devices.move_steering, lambda snapshot: is_green(snapshot) or is_grey(snapshot),
+                             near=lambda snapshot: snapshot.color <= colors.high('green'),
+                             angles=SETTINGS['search_angles'], speed=OSCILLATION_SPEED,
+                             fast_speed=2 * OSCILLATION_SPEED, creep_speed=OSCILLATION_SPEED // 2))
+
+# Main part of the program, it starts with the calibration sweep
+startup.phase('setup')
+robot.run()
@@ -1,246 +1,287 @@
 #!/usr/bin/env python3
 
 # Must-have libraries
-from ev3dev2.motor import MoveSteering, OUTPUT_B, OUTPUT_C
-from ev3dev2.sensor.lego import ColorSensor, GyroSensor
-from ev3dev2.sensor import INPUT_2, INPUT_3, INPUT_4
-import time
-import csv
 import os
-import math
-
-# Declare a file instance and delete the file for new data tracking
-csv_file = "robot_path.csv"
-if os.path.exists(csv_file):
-    os.remove(csv_file)
-
-# Modules assignment
-move_steering = MoveSteering(OUTPUT_B, OUTPUT_C)
-gyro_sensor = GyroSensor(INPUT_2) # Specify input for movement and oscillation gyro
-gyro_sensor_tracker = GyroSensor(INPUT_4) # Specify input for position tracking gyro
-color_sensor = ColorSensor(INPUT_3) # Specify color sensor input for consistensy
-
-# Color threshholds
+import sys
+
+# Make the shared robotlib package in the repository root importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# Imported first, it times the startup phases with ROBOT_STARTUP set (see robotlib/startup.py)
+from robotlib import startup
+from robotlib import clock
+from robotlib.robot import Robot, Devices
+from robotlib.logger import BufferedLogger
+from robotlib.trajectory import TrajectoryLogger
+from robotlib.odometry import PoseEstimator
+from robotlib.telemetry import start_telemetry
+from robotlib.tasks import wait
+from robotlib.motion import turn_by, drive_distance, driven
+from robotlib.mission import Mission
+from robotlib import config, follower, pursuit, runs
+from robotlib.search import LineSearch
+from robotlib.calibration import ColorClasses
+startup.phase('imports')
+
+# Every run logs into a directory of its own under runs/ (see robotlib/runs.py), so
+# the logs of earlier runs are kept for python -m robotlib.runs to compare. The path is
+# written in the binary format of robotlib/trajectory.py, which needs no text formatting
+# on the brick; python -m robotlib.trajectory to-csv turns it into the old csv layout
+path_file = "robot_path.bin"
+path_logger = None
+
+# Raw encoder and gyro samples of every tick, they let myrobot_test/odometry.py
+# rebuild the path offline with different wheel and axle values
+raw_file = "robot_raw.csv"
+raw_logger = None
+
+# Live pose, color, state and loop period for python -m robotlib.telemetry receive,
+# only with ROBOT_TELEMETRY=<host>:<port> set (see robotlib/telemetry.py)
+telemetry = start_telemetry()
+last_tick = None
+
+# Modules assignment, built when the robot first uses them
+devices = Devices(move_steering=('MoveSteering', 'OUTPUT_B', 'OUTPUT_C'),
+                  gyro_sensor=('GyroSensor', 'INPUT_2'),         # Specify input for movement and oscillation gyro
+                  gyro_sensor_tracker=('GyroSensor', 'INPUT_4'), # Specify input for position tracking gyro
+                  color_sensor=('ColorSensor', 'INPUT_3'))       # Specify color sensor input for consistensy
+
+# Color threshholds (the defaults, they are calibrated at startup)
 GREEN_MAX = 20
-GREY_MIN = 30  
+GREY_MIN = 30
 GREY_MAX = 45
 WHITE_MIN = 55
 
-# Movement constants
-FORWARD_SPEED = 35
-TURN_GAIN = 1.0
-OSCILLATION_SPEED = 20
+# Usual reading of every surface with its default thresholds, green and white are
+# fitted at startup and follow the lighting (see robotlib/calibration.py)
+colors = ColorClasses([
+    ('green', 8, None, GREEN_MAX),
+    ('grey', 38, GREY_MIN, GREY_MAX),
+    ('white', 70, WHITE_MIN, None),
+], anchors=('green', 'white'))
+
+# Line follower (see robotlib/follower.py) and program settings, tune them per track
+# with ROBOT_CONFIG or python -m robotlib.tune (see myrobot/main.py for the meanings)
+SETTINGS = config.load(dict(follower.DEFAULTS,
+                            kp=2.0, kd=0.1, feed_forward=10.0, max_speed=70, min_speed=40,
+                            forward_speed=35, oscillation_speed=20, turn_speed=40,
+                            step_off_distance=8, clear_distance=20,
+                            search_angles=[30, 60, 90, 120, 150, 180],
+                            green_window=7, grey_votes=3, grey_window=5, white_window=12,
+                            mission=[['outbound', 'grey', 'returning', 'spin_around', 'clear_of_cross'],
+                                     ['returning', 'grey', 'done', 'finish', 'clear_of_cross']]))
+FOLLOWER = config.pick(SETTINGS, follower.DEFAULTS)
 
-# Global modifiables
-is_line_followed = True
-grey_lines_crossed = 0
-is_program_complete = False
+# Movement constants
+FORWARD_SPEED = SETTINGS['forward_speed']
+OSCILLATION_SPEED = SETTINGS['oscillation_speed']
+TURN_SPEED = SETTINGS['turn_speed']
+STEP_OFF_DISTANCE = SETTINGS['step_off_distance']
+CLEAR_DISTANCE = SETTINGS['clear_distance']
+
+# Color voting windows
+GREEN_WINDOW = SETTINGS['green_window']
+GREY_VOTES = SETTINGS['grey_votes']
+GREY_WINDOW = SETTINGS['grey_window']
+WHITE_WINDOW = SETTINGS['white_window']
+
+# Map mode: with ROBOT_REFERENCE naming the path log (robot_path.bin) of a completed
+# lap the robot drives along that path, steering ahead of the curves at a higher
+# speed, and the color sensor only corrects the drift (see robotlib/pursuit.py)
+REFERENCE = os.environ.get('ROBOT_REFERENCE')
+PURSUIT = dict(pursuit.DEFAULTS)
+CROSS_RADIUS = 15 # cm around the crosses of the reference lap grey counts as a cross
 
 # Coordinates tracking mechanics
-start = time.time()
+start = clock.now()
 last_log = 0
 LOG_INT = 0.1 #logging interval
 
-# Robot's physique
-WHEEL_D = 5.6 #standart diameter in cm for ev3 robot wheel
-WHEEL_C = WHEEL_D * math.pi
-AXLE = 12.0  #stantart distance between wheels in cm for ev3 robot
-
-# Position tracking variables
-x = 0.0
-y = 0.0
-heading = 0.0  # in radians
-lle = 0 # last left encoder
-lre = 0 # last right encoder
-
-# A buffer that serves as a sensor values tracker
-recent_values = []
-BUFFER_SIZE = 15
-
-# A method to create a new file
-def new_csv_file():
-
-    with open(csv_file, 'w', newline='') as file:
-        csv_writer = csv.writer(file)
-        csv_writer.writerow(['timestamp', 'x', 'y', 'state', 'color_value'])
-    log(0, 0, "program_start", get_color())
+# Position tracking from the wheel encoders and the tracking gyro, updated every tick
+# (the rows are only logged every LOG_INT)
+pose = PoseEstimator()
+
+# Note: most of the comments below were left out due to irrelecance for the second
+# lab. To get more understanding on line following functionality you may reffer to
+# the first lab under directory my_robot in the same github repository
+spans = (GREY_WINDOW, GREEN_WINDOW, WHITE_WINDOW)
+robot = Robot(devices, colors,
+              sources=dict(color=lambda: devices.color_sensor.reflected_light_intensity,
+                           gyro=lambda: devices.gyro_sensor.angle,
+                           tracker_angle=lambda: devices.gyro_sensor_tracker.angle,
+                           left_position=lambda: devices.move_steering.left_motor.position,
+                           right_position=lambda: devices.move_steering.right_motor.position),
+              size=max((15,) + spans), spans=spans)
+
+# A method to create new log files
+def new_path_file():
+    global path_logger, raw_logger
+
+    run_directory = runs.new_run()
+    # Rows are buffered in memory and written in batches by a background thread,
+    # so the control loop never waits for the SD card
+    path_logger = TrajectoryLogger(os.path.join(run_directory, path_file), start)
+    raw_logger = BufferedLogger(os.path.join(run_directory, raw_file),
+                                header=['time', 'left_position', 'right_position', 'gyro_angle'],
+                                format_row=format_raw_row, max_rows=20000, batch_rows=200)
+    # Queueing a row runs in the loop, writing the batches in the writer thread
+    profiler = robot.prepare()
+    path_logger.log = profiler.wrap('log.path', path_logger.log)
+    path_logger.flush = profiler.wrap('write.path', path_logger.flush)
+    raw_logger.log = profiler.wrap('log.raw', raw_logger.log)
+    raw_logger.flush = profiler.wrap('write.raw', raw_logger.flush)
+    # The first tick pushes the color of the start into the window, this read only logs it
+    log(0, 0, "program_start", robot.sampler.sample().color)
+
+def format_raw_row(entry):
+    now, left_position, right_position, gyro_angle = entry
+    return ["{:.3f}".format(now), left_position, right_position, gyro_angle]
 
 def log(x, y, state, color_value):
-    now = time.time() - start
-    # Next four lines log real time of the coordinates update
-    # The purpose of this is to simplify debugging when identifying flaws of the csv construction
-    hrs = int(now // 3600)         #hours
-    mins = int((now % 3600) // 60) #minutes
-    sec = now % 60                 #seconds
-    log_time = "{:02d}:{:02d}:{:06.3f}".format(hrs, mins, sec)
-
-    with open(csv_file, 'a', newline='') as file:
-        csv_writer = csv.writer(file)
-        csv_writer.writerow([log_time, "{:.2f}".format(x), "{:.2f}".format(y), state, int(color_value)])
-
-# Coordinates arithmetics via odometry
-def update():
-    global x, y, heading, lle, lre
+    # Only queue the entry, packing and writing happen in the background
+    path_logger.log((clock.now() - start, x, y, pose.heading, state, color_value))
+    if telemetry and state != "moving":
+        telemetry.send(clock.now() - start, x, y, pose.heading, state, color_value, 0.0)
 
-    # Getting physical position of motors
-    left_motor = move_steering.left_motor.position
-    right_motor = move_steering.right_motor.position
+def store(snapshot):
+    global last_log
 
-    # Calculate the distance each wheel travelled 
-    l_wheel_distance = (left_motor - lle) * WHEEL_C / 360
-    r_wheel_distance = (right_motor - lre) * WHEEL_C / 360
+    now = clock.now()
+    if now - last_log < LOG_INT:
+        return None
 
-    # Update encoder positions
-    lle = left_motor
-    lre = right_motor
+    last_log = now
+    return pose.x, pose.y
 
-    # Calculate forward movement and rotation
-    distance = (l_wheel_distance + r_wheel_distance) / 2
-    rotation = (r_wheel_distance - l_wheel_distance) / AXLE
+def is_green(snapshot):
+    return robot.steady('green', GREEN_WINDOW, snapshot)
 
-    # Update heading using gyro (more reliable than wheel encoders for rotation)
-    heading = gyro_sensor_tracker.angle * math.pi / 180
+def is_grey(snapshot):
+    return robot.mostly('grey', GREY_VOTES, GREY_WINDOW, snapshot)
 
-    # Update position
-    x += distance * math.sin(heading)
-    y += distance * math.cos(heading)
+def is_white(snapshot):
+    return robot.steady('white', WHITE_WINDOW, snapshot)
 
-    return x, y
+# The pose follows the encoders and the gyro on every tick
+def track_pose(snapshot):
+    pose.update(snapshot.left_position, snapshot.right_position, snapshot.tracker_angle, snapshot.time)
 
-def store():
-    global last_log
+# The raw samples of every tick
+def log_raw(snapshot):
+    raw_logger.log((snapshot.time - start, snapshot.left_position, snapshot.right_position,
+                    snapshot.tracker_angle))
 
-    now = time.time()
-    if now - last_log < LOG_INT:
-        return None
+# A frame of every tick for the live telemetry
+def send_telemetry(snapshot):
+    global last_tick
 
-    last_log = now
-    return update()
-
-# Note: Starting from line 124 most of the comments were left out due to irrelecance 
-# for the second lab. To get more understanding on line following functionality you
-# may reffer to the first lab under directory my_robot in the same github repository
-def get_color():
-    value = color_sensor.reflected_light_intensity
-    recent_values.append(value)
-    if len(recent_values) > BUFFER_SIZE:
-        recent_values.pop(0)
-    return value
-
-def is_green():
-    if len(recent_values) < BUFFER_SIZE:
-        return get_color() <= GREEN_MAX
-    return all(v <= GREEN_MAX for v in recent_values[-7:])
-
-def is_grey():
-    value = get_color()  
-    if GREY_MIN <= value <= GREY_MAX:
-        grey_count = sum(1 for v in recent_values[-5:] if GREY_MIN <= v <= GREY_MAX)
-        return grey_count >= 3
-    return False
-
-def is_white():
-    if len(recent_values) < BUFFER_SIZE:
-        return get_color() >= WHITE_MIN
-    return all(v >= WHITE_MIN for v in recent_values[-12:])
+    period = snapshot.time - last_tick if last_tick is not None else 0.0
+    last_tick = snapshot.time
+    state = "moving" if robot.following and not robot.scheduler.busy() else "maneuver"
+    telemetry.send(snapshot.time - start, pose.x, pose.y, pose.heading, state, snapshot.color, period)
 
 # It is important to note that the robot only stores the coordinates
 # while following the green line for better map picture
-def follow_green_line():
-    global is_line_followed, grey_lines_crossed, is_program_complete
-
-    sensor_value = get_color()
-    error = sensor_value - (GREEN_MAX / 2)
-
+def track_line(snapshot):
     # Indication of robot's position on the green line
-    coords = store()
+    coords = store(snapshot)
     if coords:
         x, y = coords
         # Update header info
-        log(x, y, "moving", sensor_value) 
-    
-    if is_white():
-        is_line_followed = False
-        return
-
-    # Indication of grey line detection
-    if is_grey():
-        coords = store()
-        if coords:
-            x, y = coords
-            # Update header info
-            log(x, y, "grey_detected", sensor_value)
-
-        grey_lines_crossed += 1
-
-        if grey_lines_crossed == 1:
-            gyro_sensor.reset()
-            move_steering.off()
-            time.sleep(0.3)
-
-            move_steering.on(steering=100, speed=20)
-            while gyro_sensor.angle < 345:
-                time.sleep(0.01)
-
-            move_steering.on(steering=0, speed=FORWARD_SPEED)
-            time.sleep(0.3)
-            move_steering.off()
-
-        elif grey_lines_crossed >= 2:
-            coords = store()
-            if coords:
-                x, y = coords
-
-                # Update header info to specify the end of the program
-                log(x, y, "program_end", sensor_value)
-            is_program_complete = True
-            move_steering.off()
-        return
-
-    steering = error * TURN_GAIN
-    steering = max(-80, min(80, steering))
-    move_steering.on(steering=steering, speed=FORWARD_SPEED)
-
-def oscillated_search():
-    global is_line_followed
-    angles = [30, 60, 90, 120, 150, 180]
-
-    for angle in angles:  
-        gyro_sensor.reset()   
-        move_steering.on(steering=-100, speed=OSCILLATION_SPEED)
-        while gyro_sensor.angle > -angle:
-            if is_green() or is_grey():
-                is_line_followed = True
-                return
-            time.sleep(0.01)
-        move_steering.off()
-
-        gyro_sensor.reset()
-        move_steering.on(steering=100, speed=OSCILLATION_SPEED)
-        while gyro_sensor.angle < angle * 2:
-            if is_green() or is_grey():
-                is_line_followed = True
-                return
-            time.sleep(0.01)
-        move_steering.off()
-
-        gyro_sensor.reset()
-        move_steering.on(steering=-100, speed=OSCILLATION_SPEED)
-        while gyro_sensor.angle > -angle:
-            time.sleep(0.01)
-        move_steering.off()
+        log(x, y, "moving", snapshot.color)
 
-    move_steering.off()
+# The position keeps being integrated while a maneuver runs, the rows are
+# marked so they can be told apart from the line following ones
+def track_maneuver(snapshot):
+    coords = store(snapshot)
+    if coords:
+        x, y = coords
+        log(x, y, "maneuver", snapshot.color)
+
+# Grey line detection, the mission decides if it is a cross
+def on_grey(snapshot):
+    mission.fire('grey', snapshot)
 
-# create a new CSV and start the program
-new_csv_file()
+# Indication of a grey cross, logged when the mission takes the grey for one. Markers
+# are logged whenever they happen, not only every LOG_INT, the track maps place the
+# grey crosses by them (see robotlib/trackmap.py)
+def log_cross(time, state, event, target):
+    if event == 'grey':
+        log(pose.x, pose.y, "grey_detected", robot.sampler.snapshot.color)
 
-# Main part of the program
-while not is_program_complete: 
-    if is_line_followed:
-        follow_green_line()
-    else:
-        oscillated_search()
-    time.sleep(0.01)
+# Update header info to specify the end of the program
+def finish(snapshot):
+    log(pose.x, pose.y, "program_end", snapshot.color)
+    robot.finish()
 
-move_steering.off()
\ No newline at end of file
+# Where the robot started or the last 360 ended, in cm driven
+spun_at = 0.0
+
+def spin_around(snapshot):
+    global spun_at
+
+    move_steering = devices.move_steering
+    move_steering.off()
+    yield from wait(0.3)
+
+    snapshot = yield from turn_by(move_steering, 360, speed=TURN_SPEED)
+
+    snapshot = yield from drive_distance(move_steering, STEP_OFF_DISTANCE, speed=FORWARD_SPEED,
+                                         heading=snapshot.gyro)
+    spun_at = driven(snapshot)
+
+# Grey only counts as a cross away from the start and the cross of the 360
+# (see myrobot/main.py)
+def clear_of_cross(snapshot):
+    return driven(snapshot) - spun_at >= CLEAR_DISTANCE
+
+# What happens at the grey crosses (see SETTINGS and myrobot/main.py)
+mission = Mission(SETTINGS['mission'], actions=dict(spin_around=spin_around, finish=finish),
+                  guards=dict(clear_of_cross=clear_of_cross), scheduler=robot.scheduler)
+mission.on_transition.append(log_cross)
+
+robot.checks.append(log_raw)
+robot.checks.append(track_pose)
+robot.checks.append(mission.tick)
+if telemetry:
+    robot.checks.append(send_telemetry)
+robot.on_maneuver.append(track_maneuver)
+robot.on_follow.append(track_line)
+
+# Steers along the edge of the green line, brighter readings steer right
+line_follower = follower.LineFollower(colors.high('green') / 2, **FOLLOWER)
+reference = None
+if REFERENCE:
+    reference = pursuit.ReferencePath.load(REFERENCE)
+    line_follower = pursuit.PathFollower(reference, pose, line_follower, **PURSUIT)
+
+# The edge of the line reads grey too when the robot drifts off it at speed, in the
+# map mode only grey where the reference lap found a cross counts
+def is_cross(snapshot):
+    if reference is None:
+        return is_grey(snapshot)
+    return is_grey(snapshot) and reference.near('grey_detected', pose.x, pose.y, CROSS_RADIUS)
+
+robot.follow_with(line_follower,
+                  target=lambda: colors.high('green') / 2,
+                  lost=is_white, marks=[(is_cross, on_grey)])
+
+# Sweeps for the green line (or a grey cross) when it is lost, starting where it was last seen
+robot.search_with(LineSearch(devices.move_steering, lambda snapshot: is_green(snapshot) or is_grey(snapshot),
+                             near=lambda snapshot: snapshot.color <= colors.high('green'),
+                             angles=SETTINGS['search_angles'], speed=OSCILLATION_SPEED,
+                             fast_speed=2 * OSCILLATION_SPEED, creep_speed=OSCILLATION_SPEED // 2))
+
+# create new log files and start the program
+startup.phase('setup')
+new_path_file()
+startup.phase('logs')
+
+# Main part of the program, it starts with the calibration sweep
+try:
+    robot.run()
+finally:
+    # Write out the buffered rows even if the program crashed (run() stops the motors)
+    path_logger.close()
+    raw_logger.close()
+    if telemetry:
+        telemetry.close()
@@ -1,200 +1,204 @@
 #!/usr/bin/env python3
 
-from ev3dev2.motor import MoveSteering, OUTPUT_B, OUTPUT_C
-from ev3dev2.sensor.lego import ColorSensor, GyroSensor, UltrasonicSensor
-from ev3dev2.sound import Sound
-import time
-
-# Modules assignment
-move_steering = MoveSteering(OUTPUT_B, OUTPUT_C)
-color_sensor = ColorSensor()
-gyro_sensor = GyroSensor()
-ultrasonic_sensor = UltrasonicSensor()
-sound = Sound()
-
-# Color thresholds
+import os
+import sys
+
+# Make the shared robotlib package in the repository root importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# Imported first, it times the startup phases with ROBOT_STARTUP set (see robotlib/startup.py)
+from robotlib import startup
+from robotlib import clock
+from robotlib.robot import Robot, Devices
+from robotlib.trajectory import TrajectoryLogger
+from robotlib.odometry import PoseEstimator
+from robotlib.tasks import until
+from robotlib.motion import turn_by, drive_distance
+from robotlib.obstacles import ObstacleCheck
+from robotlib.mission import Mission
+from robotlib.ultrasonic import DistanceMonitor
+from robotlib import config, follower, runs
+from robotlib.search import LineSearch
+from robotlib.calibration import ColorClasses
+startup.phase('imports')
+
+# Every run logs its path into a directory of its own under runs/ in the binary format
+# of robotlib/trajectory.py (see myrobot_2/main.py). The obstacles the mission takes
+# are marked in it, the track maps place the boxes and the wall by them
+# (see robotlib/trackmap.py)
+path_file = "robot_path.bin"
+path_logger = None
+
+# Modules assignment, built when the robot first uses them
+devices = Devices(move_steering=('MoveSteering', 'OUTPUT_B', 'OUTPUT_C'),
+                  color_sensor=('ColorSensor',),
+                  gyro_sensor=('GyroSensor',),
+                  ultrasonic_sensor=('UltrasonicSensor',),
+                  sound=('Sound',))
+
+# Color thresholds (the defaults, they are calibrated at startup)
 BLACK_MAX = 15
 WHITE_MIN = 50
 
+# The surfaces with their usual reading and the thresholds above, fitted to the readings
+# of a sweep over the line at startup and following the lighting while driving
+# (see robotlib/calibration.py)
+colors = ColorClasses([
+    ('black', 11, None, BLACK_MAX),
+    ('white', 90, WHITE_MIN, None),
+])
+
+# Line follower (see robotlib/follower.py) and program settings, tune them per track
+# with ROBOT_CONFIG or python -m robotlib.tune (see myrobot/main.py for the meanings)
+#
+# box_skip_distance - cm to drive sideways past a box
+# wall_distance     - cm to an obstacle that is the wall
+# box_distance      - cm to an obstacle that is a box
+# mission           - what the robot does at the obstacles, rows of (state, event, next
+#                     state, action) of robotlib/mission.py. The wall only counts after
+#                     the first box: the robot turns away from it instead of driving into
+#                     the dead end near the end and coming back. Every box is gone around
+SETTINGS = config.load(dict(follower.DEFAULTS,
+                            kp=0.2, kd=0.01, max_speed=60, min_speed=40, slow_down=20.0,
+                            forward_speed=40, oscillation_speed=25, turn_speed=50,
+                            search_angles=[10, 30, 90, 120], box_skip_distance=20,
+                            wall_distance=30, box_distance=4,
+                            mission=[['before_box', 'box', 'after_box', 'box_skip'],
+                                     ['after_box', 'wall', 'after_box', 'wall_turn'],
+                                     ['after_box', 'box', 'past_boxes', 'box_skip'],
+                                     ['past_boxes', 'box', 'past_boxes', 'box_skip']]))
+FOLLOWER = config.pick(SETTINGS, follower.DEFAULTS)
+
 # Movement constants
-FORWARD_SPEED = 40
-TURN_GAIN = 0.1
-OSCILLATION_SPEED = 25
-
-# Global modifiables
-is_line_followed = True
-is_program_complete = False
-obstacle_count = 0
-is_obstacle_detected = False
-
-# A buffer that serves as a sensor values tracker.Pretty much the most refundant consept of the
-# program in its current state. It is, however, reasonably utilized in the first lab under my_robot
-# directory in the same github repository, from which it was taken and decided to be kept in case of
-# new changes
-recent_values = []
-BUFFER_SIZE = 15
-
-# A method to retrieve ultrasonic distance in cm
-def uv_distance():
-    return ultrasonic_sensor.distance_centimeters
-
-# A method to go around obstacle from the right
-def box_skip():
-    # Turn 90 degrees to the right
-    gyro_sensor.reset()
-    move_steering.on(steering=100, speed=OSCILLATION_SPEED)
-    while gyro_sensor.angle < 85:
-        time.sleep(0.01)
-    move_steering.off()
-    time.sleep(0.5)
-    
-    # Go forward for a second
-    move_steering.on(steering=0, speed=FORWARD_SPEED)
-    time.sleep(1)
-    move_steering.off()
-    time.sleep(0.5)
-    
-    # Turn 90 degrees to the left
-    gyro_sensor.reset()
-    move_steering.on(steering=-100, speed=OSCILLATION_SPEED)
-    while gyro_sensor.angle > -85:
-        time.sleep(0.01)
+FORWARD_SPEED = SETTINGS['forward_speed']
+OSCILLATION_SPEED = SETTINGS['oscillation_speed']
+TURN_SPEED = SETTINGS['turn_speed']               # top speed of the turns on the spot (see robotlib/motion.py)
+BOX_SKIP_DISTANCE = SETTINGS['box_skip_distance'] # cm to drive sideways past a box
+
+# The ultrasonic sensor is the slowest read, it is read in the background every 30 ms
+# and the median of the last 3 readings drops stray echoes (see robotlib/ultrasonic.py)
+distance_monitor = DistanceMonitor(lambda: devices.ultrasonic_sensor.distance_centimeters,
+                                   period=0.03, size=3)
+
+# Sample the sensors once per control tick, the distance is the monitor's latest value.
+# The window of color values is not used by the checks below, it is kept from the
+# first lab in case of new changes
+robot = Robot(devices, colors,
+              sources=dict(color=lambda: devices.color_sensor.reflected_light_intensity,
+                           gyro=lambda: devices.gyro_sensor.angle,
+                           distance=distance_monitor.value,
+                           left_position=lambda: devices.move_steering.left_motor.position,
+                           right_position=lambda: devices.move_steering.right_motor.position),
+              size=15, spans=(15,))
+
+# Position tracking from the wheel encoders and the gyro, updated every tick (the
+# rows are only logged every LOG_INT while following the line)
+start = clock.now()
+last_log = 0
+LOG_INT = 0.1
+pose = PoseEstimator()
+
+# A method to create the log file of the run
+def new_path_file():
+    global path_logger
+
+    path_logger = TrajectoryLogger(os.path.join(runs.new_run(), path_file), start)
+    profiler = robot.prepare()
+    path_logger.log = profiler.wrap('log.path', path_logger.log)
+    path_logger.flush = profiler.wrap('write.path', path_logger.flush)
+    log("program_start", robot.sampler.sample().color)
+
+def log(state, color_value):
+    path_logger.log((clock.now() - start, pose.x, pose.y, pose.heading, state, color_value))
+
+# The pose follows the encoders and the gyro on every tick
+def track_pose(snapshot):
+    pose.update(snapshot.left_position, snapshot.right_position, snapshot.gyro, snapshot.time)
+
+# The path while following the line
+def track_line(snapshot):
+    global last_log
+
+    if snapshot.time - last_log >= LOG_INT:
+        last_log = snapshot.time
+        log("moving", snapshot.color)
+
+# Indication of an obstacle, logged when the mission takes a box or the wall
+def log_obstacle(time, state, event, target):
+    if event in ('box', 'wall'):
+        log("obstacle", robot.sampler.snapshot.color)
+
+# The middle between black and white, the edge of the line the robot follows
+def line_edge():
+    return (colors.centers['black'] + colors.centers['white']) / 2
+
+# Check a sensor reading for black
+def is_black(snapshot):
+    return snapshot.color <= colors.high('black')
+
+# Check a sensor reading for white
+def is_white(snapshot):
+    return snapshot.color >= colors.low('white')
+
+# A task to go around a box from the right
+def box_skip(snapshot):
+    move_steering = devices.move_steering
+
+    # Stop and signal the box
     move_steering.off()
-    time.sleep(0.5)
+    devices.sound.beep()
+
+    # Turn 90 degrees to the right, go forward past the box and turn back
+    snapshot = yield from turn_by(move_steering, 90, speed=TURN_SPEED)
+    yield from drive_distance(move_steering, BOX_SKIP_DISTANCE, speed=FORWARD_SPEED, heading=snapshot.gyro)
+    yield from turn_by(move_steering, -90, speed=TURN_SPEED)
 
     # Smoothly go around the box and continue following the line
     # as soon as it is found
     move_steering.on(steering=-10, speed=FORWARD_SPEED)
-    while not is_black():
-        time.sleep(0.01)
+    yield from until(is_black)
     move_steering.off()
-    return
-    
-# A method to handle obstacles
-def check_obstacles():
-    global is_obstacle_detected, obstacle_count
-    
-    distance = uv_distance()
-    
-    # An obstacle on 30 cm distance from the uv sensor is the wall
-    # The robot does a 90 degree clockwise turn after detection
-    # This is done to handle dead end near the end in order not 
-    # to waste time on reaching it and coming back
-    if distance <= 30 and obstacle_count == 1: #only detect objects on distance<30cm
-                                               #if detected obstacle is not the first 
-        move_steering.off()
-        gyro_sensor.reset()
-        move_steering.on(steering=100, speed=25)
-        while gyro_sensor.angle < 90:
-            time.sleep(0.01)
-
-    # If an obstacle is the first detected obstacle and the distance is no more than 4cm
-    # it is a removable box 
-    elif distance <= 4:
-        move_steering.off()
-        sound.beep()
-        obstacle_count += 1 #increment the number of obstacles
-        box_skip() #skip the box by going around it
-
-    return
-
-# Get the color value and update the buffer
-def get_color():
-    value = color_sensor.reflected_light_intensity
-    recent_values.append(value) #add the most recent value to the array
-    if len(recent_values) > BUFFER_SIZE:
-        recent_values.pop(0) #pop the old value if the number of last readings exceeds 15
-    return value
-
-# Check a sensor reading for black
-def is_black():
-    return get_color() <= BLACK_MAX
-
-# Check a sensor reading for white
-def is_white():
-    return get_color() >= WHITE_MIN
-
-# A method to make robot follow a black line
-def follow_black_line():
-    # Accessing globals
-    global is_line_followed, is_program_complete
-
-    # Check for the uv sensor
-    distance = uv_distance()
-    if distance <= 30:
-        check_obstacles()
-
-    # Calculate error
-    sensor_value = get_color()
-    error = sensor_value - ((11 + 90)/2)
-
-    # If a sensor reading shows white stop following
-    if is_white():
-        is_line_followed = False
-        return
-
-    # Adjust steering motion accroding to error for smooth following
-    steering = -error * TURN_GAIN
-    steering = max(-80, min(80, steering))
-    move_steering.on(steering=steering, speed=FORWARD_SPEED)
-
-# A method to make a robot search for the black line
-def oscillated_search():
-    # Accessing globals
-    global is_line_followed, is_program_complete
-
-    # Check for obstacles
-    check_obstacles()
-
-    # A range of angles to use while search 
-    angles = [10, 30, 90, 120]
-    
-    # Repeat oscillated search move for each angle in the range until black is found
-    for angle in angles:  
-        # Reset gyro value to zero before starting the counter-clockwise oscillation cycle with a new angle
-        gyro_sensor.reset()   
-        move_steering.on(steering=-100, speed=OSCILLATION_SPEED)
-
-        while gyro_sensor.angle > -angle:
-            # While rotating constantly check a color sensor value for a black line and
-            # uv sensor for obstacles
-            check_obstacles()
-            if is_black():
-                is_line_followed = True # Switch back to line following mode if a color match was found
-                return
-            time.sleep(0.01)
-        move_steering.off()
-        
-        # Reset gyro value to zero before proceeding with the clockwise oscillation cycle
-        gyro_sensor.reset()
-        move_steering.on(steering=100, speed=OSCILLATION_SPEED)
-        
-        while gyro_sensor.angle < angle * 2: #the angle is doubled for completion of the whole rotation 
-            check_obstacles()
-            if is_black():
-                is_line_followed = True
-                return
-            time.sleep(0.01)
-        move_steering.off()
-        
-        # Reset gyro as usual and get back to starting position if no match was found
-        gyro_sensor.reset()
-        move_steering.on(steering=-100, speed=OSCILLATION_SPEED)
-        while gyro_sensor.angle > -angle:
-            check_obstacles()
-            time.sleep(0.01)
-        move_steering.off()
-    
-    # If no match found at all for the specified mark the program as complete
-    is_program_complete = True
-
-# Main part of the program
-while not is_program_complete: 
-    if is_line_followed:    # Keep following the black line until lost
-        follow_black_line()
-    else:                   # Otherwise search for black line
-        oscillated_search()
-    time.sleep(0.01)
-
-# Stop movement when the program is complete
-move_steering.off()
\ No newline at end of file
+    robot.following = True
+
+# A task to turn away from the wall
+def wall_turn(snapshot):
+    yield from turn_by(devices.move_steering, 90, speed=TURN_SPEED)
+
+# The uv sensor is checked on every tick, even in the middle of a search. An obstacle
+# within wall_distance may be the wall, one within box_distance a removable box, the
+# mission decides which one it is by the boxes met so far. While a maneuver runs
+# no other obstacle counts
+mission = Mission(SETTINGS['mission'], actions=dict(box_skip=box_skip, wall_turn=wall_turn),
+                  scheduler=robot.scheduler)
+mission.on_transition.append(log_obstacle)
+robot.checks.append(track_pose)
+robot.checks.append(mission.tick)
+robot.checks.append(ObstacleCheck(mission, [
+    (SETTINGS['wall_distance'], 'wall'),
+    (SETTINGS['box_distance'], 'box'),
+]))
+
+robot.on_follow.append(track_line)
+
+# Steer along the edge between black and white, darker readings steer right,
+# and stop following when a sensor reading shows white
+robot.follow_with(follower.LineFollower(line_edge(), direction=-1, **FOLLOWER),
+                  target=line_edge, lost=is_white)
+
+# Sweep for the black line when it is lost, starting where it was last seen. If no
+# match is found at all the program is complete
+robot.search_with(LineSearch(devices.move_steering, is_black, angles=SETTINGS['search_angles'],
+                             speed=OSCILLATION_SPEED, fast_speed=2 * OSCILLATION_SPEED, margin=10),
+                  give_up=True)
+
+# Main part of the program, it starts with the calibration sweep
+startup.phase('setup')
+new_path_file()
+startup.phase('logs')
+distance_monitor.start()
+try:
+    robot.run()
+    log("program_end", robot.sampler.snapshot.color)
+finally:
+    distance_monitor.stop()
+    # Write out the buffered rows even if the program crashed
+    path_logger.close()
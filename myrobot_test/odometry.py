@@ -0,0 +1,94 @@
+# Offline odometry for the second lab
+#
+# myrobot_2 logs the raw wheel encoder positions and the tracking gyro angle of
+# every control tick to robot_raw.csv. This module rebuilds the whole path from
+# those samples in one vectorized pass, so a wrong wheel diameter or axle length
+# guess can be fixed after the run instead of by driving the track again.
+#
+#   python odometry.py robot_raw.csv --wheel 5.6 --axle 12 --gyro-weight 0.8 --out path.csv
+import argparse
+import time
+
+import numpy as np
+
+# Robot's physique as assumed on the brick
+WHEEL_D = 5.6
+AXLE = 12.0
+
+
+# A method to read a raw log into arrays keyed by column name
+def load_raw(path):
+    with open(path) as file:
+        headers = file.readline().strip().split(',')
+    data = np.loadtxt(path, delimiter=',', skiprows=1, ndmin=2)
+    return dict((name, data[:, index]) for index, name in enumerate(headers))
+
+
+# A method to rebuild the path from raw samples
+#
+# wheel_diameter, axle and gyro_weight may be scalars or equally shaped arrays, in
+# which case one path per parameter set is built at once (arrays of shape
+# parameters x samples). gyro_weight blends the heading change per sample between
+# the gyro (1.0, what the robot does) and the encoder differential (0.0).
+def reconstruct(raw, wheel_diameter=WHEEL_D, axle=AXLE, gyro_weight=1.0):
+    wheel_diameter = _column(wheel_diameter)
+    axle = _column(axle)
+    gyro_weight = _column(gyro_weight)
+
+    # Distance travelled by each wheel between two samples
+    cm_per_degree = np.pi * wheel_diameter / 360
+    left = np.diff(raw['left_position'], prepend=raw['left_position'][0]) * cm_per_degree
+    right = np.diff(raw['right_position'], prepend=raw['right_position'][0]) * cm_per_degree
+
+    # Heading change per sample (clockwise, radians) from both sources
+    distance = (left + right) / 2
+    encoder_turn = (left - right) / axle
+    gyro_turn = np.radians(np.diff(raw['gyro_angle'], prepend=raw['gyro_angle'][0]))
+    turn = gyro_weight * gyro_turn + (1 - gyro_weight) * encoder_turn
+
+    heading = np.radians(raw['gyro_angle'][0]) + np.cumsum(turn, axis=-1)
+    # Move along the average heading of each step instead of the heading at its end
+    middle = heading - turn / 2
+    x = np.cumsum(distance * np.sin(middle), axis=-1)
+    y = np.cumsum(distance * np.cos(middle), axis=-1)
+    return {'time': raw['time'], 'x': x, 'y': y, 'heading': heading}
+
+
+# Parameter arrays become columns so they broadcast against the samples
+def _column(value):
+    value = np.asarray(value, dtype=float)
+    return value if value.ndim == 0 else value[:, None]
+
+
+# A method to rebuild the path for every combination of the given parameter values,
+# returns the parameter grid and the paths in the same order
+def sweep(raw, wheel_diameters, axles, gyro_weights=(1.0,)):
+    grid = np.array(np.meshgrid(wheel_diameters, axles, gyro_weights, indexing='ij')).reshape(3, -1)
+    return grid.T, reconstruct(raw, grid[0], grid[1], grid[2])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the robot path from raw encoder and gyro samples")
+    parser.add_argument('raw', nargs='?', default='robot_raw.csv')
+    parser.add_argument('--wheel', type=float, default=WHEEL_D, help="wheel diameter in cm")
+    parser.add_argument('--axle', type=float, default=AXLE, help="distance between the wheels in cm")
+    parser.add_argument('--gyro-weight', type=float, default=1.0,
+                        help="share of the heading taken from the gyro, the rest comes from the encoders")
+    parser.add_argument('--out', help="write the rebuilt path (time, x, y, heading) to this csv file")
+    args = parser.parse_args(argv)
+
+    raw = load_raw(args.raw)
+    started = time.time()
+    path = reconstruct(raw, args.wheel, args.axle, args.gyro_weight)
+    elapsed = time.time() - started
+
+    print("{} samples rebuilt in {:.1f} ms, end position ({:.2f}, {:.2f})".format(
+        len(path['time']), elapsed * 1000, path['x'][-1], path['y'][-1]))
+
+    if args.out:
+        np.savetxt(args.out, np.column_stack([path['time'], path['x'], path['y'], path['heading']]),
+                   delimiter=',', fmt='%.4f', header='time,x,y,heading', comments='')
+
+
+if __name__ == '__main__':
+    main()
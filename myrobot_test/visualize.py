@@ -1,37 +1,176 @@
 # Must-have libraries
 import matplotlib.pyplot as plot
-import csv
+import numpy as np
+import argparse
+import itertools
 import os
+import sys
 
-# Declare x and y axis as an array
-x_axis = []
-y_axis = []
-
-# Access csv file
-with open('robot_path.csv', 'r') as file:
-    csv_reader = csv.reader(file)
-    headers = next(csv_reader)  # the first row represents all the headers
-
-    # Find headers corresponding to x and y coordinates
-    x = headers.index('x') if 'x' in headers else 1  # if a header x was not found pick second column as x coordinates
-    y = headers.index('y') if 'y' in headers else 2  # same for a header y but pick 3rd column
-
-    # Store each row in the corresponding array
-    for row in csv_reader:
-        x_axis.append(float(row[x]))
-        y_axis.append(float(row[y]))
-
-# Plot the coordinates
-plot.figure(figsize=(10, 10))
-plot.plot(x_axis, y_axis, 'b-', linewidth=2, label="Robot's path")
-plot.plot(x_axis[0], y_axis[0], 'ro', markersize=8, label='Start')
-plot.plot(x_axis[-1], y_axis[-1], 'go', markersize=8, label='End')
-
-# Plot the grid
-plot.xlabel('X-Axis')
-plot.ylabel('Y-Axis')
-plot.title("Robot's path")
-plot.grid(True, alpha=0.3)
-plot.axis('equal')
-plot.legend()
-plot.show()
\ No newline at end of file
+# Make the shared robotlib package in the repository root importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from robotlib.trajectory import MAGIC, open_trajectory
+
+# Rows are read and decimated this many at a time, so even multi-hour logs
+# never have to fit into memory as a whole
+CHUNK_ROWS = 100000
+
+# Roughly how many points of the path get plotted
+MAX_POINTS = 20000
+
+# Logs plotted when no file is given, the first one found in the current directory:
+# the binary log of a run directory (runs/<id>/robot_path.bin) or the csv one shipped here
+DEFAULT_FILES = ('robot_path.bin', 'robot_path.csv')
+
+# States that are ordinary path samples, every other state is drawn as an event marker
+PATH_STATES = ('moving', 'maneuver')
+
+# Columns of the csv written by myrobot_2 (timestamp, x, y, state, color_value)
+ROW_TYPE = np.dtype([('x', 'f8'), ('y', 'f8'), ('state', 'U32')])
+
+
+# A method to check whether the first line of the file is a header
+def has_header(line):
+    try:
+        float(line.split(',')[1])
+        return False
+    except (IndexError, ValueError):
+        return True
+
+
+# A method to check whether a log is in the binary trajectory format
+def is_binary(path):
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+# A method to read a log in chunks of x, y and state arrays
+def read_chunks(path, chunk_rows=CHUNK_ROWS):
+    if is_binary(path):
+        # Binary logs are memory mapped, a chunk is just a view into the file
+        records, states, _ = open_trajectory(path)
+        names = np.array(states)
+        for start in range(0, len(records), chunk_rows):
+            chunk = records[start:start + chunk_rows]
+            yield chunk['x'], chunk['y'], names[chunk['state']]
+        return
+
+    with open(path, 'r') as file:
+        first = file.readline()
+        # The shipped logs have no header, newer ones do
+        columns = (1, 2, 3)
+        if has_header(first):
+            headers = first.strip().split(',')
+            # If a header x was not found pick second column as x coordinates, same for y (3rd column)
+            columns = (headers.index('x') if 'x' in headers else 1,
+                       headers.index('y') if 'y' in headers else 2,
+                       headers.index('state') if 'state' in headers else 3)
+            lines = file
+        else:
+            lines = itertools.chain([first], file)
+
+        while True:
+            chunk = list(itertools.islice(lines, chunk_rows))
+            if not chunk:
+                return
+            # Fast path, numpy parses the whole chunk at once
+            rows = np.loadtxt(chunk, delimiter=',', usecols=columns, dtype=ROW_TYPE, ndmin=1)
+            yield rows['x'], rows['y'], rows['state']
+
+
+# A method to thin out a path while keeping its shape: for every bucket of points
+# only the ones with the smallest and largest x and y are kept (in their original order)
+def decimate(x, y, bucket):
+    if bucket <= 1 or len(x) <= 4:
+        return x, y
+
+    count = len(x) // bucket * bucket
+    index = np.arange(count).reshape(-1, bucket)
+    keep = [index[:, 0], index[:, -1]]
+    for values in (x[:count].reshape(-1, bucket), y[:count].reshape(-1, bucket)):
+        keep.append(index[np.arange(len(index)), values.argmin(axis=1)])
+        keep.append(index[np.arange(len(index)), values.argmax(axis=1)])
+    keep = np.unique(np.concatenate(keep + [np.arange(count, len(x))]))
+    return x[keep], y[keep]
+
+
+# A method to load the decimated path and the event markers of a log
+def load_path(path, max_points=MAX_POINTS, chunk_rows=CHUNK_ROWS):
+    x_parts = []
+    y_parts = []
+    events = {}
+    first = last = None
+
+    # Every bucket keeps up to 6 points
+    bucket = max(1, int(count_rows(path) * 6 / max_points))
+
+    for x, y, states in read_chunks(path, chunk_rows):
+        if first is None:
+            first = (x[0], y[0])
+        last = (x[-1], y[-1])
+
+        marked = ~np.isin(states, PATH_STATES)
+        for state in np.unique(states[marked]):
+            event = states == state
+            events.setdefault(state, []).append(np.column_stack([x[event], y[event]]))
+
+        x, y = decimate(x, y, bucket)
+        x_parts.append(x)
+        y_parts.append(y)
+
+    if first is None:
+        raise ValueError("{} has no rows".format(path))
+    events = dict((state, np.concatenate(points)) for state, points in events.items())
+    return np.concatenate(x_parts), np.concatenate(y_parts), first, last, events
+
+
+# Number of rows of a log, estimated from the first lines for csv files
+def count_rows(path, sample_rows=1000):
+    if is_binary(path):
+        return len(open_trajectory(path)[0])
+
+    with open(path, 'rb') as file:
+        lines = list(itertools.islice(file, sample_rows))
+    if not lines:
+        return 0
+    return int(os.path.getsize(path) * len(lines) / float(sum(len(line) for line in lines)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plot the path logged by the robot")
+    parser.add_argument('file', nargs='?',
+                        help="binary (robot_path.bin) or csv (robot_path.csv) path log, "
+                             "whichever of the two is here by default")
+    parser.add_argument('--max-points', type=int, default=MAX_POINTS, help="rough number of plotted path points")
+    args = parser.parse_args(argv)
+    if args.file is None:
+        found = [path for path in DEFAULT_FILES if os.path.exists(path)]
+        if not found:
+            parser.error("no path log given and none of {} here".format(", ".join(DEFAULT_FILES)))
+        args.file = found[0]
+
+    x_axis, y_axis, first, last, events = load_path(args.file, args.max_points)
+
+    # Plot the coordinates
+    plot.figure(figsize=(10, 10))
+    plot.plot(x_axis, y_axis, 'b-', linewidth=2, label="Robot's path")
+    plot.plot(first[0], first[1], 'ro', markersize=8, label='Start')
+    plot.plot(last[0], last[1], 'go', markersize=8, label='End')
+
+    # Mark the logged events (grey crosses, program end...)
+    markers = itertools.cycle(['s', '^', 'D', 'v', 'P', 'X'])
+    for state in sorted(events):
+        points = events[state]
+        plot.plot(points[:, 0], points[:, 1], linestyle='none', marker=next(markers), markersize=9, label=state)
+
+    # Plot the grid
+    plot.xlabel('X-Axis')
+    plot.ylabel('Y-Axis')
+    plot.title("Robot's path")
+    plot.grid(True, alpha=0.3)
+    plot.axis('equal')
+    plot.legend()
+    plot.show()
+
+
+if __name__ == '__main__':
+    main()
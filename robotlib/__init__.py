@@ -0,0 +1,2 @@
+# Shared code for the lab robots (myrobot, myrobot_2 and myrobot_3).
+# Modules are kept import-light on purpose because they are loaded on the EV3 brick.
@@ -0,0 +1,294 @@
+# Benchmarks of the control code
+#
+#   python -m robotlib.bench --json bench.json
+#   python -m robotlib.bench compare old.json bench.json
+#
+# For every lab program the benchmark
+#
+#   - records a sensor trace of one simulated lap (fixed seed and noise, or reuses
+#     the one kept in --traces) and replays it through the program: the sensors and
+#     motors are the simulated ones and the sensor values come from the trace, so
+#     the time measured is the time of the program's own code (sampling, the color
+#     window, the follower, odometry, logging). This gives the ticks per second,
+#     the p50/p99 tick latency and the ticks that took longer than the control period
+#   - replays the trace once more under tracemalloc for the memory a tick allocates
+#     and the memory that stays allocated tick after tick, with the lines it is
+#     allocated at
+#   - drives a few simulated laps end to end for the lap time
+#
+# The results are written as json, compare prints two of them side by side and fails
+# when a metric got worse by more than the threshold, e.g. between two commits.
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ['ROBOT_BACKEND'] = 'sim'
+# The benchmarked programs must not profile themselves
+os.environ.pop('ROBOT_PROFILE', None)
+
+from robotlib import profiling
+from robotlib.replay import ReplayWorld, TraceEnd, load_trace, run_program
+from robotlib.sim import run as sim_run
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROGRAMS = ['myrobot/main.py', 'myrobot_2/main.py', 'myrobot_3/main.py']
+PERIOD = 0.01 # control period of the lab programs in seconds
+
+# Metrics compared between two results, True where a higher value is better
+METRICS = [
+    ('ticks_per_second', True),
+    ('tick_p50', False),
+    ('tick_p99', False),
+    ('tick_bytes_p50', False),
+    ('tick_bytes_p99', False),
+    ('retained_bytes_per_tick', False),
+    ('lap_time', False),
+]
+
+
+# Replays a trace while measuring every tick: the time from the end of one sleep to
+# the start of the next, and with memory set the memory allocated meanwhile (about
+# 60 bytes of which are the scheduler's and the benchmark's own). The replay does not
+# wait between the ticks, so the scheduler's own overrun counts mean nothing here:
+# a tick overruns when it takes longer than the control period on this machine
+class BenchWorld(ReplayWorld):
+    def __init__(self, names, rows, memory=False, period=PERIOD):
+        ReplayWorld.__init__(self, names, rows)
+        self.memory = memory
+        self.period = period
+        self.latency = profiling.Histogram()
+        self.overruns = 0
+        self.max_lateness = 0.0
+        self.tick_bytes = []   # highest traced memory of every tick above its start
+        self.first = None      # tracemalloc snapshots after the first and the last tick
+        self.last = None
+        self._woke = None
+        self._base = 0
+
+    def sleep(self, seconds):
+        now = time.perf_counter()
+        if self._woke is not None:
+            self.latency.add(now - self._woke)
+            if now - self._woke > self.period:
+                self.overruns += 1
+                self.max_lateness = max(self.max_lateness, now - self._woke - self.period)
+            if self.memory:
+                self.tick_bytes.append(tracemalloc.get_traced_memory()[1] - self._base)
+                if self.first is None:
+                    self.first = tracemalloc.take_snapshot()
+                elif self.index + 1 >= len(self.rows):
+                    self.last = tracemalloc.take_snapshot()
+
+        # Unlike ReplayWorld the commands are not kept, they would count as retained memory
+        self.index += 1
+        if self.index >= len(self.rows):
+            raise TraceEnd()
+
+        if self.memory:
+            tracemalloc.reset_peak()
+            self._base = tracemalloc.get_traced_memory()[0]
+        self._woke = time.perf_counter()
+
+
+# A method to record the trace of one simulated lap, in a separate process so the
+# trace is written out when the program exits
+def record_trace(program, path, seed=0, noise=1.0):
+    directory = tempfile.mkdtemp()
+    try:
+        environment = dict(os.environ, PYTHONPATH=ROOT)
+        subprocess.check_call([sys.executable, '-m', 'robotlib.sim.run', os.path.abspath(program),
+                               '--seed', str(seed), '--noise', str(noise), '--trace-dir', directory],
+                              env=environment, stdout=subprocess.DEVNULL)
+        shutil.move(os.path.join(directory, 'lap_0000.csv'), path)
+    finally:
+        shutil.rmtree(directory)
+
+
+# A method to time the ticks of a trace replay, the fastest of repeat runs is kept
+def time_ticks(program, names, rows, repeat=5):
+    best = None
+    for _ in range(repeat):
+        world = BenchWorld(names, rows)
+        run_program(program, world)
+        if best is None or world.latency.total < best.latency.total:
+            best = world
+    latency = best.latency
+    return {
+        'ticks': latency.count,
+        'ticks_per_second': latency.count / latency.total if latency.total else 0.0,
+        'tick_mean': latency.total / latency.count if latency.count else 0.0,
+        'tick_p50': latency.percentile(0.5),
+        'tick_p99': latency.percentile(0.99),
+        'tick_max': latency.max,
+        'tick_overruns': best.overruns,
+        'tick_max_lateness': best.max_lateness,
+    }
+
+
+# A method to measure the memory the ticks of a trace replay allocate
+def trace_memory(program, names, rows, sites=5):
+    world = BenchWorld(names, rows, memory=True)
+    tracemalloc.start()
+    try:
+        run_program(program, world)
+    finally:
+        tracemalloc.stop()
+
+    tick_bytes = sorted(world.tick_bytes)
+    result = {
+        'tick_bytes_p50': tick_bytes[len(tick_bytes) // 2] if tick_bytes else 0,
+        'tick_bytes_p99': tick_bytes[int(0.99 * (len(tick_bytes) - 1))] if tick_bytes else 0,
+        'tick_bytes_max': tick_bytes[-1] if tick_bytes else 0,
+        'retained_bytes_per_tick': 0.0,
+        'retained_blocks_per_tick': 0.0,
+        'retained_at': [],
+    }
+    if world.first is None or world.last is None:
+        return result
+
+    # Memory that stays allocated from one tick to the next, grouped by the line
+    # it was allocated at, outside of the benchmark itself
+    ignored = [tracemalloc.Filter(False, module.__file__) for module in (tracemalloc, profiling, sys.modules[__name__])]
+    differences = world.last.filter_traces(ignored).compare_to(world.first.filter_traces(ignored), 'lineno')
+    ticks = len(tick_bytes) - 1
+    result['retained_bytes_per_tick'] = sum(difference.size_diff for difference in differences) / ticks
+    result['retained_blocks_per_tick'] = sum(difference.count_diff for difference in differences) / ticks
+    for difference in sorted(differences, key=lambda difference: -difference.size_diff)[:sites]:
+        if difference.size_diff <= 0:
+            break
+        frame = difference.traceback[0]
+        result['retained_at'].append({'line': "{}:{}".format(os.path.relpath(frame.filename, ROOT), frame.lineno),
+                                      'bytes_per_tick': difference.size_diff / ticks,
+                                      'blocks_per_tick': difference.count_diff / ticks})
+    return result
+
+
+# A method to drive simulated laps end to end
+def time_laps(program, laps=3, seed=0, noise=1.0):
+    track = sim_run.program_track(program)
+    results = [sim_run.run_lap(program, track, lap, color_noise=noise, seed=seed) for lap in range(laps)]
+    finished = [result for result in results if result['finished']]
+    return {
+        'laps': laps,
+        'laps_finished': len(finished),
+        'lap_time': sum(result['time'] for result in finished) / len(finished) if finished else None,
+        'lap_wall_time': sum(result['wall_time'] for result in results) / laps,
+    }
+
+
+# A method to benchmark one program, traces is the directory its trace is kept in
+# (None records a new one for every benchmark)
+def bench(program, traces=None, seed=0, noise=1.0, repeat=5, laps=3):
+    name = os.path.basename(os.path.dirname(os.path.abspath(program)))
+    directory = traces or tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, name + '.csv')
+        if not os.path.exists(path):
+            record_trace(program, path, seed, noise)
+        names, rows = load_trace(path)
+
+        result = {'program': program, 'trace': path if traces else None}
+        result.update(time_ticks(program, names, rows, repeat))
+        result.update(trace_memory(program, names, rows))
+        result.update(time_laps(program, laps, seed, noise))
+        return result
+    finally:
+        if not traces:
+            shutil.rmtree(directory)
+
+
+# The commit the benchmark ran on, if it ran in a git checkout
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# A method to print two benchmark results side by side, returns the regressed metrics
+def compare(old, new, threshold=10.0):
+    lines = ["{:<12} {:<24} {:>12} {:>12} {:>8}".format('program', 'metric', 'old', 'new', 'change')]
+    regressions = []
+    for name in sorted(set(old['programs']) & set(new['programs'])):
+        for metric, higher_is_better in METRICS:
+            before = old['programs'][name].get(metric)
+            after = new['programs'][name].get(metric)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before * 100 if before else 0.0
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > threshold:
+                flag = '  worse'
+                regressions.append((name, metric))
+            lines.append("{:<12} {:<24} {:>12.6g} {:>12.6g} {:>+7.1f}%{}".format(
+                name, metric, before, after, change, flag))
+    print("\n".join(lines))
+    return regressions
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['compare']:
+        parser = argparse.ArgumentParser(prog='robotlib.bench compare',
+                                         description="Compare two benchmark results")
+        parser.add_argument('old')
+        parser.add_argument('new')
+        parser.add_argument('--threshold', type=float, default=10.0, help="percent a metric may get worse")
+        args = parser.parse_args(argv[1:])
+        with open(args.old, 'r') as file:
+            old = json.load(file)
+        with open(args.new, 'r') as file:
+            new = json.load(file)
+        regressions = compare(old, new, args.threshold)
+        print("{} metrics got worse by more than {:g}%".format(len(regressions), args.threshold))
+        return 1 if regressions else 0
+
+    parser = argparse.ArgumentParser(description="Benchmark the lab programs against the simulated hardware")
+    parser.add_argument('programs', nargs='*', help="programs to benchmark, all labs by default")
+    parser.add_argument('--traces', help="directory keeping the recorded traces, so later runs replay the same ones")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--noise', type=float, default=1.0, help="color sensor noise of the recorded laps")
+    parser.add_argument('--repeat', type=int, default=5, help="timed replays per program, the fastest is kept")
+    parser.add_argument('--laps', type=int, default=3, help="simulated laps per program")
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    programs = args.programs or [os.path.join(ROOT, program) for program in PROGRAMS]
+    if args.traces and not os.path.isdir(args.traces):
+        os.makedirs(args.traces)
+
+    results = {
+        'commit': commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'settings': {'seed': args.seed, 'noise': args.noise, 'repeat': args.repeat, 'laps': args.laps},
+        'programs': {},
+    }
+    for program in programs:
+        name = os.path.basename(os.path.dirname(os.path.abspath(program)))
+        result = bench(program, args.traces, args.seed, args.noise, args.repeat, args.laps)
+        results['programs'][name] = result
+        print("{}: {:.0f} ticks/s, tick p50 {:.3f} ms, p99 {:.3f} ms, {} ticks over the period "
+              "(max {:.3f} ms late), {} B allocated per tick (p50), {:.1f} B retained per tick, lap {} s".format(
+                  name, result['ticks_per_second'], result['tick_p50'] * 1000, result['tick_p99'] * 1000,
+                  result['tick_overruns'], result['tick_max_lateness'] * 1000,
+                  result['tick_bytes_p50'], result['retained_bytes_per_tick'],
+                  "{:.2f}".format(result['lap_time']) if result['lap_time'] is not None else 'not finished'))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
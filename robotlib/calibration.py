@@ -0,0 +1,179 @@
+# Color classes that calibrate themselves
+#
+# The programs used to hard-code the reflected light limits of every surface, so a
+# brighter room meant lost lines and a darker one false grey crosses. A ColorClasses
+# starts from those limits and
+#
+#   - fits the centers of the surfaces from readings taken at startup (sweep(), a
+#     task that turns the robot over the line and back), with 1-D k-means
+#   - keeps following slow lighting changes with an exponential moving average of
+#     the readings that clearly belong to a surface
+#
+# The band of a surface keeps the share of the gap to its neighbours it had with
+# the default limits, so a grey band that started a quarter of the way towards
+# green and white stays there when green and white move.
+import math
+
+
+class ColorClasses(object):
+    # classes - (name, center, low, high) from the darkest surface to the brightest:
+    #           the default reading in the middle of the surface and the default
+    #           limits of its band, None for the open ends
+    # anchors - names of the surfaces measured by fit() and adapt(), all by default.
+    #           The others keep their relative place between the anchors
+    # alpha   - weight of a reading in the moving average of an anchor's center
+    # core    - share of the gap to the nearest neighbour within which a reading
+    #           counts as clearly belonging to the surface
+    def __init__(self, classes, anchors=None, alpha=0.002, core=0.15):
+        self.names = [name for name, _, _, _ in classes]
+        self.defaults = dict((name, float(center)) for name, center, _, _ in classes)
+        self.anchors = [name for name in self.names if anchors is None or name in anchors]
+        self.alpha = alpha
+        self.core = core
+
+        # Share of the gap to the neighbouring centers covered by every band
+        self._shares = {}
+        centers = [float(center) for _, center, _, _ in classes]
+        for index, (name, center, low, high) in enumerate(classes):
+            below = None if low is None else (center - low) / (center - centers[index - 1])
+            above = None if high is None else (high - center) / (centers[index + 1] - center)
+            self._shares[name] = (below, above)
+
+        self.centers = dict(self.defaults)
+        self.bands = {}
+        self._update()
+
+    # Band limits of a surface
+    def low(self, name):
+        return self.bands[name][0]
+
+    def high(self, name):
+        return self.bands[name][1]
+
+    # The name of the surface a reading belongs to, None between bands
+    def classify(self, value):
+        for name in self.names:
+            low, high = self.bands[name]
+            if (low is None or value >= low) and (high is None or value <= high):
+                return name
+        return None
+
+    # A method to fit the anchor centers to calibration readings, returns False (and
+    # keeps the centers) if the readings do not show the anchors as separate surfaces
+    #
+    # min_contrast - least share of the default distance between two anchors
+    # edge         - share of the darkest (brightest) cluster below (above) its center
+    def fit(self, values, iterations=20, min_contrast=0.5, edge=0.2):
+        if not values:
+            return False
+        centers = [self.defaults[name] for name in self.anchors]
+        for _ in range(iterations):
+            sums = [0.0] * len(centers)
+            counts = [0] * len(centers)
+            for value in values:
+                nearest = min(range(len(centers)), key=lambda index: abs(value - centers[index]))
+                sums[nearest] += value
+                counts[nearest] += 1
+            moved = [sums[index] / counts[index] if counts[index] else centers[index]
+                     for index in range(len(centers))]
+            if moved == centers:
+                break
+            centers = moved
+
+        # Readings on the edge of the line are a blend of two surfaces and pull the
+        # mean (or the median of a thin line) of a cluster towards its neighbour, so
+        # the darkest and brightest surfaces take a reading from the far end of their
+        # cluster and the ones in between the median
+        clusters = [[] for _ in centers]
+        for value in values:
+            clusters[min(range(len(centers)), key=lambda index: abs(value - centers[index]))].append(value)
+        if not all(clusters):
+            return False
+        for index, cluster in enumerate(clusters):
+            cluster.sort()
+            share = edge if index == 0 else 1 - edge if index == len(clusters) - 1 else 0.5
+            centers[index] = float(cluster[int(share * (len(cluster) - 1))])
+
+        # The anchors must keep their order and at least min_contrast of their default
+        # distance, otherwise the sweep missed a surface
+        defaults = [self.defaults[name] for name in self.anchors]
+        for index in range(len(centers) - 1):
+            if centers[index + 1] - centers[index] < min_contrast * (defaults[index + 1] - defaults[index]):
+                return False
+
+        for name, center in zip(self.anchors, centers):
+            self.centers[name] = center
+        self._update()
+        return True
+
+    # A method to follow the lighting with one more reading, returns True when a band
+    # limit changed (the limits are whole numbers like the readings)
+    def adapt(self, value):
+        name = self.classify(value)
+        if name not in self.anchors:
+            return False
+
+        center = self.centers[name]
+        index = self.names.index(name)
+        gaps = [abs(center - self.centers[self.names[other]]) for other in (index - 1, index + 1)
+                if 0 <= other < len(self.names)]
+        if abs(value - center) > self.core * min(gaps):
+            return False
+
+        self.centers[name] = center + (value - center) * self.alpha
+
+        # The bands are only recomputed once a center moved noticeably
+        if abs(self.centers[name] - self._placed[name]) < 0.1:
+            return False
+        return self._update()
+
+    # A method to place the other surfaces between the anchors and recompute the bands
+    def _update(self):
+        defaults = self.defaults
+        anchors = sorted(self.anchors, key=lambda name: defaults[name])
+        for name in self.names:
+            if name in self.anchors:
+                continue
+            below = [anchor for anchor in anchors if defaults[anchor] < defaults[name]]
+            above = [anchor for anchor in anchors if defaults[anchor] > defaults[name]]
+            if below and above:
+                low, high = below[-1], above[0]
+                share = (defaults[name] - defaults[low]) / (defaults[high] - defaults[low])
+                self.centers[name] = self.centers[low] + share * (self.centers[high] - self.centers[low])
+            else:
+                nearest = below[-1] if below else above[0]
+                self.centers[name] = defaults[name] + self.centers[nearest] - defaults[nearest]
+
+        bands = {}
+        for index, name in enumerate(self.names):
+            center = self.centers[name]
+            below, above = self._shares[name]
+            low = high = None
+            # Rounded first so the default limits come out exactly
+            if below is not None:
+                low = int(math.ceil(round(center - below * (center - self.centers[self.names[index - 1]]), 6)))
+            if above is not None:
+                high = int(math.floor(round(center + above * (self.centers[self.names[index + 1]] - center), 6)))
+            bands[name] = (low, high)
+
+        self._placed = dict(self.centers)
+        changed = bands != self.bands
+        self.bands = bands
+        return changed
+
+
+# A task to calibrate the colors at startup: turns angle degrees to the left, twice
+# that to the right and back while collecting the readings, then fits the centers.
+# Returns True if the fit succeeded, the defaults stay in place otherwise.
+def sweep(move_steering, colors, angle=30, speed=15):
+    values = []
+    snapshot = yield
+    start = snapshot.gyro
+    for target in (-angle, angle, 0):
+        direction = 1 if target > snapshot.gyro - start else -1
+        move_steering.on(steering=100 * direction, speed=speed)
+        while (snapshot.gyro - start - target) * direction < 0:
+            values.append(snapshot.color)
+            snapshot = yield
+    move_steering.off()
+    return colors.fit(values)
@@ -0,0 +1,16 @@
+# Time keeping for the robot programs
+#
+# On the brick now() and sleep() are the plain time functions. With the simulator
+# backend they read and advance the simulated time instead, which lets a run go
+# much faster than real time.
+import os
+import time
+
+# True when time is the simulated one, it only passes while the program sleeps
+SIMULATED = os.environ.get('ROBOT_BACKEND', 'ev3') == 'sim'
+
+if SIMULATED:
+    from robotlib.sim.world import now, sleep
+else:
+    now = time.time
+    sleep = time.sleep
@@ -0,0 +1,35 @@
+# Per track tuning without editing the programs
+#
+# A program keeps its settings in a dict and passes it through load(). When
+# ROBOT_CONFIG names a json file, the values in it replace the defaults, e.g.
+#
+#   ROBOT_CONFIG=green_line_fast.json python3 myrobot/main.py
+#
+# with green_line_fast.json holding {"max_speed": 60, "kp": 1.4}.
+import os
+
+
+# A method to return the settings with the overrides of the json file applied
+def load(defaults, path=None):
+    settings = dict(defaults)
+    path = path or os.environ.get('ROBOT_CONFIG')
+    if not path:
+        return settings
+
+    # json is only imported for an override file, it is slow to import on the brick
+    import json
+
+    with open(path, 'r') as file:
+        overrides = json.load(file)
+
+    unknown = set(overrides) - set(defaults)
+    if unknown:
+        raise ValueError("{}: unknown settings {}".format(path, ", ".join(sorted(unknown))))
+    settings.update(overrides)
+    return settings
+
+
+# A method to take the settings of one part (e.g. the line follower's, named by its
+# defaults) out of a program's settings
+def pick(settings, names):
+    return dict((name, settings[name]) for name in names)
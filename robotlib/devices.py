@@ -0,0 +1,31 @@
+# Hardware backend selection
+#
+# The robot programs import their motors and sensors from here instead of ev3dev2 so
+# that they can also run on a workstation. ROBOT_BACKEND=sim swaps the EV3 devices for
+# the simulated ones in robotlib.sim, anything else (the default) uses ev3dev2.
+#
+# get() imports only the ev3dev2 module of the name asked for, so a program that never
+# beeps never loads ev3dev2.sound and the first motor command does not wait for it.
+import importlib
+import os
+
+BACKEND = os.environ.get('ROBOT_BACKEND', 'ev3')
+
+# ev3dev2 module of every device class and port name
+MODULES = {
+    'MoveSteering': 'ev3dev2.motor',
+    'ColorSensor': 'ev3dev2.sensor.lego',
+    'GyroSensor': 'ev3dev2.sensor.lego',
+    'UltrasonicSensor': 'ev3dev2.sensor.lego',
+    'Sound': 'ev3dev2.sound',
+}
+MODULES.update(('OUTPUT_' + port, 'ev3dev2.motor') for port in 'ABCD')
+MODULES.update(('INPUT_' + port, 'ev3dev2.sensor') for port in '1234')
+
+
+# A method to return a device class or port name of the backend
+def get(name):
+    if name not in MODULES:
+        raise AttributeError("no device or port {!r}".format(name))
+    module = 'robotlib.sim.devices' if BACKEND == 'sim' else MODULES[name]
+    return getattr(importlib.import_module(module), name)
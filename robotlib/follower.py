@@ -0,0 +1,109 @@
+# Line following shared by the lab robots
+#
+# The steering comes from a PID controller on the distance of the color reading from
+# the edge of the line, plus a feed-forward term: on a curve the robot needs a steady
+# steering just to keep turning, and the gyro tells how fast it is turning already.
+# The same turn rate sets the speed, so the robot drives fast on the straights and
+# slows down in curves instead of using one speed that has to work for both.
+from robotlib.pid import PID
+
+# Controller settings, every program starts from these and overrides what its track
+# needs (see robotlib/config.py to tune them without editing the program)
+#
+# kp, ki, kd      - PID gains, in steering per unit of color error
+# integral_limit  - bound of the integral term in steering
+# derivative_tau  - low-pass time constant of the derivative in seconds
+# limit           - bound of the steering
+# feed_forward    - steering per (degree per second of turn rate / speed), 0 turns it off
+# rate_tau        - low-pass time constant of the turn rate in seconds
+# max_speed       - speed on straight line
+# min_speed       - speed in the sharpest curves
+# slow_down       - speed taken off per (degree per second of turn rate / speed)
+# acceleration    - how fast the speed may rise again, in speed per second
+DEFAULTS = {
+    'kp': 1.0,
+    'ki': 0.0,
+    'kd': 0.0,
+    'integral_limit': 20.0,
+    'derivative_tau': 0.03,
+    'limit': 80,
+    'feed_forward': 0.0,
+    'rate_tau': 0.15,
+    'max_speed': 35,
+    'min_speed': 35,
+    'slow_down': 0.0,
+    'acceleration': 50.0,
+}
+
+# Updates further apart than this mean someone else (a maneuver) was driving
+MAX_GAP = 0.1
+
+
+class LineFollower(object):
+    # target    - color reading at the edge of the line
+    # direction - 1 if a reading above the target should steer right (clockwise), -1 if left
+    # settings  - overrides of DEFAULTS
+    def __init__(self, target, direction=1, **settings):
+        unknown = set(settings) - set(DEFAULTS)
+        if unknown:
+            raise ValueError("unknown line follower settings: {}".format(", ".join(sorted(unknown))))
+
+        self.target = target
+        self.direction = direction
+        self.settings = dict(DEFAULTS)
+        self.settings.update(settings)
+
+        s = self.settings
+        self.pid = PID(s['kp'], s['ki'], s['kd'], limits=(-s['limit'], s['limit']),
+                       integral_limit=s['integral_limit'], derivative_tau=s['derivative_tau'],
+                       max_gap=MAX_GAP)
+        self.reset()
+
+    # A method to forget the history, done automatically after a pause in the updates
+    def reset(self):
+        self.pid.reset()
+        self.time = None
+        self.gyro = None
+        self.rate = 0.0
+        self.speed = self.settings['min_speed']
+
+        # Gyro angle and turn rate at the last reading on the (dark) line
+        self.seen_gyro = None
+        self.seen_rate = 0.0
+
+    # A method to compute (steering, speed) from the snapshot of a tick,
+    # it needs the color, gyro and time attributes
+    def update(self, snapshot):
+        s = self.settings
+        now = snapshot.time
+        if self.time is not None and now - self.time > MAX_GAP:
+            self.reset()
+
+        # Low-pass filtered turn rate from the gyro angle
+        if self.time is not None and now > self.time:
+            dt = now - self.time
+            raw = (snapshot.gyro - self.gyro) / dt
+            self.rate += (raw - self.rate) * (dt / (s['rate_tau'] + dt))
+            # Speed may drop at once but only rises as fast as the acceleration allows
+            curvature = abs(self.rate) / max(self.speed, 1)
+            target_speed = max(s['min_speed'], min(s['max_speed'], s['max_speed'] - s['slow_down'] * curvature))
+            self.speed = min(target_speed, self.speed + s['acceleration'] * dt)
+        self.time = now
+        self.gyro = snapshot.gyro
+        if snapshot.color <= self.target:
+            self.seen_gyro = snapshot.gyro
+            self.seen_rate = self.rate
+
+        error = self.direction * (snapshot.color - self.target)
+        feed_forward = s['feed_forward'] * self.rate / max(self.speed, 1)
+        steering = self.pid.update(error, now, feed_forward)
+        return steering, self.speed
+
+    # A method to tell where the line was last seen, for robotlib.search: returns
+    # (1 if the robot was turning clockwise then else -1, its heading relative to the
+    # snapshot's or None if the follower has not seen the line since its last reset)
+    def last_seen(self, snapshot):
+        side = 1 if self.seen_rate >= 0 else -1
+        if self.seen_gyro is None:
+            return side, None
+        return side, self.seen_gyro - snapshot.gyro
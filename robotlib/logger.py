@@ -0,0 +1,109 @@
+# Buffered logging for the robot programs
+#
+# Writing a log row straight to the SD card on every sample (open, write, close)
+# blocks the control loop for a noticeable amount of time. Instead the control loop
+# only appends a row to an in-memory buffer and a background thread writes the
+# buffered rows in batches, either once enough rows were collected or once the
+# flush interval passed.
+#
+# The file is opened (and the header written) by the writer thread too, so setting
+# up a logger at startup costs a thread start and not a file creation on the SD card
+# before the robot can move.
+import atexit
+import collections
+import threading
+
+
+class BufferedLogger(object):
+    # path           - file to write (it is truncated on start)
+    # header         - optional first row of the file
+    # format_row     - optional function turning a queued row into the written row,
+    #                  so that formatting costs are paid by the writer thread
+    # max_rows       - memory cap, the oldest rows are dropped when the buffer is full
+    # batch_rows     - wake the writer up as soon as this many rows are waiting
+    # flush_interval - otherwise the writer flushes every flush_interval seconds
+    def __init__(self, path, header=None, format_row=None, max_rows=5000,
+                 batch_rows=50, flush_interval=1.0):
+        self.path = path
+        self.format_row = format_row
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.dropped = 0
+
+        self._rows = collections.deque(maxlen=max_rows)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+
+        self.header = header
+        self._file = None
+
+        self._thread = threading.Thread(target=self._run, name="logger-writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+        # Make sure the buffered rows reach the file when the program ends or crashes
+        atexit.register(self.close)
+
+    # A method to open the output file, overridden by loggers with other formats
+    def open_file(self):
+        return open(self.path, 'w', newline='')
+
+    # A method to open the output file and write the header, in the writer thread
+    # (or by close() if the thread never got to it)
+    def start_file(self):
+        self._file = self.open_file()
+        if self.header is not None:
+            self.write_rows([self.header])
+            self._file.flush()
+
+    # A method to write rows to the output file, called from the writer thread only
+    def write_rows(self, rows):
+        if not hasattr(self, '_csv_writer'):
+            import csv
+
+            self._csv_writer = csv.writer(self._file)
+        self._csv_writer.writerows(rows)
+
+    # A method to queue a row, it never touches the file
+    def log(self, row):
+        with self._lock:
+            if len(self._rows) == self._rows.maxlen:
+                self.dropped += 1
+            self._rows.append(row)
+            waiting = len(self._rows)
+
+        if waiting >= self.batch_rows:
+            self._wake.set()
+
+    # A method to write every queued row to the file right away
+    def flush(self):
+        with self._lock:
+            rows = list(self._rows)
+            self._rows.clear()
+
+        if not rows:
+            return
+        if self.format_row is not None:
+            rows = [self.format_row(row) for row in rows]
+        self.write_rows(rows)
+        self._file.flush()
+
+    # A method to stop the writer thread and flush whatever is still buffered
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        if self._file is None:
+            self.start_file()
+        self.flush()
+        self._file.close()
+
+    def _run(self):
+        self.start_file()
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
@@ -0,0 +1,129 @@
+# What a program does at the landmarks of the course, as a table
+#
+# The lab programs used to count grey crosses and obstacles in globals and branch on
+# the counts (== 1 spin around, >= 2 stop). A Mission holds the course as rows of
+#
+#   (state, event, next state, action[, guard])
+#
+# e.g. for the green line with its two grey crosses
+#
+#   [['outbound', 'grey', 'returning', 'spin_around'],
+#    ['returning', 'grey', 'done', 'finish']]
+#
+# The detectors of a program (grey readings, the ultrasonic distance) only fire
+# events, fire('grey', snapshot) takes the row of the current state and the event,
+# moves to the next state and runs the action. An action is a function of the
+# snapshot named in the program's actions, a task it returns (a generator) runs on
+# the scheduler, and while it runs the mission ignores events, the same way a
+# maneuver around an obstacle used to block the other obstacle rules. A guard names a
+# function of the snapshot that has to return True for its row to be taken, rows of
+# the same state and event are tried in order. An event that is a number of seconds
+# fires on its own once the mission has been that long in the state (tick() checks
+# it), e.g. ['returning', 60, 'done', 'finish'] gives up a minute after the spin.
+#
+# The rows are plain lists, so a program keeps them in its settings and a new course
+# layout is a ROBOT_CONFIG file instead of an edit of main.py. They are compiled into
+# a dict keyed by (state, event) and a dict of the timeouts per state, a tick does a
+# lookup or two and no search. Every transition is kept in history as
+# (time, state, event, next state), and passed to the functions in on_transition.
+import collections
+
+
+class Mission(object):
+    # rows      - (state, event, next state, action name[, guard name]) in priority
+    #             order, the action name may be None for a plain state change
+    # actions   - action name -> function(snapshot), returning a task or None
+    # guards    - guard name -> function(snapshot) returning True if the row may be taken
+    # scheduler - the scheduler the action tasks run on
+    # start     - state to start in, the state of the first row by default
+    # history   - number of transitions kept
+    def __init__(self, rows, actions, scheduler, guards=None, start=None, history=1000):
+        self.scheduler = scheduler
+        self.table = {}    # (state, event) -> list of (guard, next state, action)
+        self.timeouts = {} # state -> seconds in the state before its timeout event
+        self.history = collections.deque(maxlen=history)
+        self.on_transition = []
+        self.active = False
+        self.ticked = False
+
+        guards = guards or {}
+        for row in rows:
+            if len(row) not in (4, 5):
+                raise ValueError("a mission row is (state, event, next state, action[, guard]), "
+                                 "got {!r}".format(row))
+            state, event, target, action = row[:4]
+            guard = row[4] if len(row) == 5 else None
+            if action is not None and action not in actions:
+                raise ValueError("mission row {!r}: unknown action {!r}".format(row, action))
+            if guard is not None and guard not in guards:
+                raise ValueError("mission row {!r}: unknown guard {!r}".format(row, guard))
+
+            if isinstance(event, (int, float)):
+                if state in self.timeouts and self.timeouts[state] != event:
+                    raise ValueError("mission state {!r} has more than one timeout".format(state))
+                self.timeouts[state] = event
+            self.table.setdefault((state, event), []).append(
+                (guards.get(guard), target, actions.get(action)))
+
+        # States no row leaves, the mission is over once it gets to one
+        self.ends = set(row[2] for row in rows) - set(row[0] for row in rows)
+
+        if start is None:
+            if not rows:
+                raise ValueError("a mission needs at least one row")
+            start = rows[0][0]
+        self.state = start
+        self.deadline = None
+
+    # A method to switch to a state at the time of a snapshot, it starts the state's timeout
+    def enter(self, state, time):
+        self.state = state
+        timeout = self.timeouts.get(state)
+        self.deadline = None if timeout is None else time + timeout
+
+    # True if the mission got to one of its end states
+    def over(self):
+        return self.state in self.ends
+
+    # A method to handle an event of the snapshot, returns True if a row was taken
+    def fire(self, event, snapshot):
+        if self.active:
+            return False
+        entries = self.table.get((self.state, event))
+        if entries is None:
+            return False
+
+        for guard, target, action in entries:
+            if guard is None or guard(snapshot):
+                break
+        else:
+            return False
+
+        transition = (snapshot.time, self.state, event, target)
+        self.history.append(transition)
+        for function in self.on_transition:
+            function(*transition)
+        self.enter(target, snapshot.time)
+
+        task = action(snapshot) if action is not None else None
+        if task is not None:
+            self.active = True
+            self.scheduler.start(self._run(task))
+        return True
+
+    # A per tick check for Robot.checks: fires the timeout of the current state once it
+    # has passed (the start state's counts from the first tick), returns True if it
+    # did, which ends the tick
+    def tick(self, snapshot):
+        if not self.ticked:
+            self.ticked = True
+            self.enter(self.state, snapshot.time)
+        if self.deadline is None or self.active or snapshot.time < self.deadline:
+            return False
+        return self.fire(self.timeouts[self.state], snapshot)
+
+    def _run(self, task):
+        try:
+            yield from task
+        finally:
+            self.active = False
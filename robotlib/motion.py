@@ -0,0 +1,109 @@
+# Motion primitives for maneuvers, run them with "yield from" in a scheduler task
+#
+# The maneuvers used to spin at a constant speed until the gyro passed a threshold
+# picked short of the target (345 degrees for a full turn) and to drive for a fixed
+# time. The robot keeps turning for a while after the motors are told to stop, so
+# how far it overshot depended on the speed and the battery. These primitives
+# measure the turn rate (or wheel speed) every tick, predict where the robot will
+# come to rest if it stopped now, slow down over the last part of the way and stop
+# when the prediction reaches the target. That is accurate at higher speeds too.
+import math
+
+from robotlib.odometry import WHEEL_D
+
+
+# Rate of change of a sampled value, low-pass filtered: the gyro angle and the
+# encoder positions are whole degrees, so the raw difference of two ticks is coarse
+class Rate(object):
+    def __init__(self, tau=0.03):
+        self.tau = tau
+        self.rate = 0.0
+        self.value = None
+        self.time = None
+
+    def update(self, value, now):
+        if self.time is not None and now > self.time:
+            dt = now - self.time
+            raw = (value - self.value) / dt
+            self.rate += (raw - self.rate) * (dt / (self.tau + dt))
+        self.value = value
+        self.time = now
+        return self.rate
+
+
+# Distance in cm the robot has driven, the mean of the two wheel positions of a
+# snapshot: turning on the spot leaves it where it was, reversing brings it down
+def driven(snapshot, wheel_diameter=WHEEL_D):
+    return (snapshot.left_position + snapshot.right_position) / 2 * math.pi * wheel_diameter / 360
+
+
+# The speed for a distance still to go: full speed until the last ramp units, then
+# slowing down linearly to min_speed
+def ramp_speed(remaining, speed, min_speed, ramp):
+    if remaining >= ramp:
+        return speed
+    return max(min_speed, speed * remaining / ramp)
+
+
+# Turn on the spot by degrees (positive is clockwise), relative to the gyro angle
+# when the task starts. Returns the last snapshot
+#
+# speed     - turning speed away from the target
+# min_speed - turning speed on the last degrees
+# ramp      - degrees before the target the speed starts to drop
+# lag       - seconds the robot keeps turning at its current rate after stopping
+# tolerance - degrees short of the target that count as there
+def turn_by(move_steering, degrees, speed=40, min_speed=8, ramp=60.0, lag=0.03, tolerance=0.5):
+    snapshot = yield
+    return (yield from turn_to(move_steering, snapshot.gyro + degrees, speed, min_speed, ramp, lag,
+                               tolerance, snapshot))
+
+
+# Turn on the spot until the gyro reads angle, see turn_by() for the settings
+def turn_to(move_steering, angle, speed=40, min_speed=8, ramp=60.0, lag=0.03, tolerance=0.5, snapshot=None):
+    if snapshot is None:
+        snapshot = yield
+    direction = 1 if angle >= snapshot.gyro else -1
+    rate = Rate()
+    current_speed = None
+    while True:
+        turned = rate.update(snapshot.gyro, snapshot.time) * direction
+        remaining = (angle - snapshot.gyro) * direction
+        if remaining - max(0.0, turned) * lag <= tolerance:
+            break
+        turn_speed = round(ramp_speed(remaining, speed, min_speed, ramp))
+        if turn_speed != current_speed:
+            move_steering.on(steering=100 * direction, speed=turn_speed)
+            current_speed = turn_speed
+        snapshot = yield
+    move_steering.off()
+    return snapshot
+
+
+# Drive straight for cm (negative backwards), measured by the wheel encoders. The
+# snapshots need left_position and right_position. With heading set the gyro keeps
+# the robot on that angle. Returns the last snapshot
+#
+# speed, min_speed, ramp (in cm), lag, tolerance (in cm) - as for turn_by()
+# heading_gain   - steering per degree off the heading
+# wheel_diameter - in cm
+def drive_distance(move_steering, cm, speed=40, min_speed=10, ramp=8.0, lag=0.03, tolerance=0.3,
+                   heading=None, heading_gain=2.0, wheel_diameter=WHEEL_D):
+    cm_per_degree = math.pi * wheel_diameter / 360
+    snapshot = yield
+    start = (snapshot.left_position + snapshot.right_position) / 2
+    direction = 1 if cm >= 0 else -1
+    rate = Rate()
+    while True:
+        position = ((snapshot.left_position + snapshot.right_position) / 2 - start) * cm_per_degree
+        moving = rate.update(position, snapshot.time) * direction
+        remaining = (cm - position) * direction
+        if remaining - max(0.0, moving) * lag <= tolerance:
+            break
+        steering = 0
+        if heading is not None:
+            steering = max(-100, min(100, heading_gain * (heading - snapshot.gyro) * direction))
+        move_steering.on(steering=steering, speed=direction * round(ramp_speed(remaining, speed, min_speed, ramp)))
+        snapshot = yield
+    move_steering.off()
+    return snapshot
@@ -0,0 +1,23 @@
+# Reacting to obstacles in front of the ultrasonic sensor
+#
+# An ObstacleCheck is a per tick check for Robot.checks: it looks at the distance of
+# the snapshot and fires an event into the program's Mission (see
+# robotlib/mission.py) when an obstacle is close enough. What the robot does about
+# it, and how it depends on the obstacles met before, are rows of the mission.
+
+
+class ObstacleCheck(object):
+    # mission - the Mission the events go to
+    # events  - (distance, event) in order of priority: an obstacle no further than
+    #           distance cm fires the event, the first one the mission takes counts
+    def __init__(self, mission, events):
+        self.mission = mission
+        self.events = events
+
+    # A method to check the snapshot of a tick, returns True if the mission took an event
+    def __call__(self, snapshot):
+        distance = snapshot.distance
+        for limit, event in self.events:
+            if distance <= limit and self.mission.fire(event, snapshot):
+                return True
+        return False
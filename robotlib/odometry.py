@@ -0,0 +1,159 @@
+# Position tracking from the wheel encoders and a gyro
+#
+# The wheels tell how far the robot moved, the gyro which way it was heading (it is
+# more reliable than the encoder difference for rotation). PoseEstimator also uses the
+# encoder difference to keep the gyro drift out of the heading. myrobot_test/odometry.py
+# rebuilds the same path offline from the raw samples.
+import math
+
+# Robot's physique
+WHEEL_D = 5.6 # standard diameter in cm for ev3 robot wheel
+AXLE = 12.0   # standard distance between wheels in cm for ev3 robot
+
+
+# Position tracking at the full control rate with the gyro drift estimated from the
+# encoders
+#
+# Taking the heading straight from the gyro lets its drift add up over a long run.
+# The estimator is an extended Kalman filter of x, y, heading and the gyro bias:
+# every update turns the robot by the gyro minus the bias, moves it along the
+# average heading of the step and predicts the covariance, and every window
+# seconds the gyro turn is compared with the encoder turn to measure the bias
+# (wheel slip makes that comparison noisy while turning hard, so it counts less
+# then), which also corrects the pose through the covariance. The 4x4 symmetric
+# covariance is written out entry by entry, an update costs about fifty
+# multiplications.
+class PoseEstimator(object):
+    # distance_noise - standard deviation of the driven distance in cm per sqrt(cm)
+    # turn_noise     - standard deviation of the heading change in radians per sqrt(radian)
+    # gyro_noise     - standard deviation of a gyro turn over a window in radians
+    #                  (the angle is read in whole degrees)
+    # slip           - share of the encoder turn over a window that may be wheel slip
+    # bias_drift     - change of the gyro bias in radians per second per sqrt(second)
+    # bias_sigma     - initial standard deviation of the gyro bias in radians per second
+    # window         - seconds of gyro and encoder turns compared in one bias measurement
+    def __init__(self, wheel_diameter=WHEEL_D, axle=AXLE, distance_noise=0.05, turn_noise=0.02,
+                 gyro_noise=0.01, slip=0.1, bias_drift=0.001, bias_sigma=0.02, window=0.5):
+        self.cm_per_degree = wheel_diameter * math.pi / 360
+        self.axle = axle
+        self.distance_variance = distance_noise ** 2
+        self.turn_variance = turn_noise ** 2
+        self.gyro_variance = gyro_noise ** 2
+        self.slip = slip
+        self.bias_variance_rate = bias_drift ** 2
+        self.window = window
+
+        self.x = 0.0
+        self.y = 0.0
+        self.heading = 0.0 # in radians, clockwise like the gyro
+        self.bias = 0.0    # gyro drift in radians per second
+
+        # Upper triangle of the covariance of x, y, heading and bias
+        self.pxx = self.pxy = self.pxh = self.pxb = 0.0
+        self.pyy = self.pyh = self.pyb = 0.0
+        self.phh = self.phb = 0.0
+        self.pbb = bias_sigma ** 2
+
+        self.time = None
+        self.left = self.right = self.gyro = None
+        self._gyro_turn = self._encoder_turn = self._elapsed = 0.0
+
+    # A method to move the pose by the encoder and gyro change since the last update,
+    # gyro_angle in degrees. The first update only sets the starting heading.
+    # Returns the new (x, y)
+    def update(self, left_position, right_position, gyro_angle, now):
+        if self.time is None:
+            self.heading = math.radians(gyro_angle)
+            self.left, self.right, self.gyro, self.time = left_position, right_position, gyro_angle, now
+            return self.x, self.y
+
+        dt = now - self.time
+        left = (left_position - self.left) * self.cm_per_degree
+        right = (right_position - self.right) * self.cm_per_degree
+        gyro_turn = math.radians(gyro_angle - self.gyro)
+        self.left, self.right, self.gyro, self.time = left_position, right_position, gyro_angle, now
+
+        distance = (left + right) / 2
+        turn = gyro_turn - self.bias * dt
+        middle = self.heading + turn / 2
+        sin = math.sin(middle)
+        cos = math.cos(middle)
+        self.x += distance * sin
+        self.y += distance * cos
+        self.heading += turn
+
+        # Covariance prediction F P F' + Q. The Jacobian F is the identity plus the
+        # heading column (a, c, 0, 0) and the bias column (bx, by, bh, 0)
+        a = distance * cos
+        c = -distance * sin
+        bh = -dt
+        bx = a * bh / 2
+        by = c * bh / 2
+        pxx, pxy, pxh, pxb = self.pxx, self.pxy, self.pxh, self.pxb
+        pyy, pyh, pyb = self.pyy, self.pyh, self.pyb
+        phh, phb, pbb = self.phh, self.phb, self.pbb
+
+        # M = F P
+        mxx = pxx + a * pxh + bx * pxb
+        mxy = pxy + a * pyh + bx * pyb
+        mxh = pxh + a * phh + bx * phb
+        mxb = pxb + a * phb + bx * pbb
+        myy = pyy + c * pyh + by * pyb
+        myh = pyh + c * phh + by * phb
+        myb = pyb + c * phb + by * pbb
+        mhh = phh + bh * phb
+        mhb = phb + bh * pbb
+
+        # P = M F' + Q
+        q = self.distance_variance * abs(distance)
+        self.pxx = mxx + a * mxh + bx * mxb + q * sin * sin
+        self.pxy = mxy + c * mxh + by * mxb + q * sin * cos
+        self.pxh = mxh + bh * mxb
+        self.pxb = mxb
+        self.pyy = myy + c * myh + by * myb + q * cos * cos
+        self.pyh = myh + bh * myb
+        self.pyb = myb
+        self.phh = mhh + bh * mhb + self.turn_variance * abs(turn)
+        self.phb = mhb
+        self.pbb = pbb + self.bias_variance_rate * dt
+
+        # Bias measurement from the turns of a whole window
+        self._gyro_turn += gyro_turn
+        self._encoder_turn += (left - right) / self.axle
+        self._elapsed += dt
+        if self._elapsed >= self.window:
+            self._correct()
+        return self.x, self.y
+
+    # A method to correct the state with the gyro bias measured over the last window
+    def _correct(self):
+        elapsed = self._elapsed
+        measured = (self._gyro_turn - self._encoder_turn) / elapsed
+        noise = (self.gyro_variance + (self.slip * self._encoder_turn) ** 2) / (elapsed * elapsed)
+        self._gyro_turn = self._encoder_turn = self._elapsed = 0.0
+
+        pxb, pyb, phb, pbb = self.pxb, self.pyb, self.phb, self.pbb
+        s = pbb + noise
+        innovation = (measured - self.bias) / s
+        self.x += pxb * innovation
+        self.y += pyb * innovation
+        self.heading += phb * innovation
+        self.bias += pbb * innovation
+
+        # P = P - P[:, b] P[b, :] / s
+        self.pxx -= pxb * pxb / s
+        self.pxy -= pxb * pyb / s
+        self.pxh -= pxb * phb / s
+        self.pxb -= pxb * pbb / s
+        self.pyy -= pyb * pyb / s
+        self.pyh -= pyb * phb / s
+        self.pyb -= pyb * pbb / s
+        self.phh -= phb * phb / s
+        self.phb -= phb * pbb / s
+        self.pbb -= pbb * pbb / s
+
+    # The pose covariance as a 3x3 matrix of x, y (cm) and heading (radians)
+    def covariance(self):
+        return [[self.pxx, self.pxy, self.pxh],
+                [self.pxy, self.pyy, self.pyh],
+                [self.pxh, self.pyh, self.phh]]
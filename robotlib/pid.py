@@ -0,0 +1,66 @@
+# PID controller for the line followers
+#
+# A pure P controller has to keep its gain low enough not to oscillate at speed, and
+# then has no way of holding a curve without a steady error. This one adds
+#
+#   - an integral term that stops growing while the output is saturated (anti-windup)
+#     and is bounded on its own, so leaving a long curve does not overshoot
+#   - a derivative term on the low-pass filtered error, so single noisy color
+#     readings do not kick the steering
+#   - a feed-forward input added to the output before the clamp
+#
+# update() takes the time of the reading instead of assuming a fixed period, so a
+# late tick does not change the effective gains.
+
+
+class PID(object):
+    # kp, ki, kd     - gains of the error, its integral (per second) and its derivative (per second)
+    # limits         - (low, high) bounds of the output
+    # integral_limit - bound of the integral term's contribution to the output
+    # derivative_tau - time constant of the low-pass filter on the derivative in seconds
+    # max_gap        - updates further apart than this (e.g. after a maneuver) restart the controller
+    def __init__(self, kp, ki=0.0, kd=0.0, limits=(-80, 80), integral_limit=20.0,
+                 derivative_tau=0.03, max_gap=0.1):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.limits = limits
+        self.integral_limit = integral_limit
+        self.derivative_tau = derivative_tau
+        self.max_gap = max_gap
+        self.reset()
+
+    # A method to forget the history, e.g. when the controller takes over again
+    def reset(self):
+        self.integral = 0.0
+        self.derivative = 0.0
+        self.error = None
+        self.time = None
+        self.output = 0.0
+
+    # A method to compute the output for an error measured at time now
+    def update(self, error, now, feed_forward=0.0):
+        dt = None if self.time is None else now - self.time
+        if dt is not None and dt > self.max_gap:
+            self.reset()
+            dt = None
+
+        if dt is not None and dt > 0:
+            # Filtered derivative of the error
+            raw = (error - self.error) / dt
+            alpha = dt / (self.derivative_tau + dt)
+            self.derivative += (raw - self.derivative) * alpha
+
+            # Integrate unless the output is saturated and the error pushes it further out
+            low, high = self.limits
+            saturated = (self.output >= high and error > 0) or (self.output <= low and error < 0)
+            if self.ki and not saturated:
+                bound = self.integral_limit / self.ki
+                self.integral = max(-bound, min(bound, self.integral + error * dt))
+
+        self.error = error
+        self.time = now
+
+        output = feed_forward + self.kp * error + self.ki * self.integral + self.kd * self.derivative
+        self.output = max(self.limits[0], min(self.limits[1], output))
+        return self.output
@@ -0,0 +1,215 @@
+# Timing of the control loop
+#
+# With ROBOT_PROFILE=<file> set, a program times every sensor read, every motor
+# command, its ticks and whatever else it wraps with profiler.wrap(), and keeps
+# histograms of the loop period, its jitter and the sensor reads per tick. Nothing is
+# written while the program runs: the counters live in memory and a json summary is
+# written at exit. Without ROBOT_PROFILE nothing is wrapped, so the loop runs the
+# same code as before.
+#
+#   ROBOT_PROFILE=profile.json python3 myrobot/main.py
+#   python -m robotlib.profiling profile.json
+import atexit
+import math
+import os
+import time
+
+# Histogram bins: four per doubling of the duration from 1 us up to about 1 s, so a
+# 20 us sysfs read and a 10 ms loop period are both resolved to within 20%
+BIN_START = 1e-6
+BINS_PER_DOUBLING = 4
+BINS = 80
+
+
+# Count, total, maximum and histogram of a series of durations
+class Histogram(object):
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.min = None
+        self.bins = [0] * (BINS + 1) # bin 0 holds everything up to BIN_START
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        index = 0 if seconds <= BIN_START else int(math.log(seconds / BIN_START, 2) * BINS_PER_DOUBLING) + 1
+        self.bins[index if index < BINS else BINS] += 1
+
+    # Upper edge of the bin the given share of the durations falls into
+    def percentile(self, share):
+        needed = share * self.count
+        seen = 0
+        for index, count in enumerate(self.bins):
+            seen += count
+            if count and seen >= needed:
+                return self.max if index == BINS else min(self.max, bin_edge(index))
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'min': self.min or 0.0,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p99': self.percentile(0.99),
+            'histogram': self.bins,
+        }
+
+
+# Upper edge of a histogram bin in seconds
+def bin_edge(index):
+    return BIN_START * 2 ** (index / float(BINS_PER_DOUBLING))
+
+
+class Profiler(object):
+    # path  - file the summary is written to at exit, None disables the profiler
+    # clock - clock of the section timers (the loop period uses the scheduler's clock)
+    def __init__(self, path=None, clock=time.perf_counter):
+        self.path = path
+        self.enabled = path is not None
+        self.clock = clock
+        self.sections = {}
+        self.period = Histogram()
+        self.jitter = Histogram() # |period - nominal period|
+        self.busy = Histogram()   # time between waking up and going to sleep again
+        self.reads = {}           # reads per tick -> number of ticks
+        self.scheduler = None     # its overruns go into the summary
+        self.started = time.time()
+        self._saved = False
+        if self.enabled:
+            atexit.register(self.save)
+
+    # A method to return function timed as section name, or function itself when disabled
+    def wrap(self, name, function):
+        if not self.enabled:
+            return function
+        histogram = self.sections.setdefault(name, Histogram())
+        clock = self.clock
+
+        def timed(*args, **kwargs):
+            started = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.add(clock() - started)
+        return timed
+
+    # A method to time the sensor reads of a sampler and count them per tick
+    def watch_sampler(self, sampler, scheduler):
+        sampler.instrument(lambda name, read: self.wrap('read.' + name, read))
+        last = [sampler.reads]
+
+        def count_reads():
+            reads = sampler.reads - last[0]
+            last[0] = sampler.reads
+            self.reads[reads] = self.reads.get(reads, 0) + 1
+        scheduler.after_tick.append(count_reads)
+
+    # A method to time the motor commands
+    def watch_motors(self, move_steering):
+        move_steering.on = self.wrap('motor.on', move_steering.on)
+        move_steering.off = self.wrap('motor.off', move_steering.off)
+
+    # A method to measure the loop period, its jitter and the busy part of every period
+    def watch_scheduler(self, scheduler):
+        self.scheduler = scheduler
+        sleep = scheduler.sleep
+        clock = scheduler.clock
+        state = {'woke': None}
+
+        def timed_sleep(seconds):
+            now = clock()
+            woke = state['woke']
+            if woke is not None:
+                self.busy.add(now - woke)
+            sleep(seconds)
+            now = clock()
+            if woke is not None:
+                self.period.add(now - woke)
+                self.jitter.add(abs(now - woke - scheduler.period))
+            state['woke'] = now
+        scheduler.sleep = timed_sleep
+
+    def summary(self):
+        scheduler = self.scheduler
+        return {
+            'duration': time.time() - self.started,
+            'ticks': scheduler.ticks if scheduler else 0,
+            'overruns': scheduler.overruns if scheduler else 0,
+            'max_lateness': scheduler.max_lateness if scheduler else 0.0,
+            'sections': dict((name, histogram.summary()) for name, histogram in self.sections.items()),
+            'period': self.period.summary(),
+            'jitter': self.jitter.summary(),
+            'busy': self.busy.summary(),
+            'reads_per_tick': dict((str(reads), ticks) for reads, ticks in sorted(self.reads.items())),
+        }
+
+    # A method to write the summary, called at exit
+    def save(self):
+        import json
+
+        if not self.enabled or self._saved:
+            return
+        self._saved = True
+        with open(self.path, 'w') as file:
+            json.dump(self.summary(), file)
+
+
+# A method to start profiling if ROBOT_PROFILE is set. It always returns a Profiler,
+# a disabled one wraps nothing
+def start_profiling(sampler, move_steering, scheduler):
+    profiler = Profiler(os.environ.get('ROBOT_PROFILE') or None)
+    if profiler.enabled:
+        profiler.watch_sampler(sampler, scheduler)
+        profiler.watch_motors(move_steering)
+        profiler.watch_scheduler(scheduler)
+    return profiler
+
+
+# A method to print a summary as a table of milliseconds
+def report(summary):
+    def row(name, stats):
+        return "{:<20} {:>8} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>10.1f}".format(
+            name, stats['count'], stats['mean'] * 1000, stats['p50'] * 1000, stats['p99'] * 1000,
+            stats['max'] * 1000, stats['total'] * 1000)
+
+    lines = ["{:<20} {:>8} {:>9} {:>9} {:>9} {:>9} {:>10}".format(
+        'section', 'count', 'mean ms', 'p50 ms', 'p99 ms', 'max ms', 'total ms')]
+    for name, stats in sorted(summary['sections'].items(), key=lambda item: -item[1]['total']):
+        lines.append(row(name, stats))
+    lines.append('')
+    for name in ('period', 'jitter', 'busy'):
+        lines.append(row('loop.' + name, summary[name]))
+    lines.append('')
+    # Profiles written before the overruns were kept have none
+    if 'overruns' in summary:
+        lines.append("overruns: {} of {} ticks took longer than their period, the latest ended {:.3f} ms "
+                     "after its deadline".format(summary['overruns'], summary['ticks'],
+                                                 summary['max_lateness'] * 1000))
+    lines.append("sensor reads per tick: " + ", ".join(
+        "{} reads x {}".format(reads, ticks)
+        for reads, ticks in sorted(summary['reads_per_tick'].items(), key=lambda item: int(item[0]))))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Print a profile written with ROBOT_PROFILE")
+    parser.add_argument('profile')
+    args = parser.parse_args(argv)
+
+    with open(args.profile, 'r') as file:
+        print(report(json.load(file)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+# Driving along a recorded path
+#
+# The line follower only reacts: it steers once the color sensor has drifted off
+# the edge, so it has to slow down in every curve. With the path log of a completed
+# lap the robot knows the curves before it gets there. A ReferencePath holds the
+# logged positions of the line following rows with a grid of cells over them, the
+# PathFollower matches the pose (robotlib/odometry.py) to the path every tick and
+# looks lookahead cm further along it: the arc of the path from the matched point
+# to that point (pure pursuit) is added to the steering before the curve starts,
+# and the speed comes from the sharpest curve over the next brake_distance cm, so
+# the robot slows down before a curve and not in it.
+#
+# The arc starts at the matched point of the path and not at the pose: the pose
+# drifts sideways by a centimetre or so, which is wider than the edge of the line
+# the color sensor has to stay on. The sideways position is left to the line
+# follower, which keeps steering by the color reading and tracking where the line
+# was seen for the search. Off the path (or past its end) it steers alone.
+#
+# The path is read with struct alone, so it loads on the brick.
+import math
+
+from robotlib.trajectory import RECORD, read_header
+
+# Settings of the path follower, the same way as robotlib/follower.py
+#
+# lookahead      - cm along the path to the point steered at
+# pursuit_weight - share of the steering of the pure pursuit arc added to the line follower's
+# max_speed      - speed on straight path
+# min_speed      - speed in the sharpest curves
+# slow_down      - speed taken off per (1 / cm) of curvature ahead
+# brake_distance - cm ahead of the robot the curvature is looked at
+# max_offset     - cm off the path from which on the line follower steers alone
+# acceleration   - how fast the speed may rise again, in speed per second
+DEFAULTS = {
+    'lookahead': 12.0,
+    'pursuit_weight': 0.3,
+    'max_speed': 100,
+    'min_speed': 70,
+    'slow_down': 1000.0,
+    'brake_distance': 25.0,
+    'max_offset': 6.0,
+    'acceleration': 100.0,
+}
+
+SPACING = 1.0 # cm between the points of a reference path
+CELL = 10.0   # cm, side of the cells of the spatial index
+WINDOW = 40.0 # cm of path the match may move on in one tick
+CURVE_BASE = 10.0 # cm on either side of a point its curvature is measured over
+
+
+class ReferencePath(object):
+    # points - (x, y) positions along the path in driving order
+    # marks  - dict of state name -> (x, y) positions the state was logged at
+    def __init__(self, points, marks=None, spacing=SPACING, cell=CELL):
+        self.spacing = spacing
+        self.cell = cell
+        self.marks = marks or {}
+        self.points = resample(points, spacing)
+        if len(self.points) < 3:
+            raise ValueError("a reference path needs more than {} cm".format(2 * spacing))
+
+        # Curvature at every point (1 / cm, positive turning clockwise) from the
+        # heading change over CURVE_BASE cm on either side, the logged path wiggles
+        # with the line follower's steering
+        points = self.points
+        headings = [math.atan2(points[i + 1][0] - points[i][0], points[i + 1][1] - points[i][1])
+                    for i in range(len(points) - 1)]
+        headings.append(headings[-1])
+        base = max(1, int(CURVE_BASE / spacing))
+        last = len(points) - 1
+        self.curvatures = [wrap(headings[min(last, i + base)] - headings[max(0, i - base)]) /
+                           ((min(last, i + base) - max(0, i - base)) * spacing) for i in range(len(points))]
+        # Direction of the path at every point over the same distance
+        self.headings = [math.atan2(points[min(last, i + base)][0] - points[max(0, i - base)][0],
+                                    points[min(last, i + base)][1] - points[max(0, i - base)][1])
+                         for i in range(len(points))]
+
+        # Spatial index, (column, row) -> indexes of the points in the cell
+        self.grid = {}
+        for index, (x, y) in enumerate(points):
+            self.grid.setdefault(self.key(x, y), []).append(index)
+
+    # A method to load a binary path log (robotlib/trajectory.py): the rows of the
+    # states are the path, the rows of the mark states its marks
+    @classmethod
+    def load(cls, path, states=('moving',), marks=('grey_detected',), **kwargs):
+        points = []
+        marked = dict((name, []) for name in marks)
+        with open(path, 'rb') as file:
+            _, names, _ = read_header(file)
+            codes = set(code for code, name in enumerate(names) if name in states)
+            for _, x, y, _, state, _ in RECORD.iter_unpack(file.read()):
+                if state in codes:
+                    points.append((x, y))
+                elif names[state] in marked:
+                    marked[names[state]].append((x, y))
+        return cls(points, marked, **kwargs)
+
+    def key(self, x, y):
+        return int(math.floor(x / self.cell)), int(math.floor(y / self.cell))
+
+    # A method to find the point of the path closest to x, y. With the index of the
+    # last match it walks along the path from there while the points get closer (at
+    # most WINDOW cm), which takes a few steps per tick and never jumps to a part of
+    # the track the robot passes again later. Without it the cells around x, y are
+    # searched. Returns (index, distance in cm)
+    def match(self, x, y, last=None):
+        points = self.points
+        if last is None:
+            column, row = self.key(x, y)
+            candidates = [index for dc in (-1, 0, 1) for dr in (-1, 0, 1)
+                          for index in self.grid.get((column + dc, row + dr), ())]
+            best = min(candidates or range(len(points)),
+                       key=lambda index: (points[index][0] - x) ** 2 + (points[index][1] - y) ** 2)
+            return best, math.hypot(points[best][0] - x, points[best][1] - y)
+
+        best = last
+        distance = (points[best][0] - x) ** 2 + (points[best][1] - y) ** 2
+        for step in (1, -1):
+            end = min(len(points) - 1, last + int(WINDOW / self.spacing)) if step > 0 else 0
+            while best != end:
+                next_x, next_y = points[best + step]
+                next_distance = (next_x - x) ** 2 + (next_y - y) ** 2
+                if next_distance >= distance:
+                    break
+                best += step
+                distance = next_distance
+            if best != last:
+                break
+        return best, math.sqrt(distance)
+
+    # A method to check whether a mark of the state was logged within radius cm of x, y
+    def near(self, state, x, y, radius):
+        return any(math.hypot(mark_x - x, mark_y - y) <= radius for mark_x, mark_y in self.marks.get(state, ()))
+
+    # The point distance cm along the path after index, the last point at most
+    def ahead(self, index, distance):
+        return self.points[min(len(self.points) - 1, index + int(round(distance / self.spacing)))]
+
+    # The sharpest curvature over the distance cm after index
+    def curvature_ahead(self, index, distance):
+        end = min(len(self.points), index + int(distance / self.spacing) + 1)
+        return max(abs(curvature) for curvature in self.curvatures[index:end])
+
+
+# Angle wrapped into -pi..pi
+def wrap(angle):
+    return (angle + math.pi) % (2 * math.pi) - math.pi
+
+
+# A method to place points every spacing cm along a polyline
+def resample(points, spacing):
+    if not points:
+        return []
+    result = [points[0]]
+    carried = 0.0 # distance along the polyline since the last placed point
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        length = math.hypot(x1 - x0, y1 - y0)
+        if length == 0:
+            continue
+        position = spacing - carried
+        while position <= length:
+            share = position / length
+            result.append((x0 + (x1 - x0) * share, y0 + (y1 - y0) * share))
+            position += spacing
+        carried = length - (position - spacing)
+    return result
+
+
+# Steering of a MoveSteering for a curvature (1 / cm) of a robot with this axle
+def curvature_steering(curvature, axle):
+    # Between steering 0 and 100 the inner wheel runs at 1 - steering / 50 of the outer
+    turn = abs(curvature) * axle
+    steering = 100 * turn / (2 + turn)
+    return steering if curvature >= 0 else -steering
+
+
+class PathFollower(object):
+    # path          - ReferencePath
+    # pose          - object with x, y and heading (radians, clockwise) updated every tick,
+    #                 e.g. a PoseEstimator
+    # line_follower - LineFollower steering by the color reading
+    # axle          - distance between the wheels in cm
+    # settings      - overrides of DEFAULTS
+    def __init__(self, path, pose, line_follower, axle=12.0, **settings):
+        unknown = set(settings) - set(DEFAULTS)
+        if unknown:
+            raise ValueError("unknown path follower settings: {}".format(", ".join(sorted(unknown))))
+
+        self.path = path
+        self.pose = pose
+        self.line_follower = line_follower
+        self.axle = axle
+        self.settings = dict(DEFAULTS)
+        self.settings.update(settings)
+        self.index = None
+        self.offset = 0.0
+        self.reset()
+
+    # The color target is the line follower's
+    @property
+    def target(self):
+        return self.line_follower.target
+
+    @target.setter
+    def target(self, value):
+        self.line_follower.target = value
+
+    # A method to forget the history, done automatically after a pause in the updates.
+    # The match along the path is kept, maneuvers don't move the robot far
+    def reset(self):
+        self.line_follower.reset()
+        self.time = None
+        self.speed = self.settings['min_speed']
+
+    # A method to compute (steering, speed) from the snapshot of a tick, like LineFollower.update()
+    def update(self, snapshot):
+        s = self.settings
+        now = snapshot.time
+        if self.time is not None and now - self.time > 0.1:
+            self.reset()
+
+        pose = self.pose
+        self.index, self.offset = self.path.match(pose.x, pose.y, self.index)
+        color_steering, color_speed = self.line_follower.update(snapshot)
+        if self.offset > s['max_offset'] or self.index >= len(self.path.points) - 1:
+            self.speed = color_speed
+            self.time = now
+            return color_steering, color_speed
+
+        # Pure pursuit: the arc from the matched point through the lookahead point
+        path = self.path
+        x, y = path.points[self.index]
+        heading = path.headings[self.index]
+        ahead_x, ahead_y = path.ahead(self.index, s['lookahead'])
+        dx = ahead_x - x
+        dy = ahead_y - y
+        sideways = dx * math.cos(heading) - dy * math.sin(heading)
+        curvature = 2 * sideways / max(dx * dx + dy * dy, 1.0)
+        steering = color_steering + s['pursuit_weight'] * curvature_steering(curvature, self.axle)
+        steering = max(-100, min(100, steering))
+
+        # Slowing down is immediate, speeding up as fast as the acceleration allows
+        curvature = path.curvature_ahead(self.index, s['brake_distance'])
+        target_speed = max(s['min_speed'], s['max_speed'] - s['slow_down'] * curvature)
+        if self.time is None:
+            self.speed = min(target_speed, self.speed)
+        else:
+            self.speed = min(target_speed, self.speed + s['acceleration'] * (now - self.time))
+        self.time = now
+        return steering, self.speed
+
+    # Where the line was last seen, see LineFollower.last_seen()
+    def last_seen(self, snapshot):
+        return self.line_follower.last_seen(snapshot)
@@ -0,0 +1,181 @@
+# Replay recorded sensor traces through a lab program
+#
+#   python -m robotlib.replay myrobot/main.py traces/*.csv --jobs 8
+#
+# Every trace (recorded with ROBOT_TRACE, see robotlib/trace.py) is fed tick by tick
+# into the unchanged program running on the simulator backend: the sampler gets the
+# recorded sensor values instead of reading the devices, and the steering and speed
+# the program commands in each tick are compared with the recorded ones. A program
+# that ends before the trace does diverged too. Traces are replayed in parallel, one
+# program run per trace in a pool of worker processes.
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import runpy
+import sys
+import tempfile
+
+os.environ['ROBOT_BACKEND'] = 'sim'
+# The replayed programs must not record traces themselves
+os.environ.pop('ROBOT_TRACE', None)
+
+from robotlib.sampler import Sampler
+from robotlib.sim.world import set_world
+
+
+class TraceEnd(Exception):
+    pass
+
+
+# A method to read a trace into its column names and rows of floats
+def load_trace(path):
+    with open(path, 'r', newline='') as file:
+        reader = csv.reader(file)
+        names = next(reader)
+        rows = [[float(value) for value in row] for row in reader if row]
+    return names, rows
+
+
+# Stands in for the simulated world: time and sensor values come from the trace,
+# motor commands are collected per tick
+class ReplayWorld(object):
+    def __init__(self, names, rows):
+        self.columns = dict((name, index) for index, name in enumerate(names))
+        self.rows = rows
+        self.index = 0
+        self.steering = 0
+        self.speed = 0
+        self.commands = []
+        self.beeps = 0
+
+    def now(self):
+        return self.rows[self.index][self.columns['time']]
+
+    # The program finished a tick, keep its command and move on to the next recorded tick
+    def sleep(self, seconds):
+        self.commands.append((self.steering, self.speed))
+        self.index += 1
+        if self.index >= len(self.rows):
+            raise TraceEnd()
+
+    def field(self, name):
+        return self.rows[self.index][self.columns[name]]
+
+    # Readings taken outside of the sampler (e.g. the first one of a DistanceMonitor)
+    # get the recorded value of the tick
+    def ultrasonic_distance(self, address):
+        return self.field('distance') if 'distance' in self.columns else 255.0
+
+    def command(self, steering, speed):
+        self.steering = steering
+        self.speed = speed
+
+    def set_motor(self, address, percent):
+        pass
+
+    def gyro_reset(self, address):
+        pass
+
+    def beep(self):
+        self.beeps += 1
+
+
+# A method to run a program until the trace of a ReplayWorld (or a subclass) ends
+def run_program(program, world):
+    set_world(world)
+    Sampler.override = world.field
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            runpy.run_path(os.path.abspath(os.path.join(cwd, program)), run_name='__main__')
+        except TraceEnd:
+            pass
+        finally:
+            os.chdir(cwd)
+            Sampler.override = None
+
+
+# A method to replay one trace through a program and compare the commands
+def replay(program, trace, tolerance=0.5):
+    names, rows = load_trace(trace)
+    result = {'trace': trace, 'ticks': len(rows), 'replayed': 0, 'mismatches': 0,
+              'first_mismatch': None, 'max_steering_error': 0.0, 'max_speed_error': 0.0}
+    if not rows:
+        return result
+
+    world = ReplayWorld(names, rows)
+    run_program(program, world)
+
+    steering_column = names.index('steering')
+    speed_column = names.index('speed')
+    for tick, (steering, speed) in enumerate(world.commands):
+        steering_error = abs(steering - rows[tick][steering_column])
+        speed_error = abs(speed - rows[tick][speed_column])
+        result['max_steering_error'] = max(result['max_steering_error'], steering_error)
+        result['max_speed_error'] = max(result['max_speed_error'], speed_error)
+        if steering_error > tolerance or speed_error > tolerance:
+            result['mismatches'] += 1
+            if result['first_mismatch'] is None:
+                result['first_mismatch'] = tick
+    result['replayed'] = len(world.commands)
+    # The program ended before the recorded one did
+    if result['replayed'] < len(rows) and result['first_mismatch'] is None:
+        result['first_mismatch'] = result['replayed']
+    return result
+
+
+# True if a replay did not give the recorded commands for every recorded tick
+def diverged(result):
+    return result['mismatches'] > 0 or result['replayed'] != result['ticks']
+
+
+def _replay(arguments):
+    return replay(*arguments)
+
+
+# A method to replay many traces on all cores
+def replay_all(program, traces, tolerance=0.5, jobs=None):
+    pool = multiprocessing.Pool(jobs or multiprocessing.cpu_count())
+    try:
+        return list(pool.imap_unordered(_replay, [(program, trace, tolerance) for trace in traces], chunksize=4))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded sensor traces through a lab program")
+    parser.add_argument('program', help="path of the program, e.g. myrobot/main.py")
+    parser.add_argument('traces', nargs='+', help="trace files or glob patterns")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="allowed steering and speed difference")
+    parser.add_argument('--jobs', type=int, help="worker processes (all cores by default)")
+    parser.add_argument('--json', help="write the per trace results to this file")
+    args = parser.parse_args(argv)
+
+    traces = sorted(set(path for pattern in args.traces for path in (glob.glob(pattern) or [pattern])))
+    results = sorted(replay_all(args.program, traces, args.tolerance, args.jobs), key=lambda result: result['trace'])
+
+    failed = [result for result in results if diverged(result)]
+    for result in failed:
+        if result['mismatches']:
+            print("{trace}: {mismatches} of {replayed} ticks differ, first at tick {first_mismatch} "
+                  "(max steering error {max_steering_error:.2f}, max speed error {max_speed_error:.2f})".format(
+                      **result))
+        if result['replayed'] != result['ticks']:
+            print("{trace}: the program ended after {replayed} of {ticks} recorded ticks".format(**result))
+    print("{} of {} traces replayed identically ({} ticks)".format(
+        len(results) - len(failed), len(results), sum(result['replayed'] for result in results)))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
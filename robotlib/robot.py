@@ -0,0 +1,207 @@
+# A line following robot put together from the shared parts
+#
+# The lab programs used to repeat the same skeleton: build the devices at import,
+# sample the sensors, keep the color window, follow the line until it is lost,
+# search for it, and steer the whole thing with global flags. A Robot holds that
+# skeleton once and a program only configures it:
+#
+#   robot = Robot(devices, colors, sources=...)
+#   robot.follow_with(line_follower, target=..., lost=is_white, marks=[(is_grey, on_grey)])
+#   robot.search_with(line_search)
+#   robot.run()
+#
+# Every tick samples the sensors, runs the per tick checks (obstacles, logging),
+# steps the running maneuver and otherwise follows the line or starts a search.
+# Maneuvers are scheduler tasks (see robotlib/scheduler.py), the program ends when
+# one of them or a mark handler calls finish().
+from robotlib.calibration import sweep
+from robotlib.profiling import start_profiling
+from robotlib.sampler import Sampler
+from robotlib.scheduler import Scheduler
+from robotlib.sensor_window import SensorWindow
+from robotlib.trace import start_recording
+from robotlib import startup
+
+
+# The devices of a robot, built on first use: a program only pays for the ev3dev2
+# imports and the sysfs lookups of the devices it actually touches
+class Devices(object):
+    # specs - attribute name -> (class name, port names...) in robotlib.devices,
+    #         e.g. move_steering=('MoveSteering', 'OUTPUT_B', 'OUTPUT_C')
+    def __init__(self, **specs):
+        self._specs = specs
+
+    def __getattr__(self, name):
+        specs = self.__dict__.get('_specs', {})
+        if name not in specs:
+            raise AttributeError("no device {!r}".format(name))
+
+        # Importing the backend loads ev3dev2 on the brick, so it waits for the first device
+        from robotlib import devices
+        kind, ports = specs[name][0], specs[name][1:]
+        device = devices.get(kind)(*[devices.get(port) for port in ports])
+        setattr(self, name, device)
+        return device
+
+
+class Robot(object):
+    # devices - the robot's Devices, it needs a move_steering
+    # colors  - ColorClasses of the surfaces on the track
+    # sources - Sampler sources, snapshot attribute name -> function reading it
+    # size    - number of color readings kept in the window
+    # spans   - numbers of recent readings the window keeps band counts for
+    # period  - control loop period in seconds
+    def __init__(self, devices, colors, sources, size=15, spans=(15,), period=0.01):
+        self.devices = devices
+        self.colors = colors
+        self.sampler = Sampler(**sources)
+        self.window = SensorWindow(size, colors.bands, spans=spans)
+        self.scheduler = Scheduler(period=period)
+        self.profiler = None
+        self.recorder = None
+
+        # Functions of the snapshot run at the start of every tick, one returning
+        # True ends the tick (e.g. when it started a maneuver around an obstacle)
+        self.checks = []
+        # Functions of the snapshot run in the ticks a maneuver is stepped
+        self.on_maneuver = []
+        # Functions of the snapshot run at the start of every line following tick
+        self.on_follow = []
+
+        self.line_follower = None
+        self.target = None
+        self.lost = None
+        self.marks = []
+        self.line_search = None
+        self.give_up = False
+
+        self.following = True
+        self.complete = False
+        self.losses = 0 # times the line was lost while following it
+
+    # A method to set how the line is followed
+    #
+    # line_follower - a LineFollower
+    # target        - function returning the follower target for the current colors
+    # lost          - function(snapshot) returning True once the line is lost
+    # marks         - (detect, handle) pairs checked in order before steering: the
+    #                 first detect(snapshot) that returns True has handle(snapshot)
+    #                 called instead of steering in that tick
+    def follow_with(self, line_follower, target, lost, marks=()):
+        self.line_follower = line_follower
+        self.target = target
+        self.lost = lost
+        self.marks = list(marks)
+
+    # A method to set how a lost line is searched for, with give_up the program ends
+    # when the search fails, otherwise the next tick searches again
+    def search_with(self, line_search, give_up=False):
+        self.line_search = line_search
+        self.give_up = give_up
+
+    # A method to start trace recording, profiling and startup timing if they are
+    # enabled, run() does it if the program did not need the profiler before
+    def prepare(self):
+        if self.profiler is None:
+            move_steering = self.devices.move_steering
+            startup.phase('motors')
+            self.recorder = start_recording(self.sampler, move_steering, self.scheduler)
+            self.profiler = start_profiling(self.sampler, move_steering, self.scheduler)
+            startup.watch_motors(move_steering)
+        return self.profiler
+
+    # A method to read all sensors for the current tick and track the color value
+    def sample(self):
+        snapshot = self.sampler.sample()
+        if self.colors.adapt(snapshot.color):
+            self.use_colors()
+        self.window.push(snapshot.color)
+        return snapshot
+
+    # A method to apply changed color thresholds to the window and the line follower
+    def use_colors(self):
+        self.window.set_bands(self.colors.bands)
+        if self.line_follower is not None:
+            self.line_follower.target = self.target()
+
+    # True if a reading is inside the band of a surface
+    def within(self, name, value):
+        low, high = self.colors.bands[name]
+        return (low is None or value >= low) and (high is None or value <= high)
+
+    # True if the last count readings were all on a surface (the current reading
+    # alone until the window is full)
+    def steady(self, name, count, snapshot):
+        if not self.window.is_full():
+            return self.within(name, snapshot.color)
+        return self.window.all_in(name, count)
+
+    # True if the current reading and at least count of the last span readings are on a surface
+    def mostly(self, name, count, span, snapshot):
+        return self.within(name, snapshot.color) and self.window.at_least(name, count, span)
+
+    # A task to fit the color thresholds to the surfaces around the start
+    def calibrate(self):
+        yield from sweep(self.devices.move_steering, self.colors)
+        self.use_colors()
+
+    # A method to end the program after the current tick (run() then writes out the
+    # trace, which still records this tick)
+    def finish(self):
+        self.complete = True
+        self.devices.move_steering.off()
+
+    # A method to run one control tick
+    def tick(self):
+        snapshot = self.sample()
+        for check in self.checks:
+            if check(snapshot):
+                return
+        if self.scheduler.busy():
+            for watch in self.on_maneuver:
+                watch(snapshot)
+            if self.scheduler.step(snapshot):
+                return
+        if self.following:
+            self.follow(snapshot)
+        else:
+            self.scheduler.start(self.search(*self.line_follower.last_seen(snapshot)))
+
+    # A method to steer along the line for one tick
+    def follow(self, snapshot):
+        for watch in self.on_follow:
+            watch(snapshot)
+        if self.lost(snapshot):
+            self.following = False
+            self.losses += 1
+            return
+        for detect, handle in self.marks:
+            if detect(snapshot):
+                handle(snapshot)
+                return
+
+        steering, speed = self.line_follower.update(snapshot)
+        self.devices.move_steering.on(steering=steering, speed=speed)
+
+    # A task to search for the line from where it was last seen
+    def search(self, side, last_seen):
+        found = yield from self.line_search.run(side, last_seen)
+        if found:
+            self.following = True
+        elif self.give_up:
+            self.complete = True
+
+    # A method to run the program, it starts with the calibration sweep. The motors
+    # are stopped and the trace is written out at the end even if the program crashed,
+    # so the whole trace is in the file when run() returns
+    def run(self, calibrate=True):
+        profiler = self.prepare()
+        if calibrate:
+            self.scheduler.start(self.calibrate())
+        startup.phase('loop')
+        try:
+            self.scheduler.run(profiler.wrap('tick', self.tick), lambda: self.complete)
+        finally:
+            self.devices.move_steering.off()
+            if self.recorder is not None:
+                self.recorder.close()
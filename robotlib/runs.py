@@ -0,0 +1,273 @@
+# Per-run log directories and the statistics of many runs
+#
+# Every run of a lab program writes its logs into a directory of its own under
+# runs/, named by the date and time of the start and a random suffix (the brick's
+# clock may be off, the suffix keeps the names apart), so no run overwrites
+# another. new_run() only needs the standard library and runs on the brick.
+#
+# collect streams any number of path logs (robotlib/trajectory.py) into a store of
+# NPZ shards: a worker pool reads the logs and computes every run's statistics, the
+# runs are written a few hundred per shard, each with a table of the runs and the
+# rows of all their logs in columns. Logs already in the store are skipped, so the
+# store can be updated every day. stats reads only the run tables.
+#
+#   python -m robotlib.runs collect store runs/*/robot_path.bin --reference best/robot_path.bin
+#   python -m robotlib.runs stats store --by day
+#
+# The statistics of a run are its lap time (program_start to program_end), the
+# times the grey crosses were detected at, the length of the logged path and, with
+# a reference log, how far the line following rows were from the reference path.
+#
+# Only os and time are imported up front, the brick imports this module for new_run().
+import os
+import time
+
+ROOT = 'runs'
+SHARD_RUNS = 500
+CHUNK_ROWS = 2000 # path rows measured against the reference path at a time
+
+# Columns of the run tables
+RUN_FIELDS = [('run', 'U64'), ('start_time', '<f8'), ('lap_time', '<f8'), ('finished', '?'),
+              ('crosses', '<i4'), ('first_cross', '<f8'), ('second_cross', '<f8'), ('path_length', '<f8'),
+              ('deviation_mean', '<f8'), ('deviation_max', '<f8'), ('rows', '<i8'), ('offset', '<i8')]
+
+
+# A method to create the log directory of a new run, returns its path
+def new_run(root=ROOT):
+    while True:
+        path = os.path.join(root, time.strftime('%Y%m%d-%H%M%S') + '-' + os.urandom(2).hex())
+        try:
+            os.makedirs(path)
+            return path
+        except FileExistsError:
+            continue
+
+
+# The id of the run a log belongs to, the name of its run directory
+def run_id(path):
+    return os.path.basename(os.path.dirname(os.path.abspath(path)))
+
+
+# A method to compute the statistics of one path log, returns (table row, columns
+# of the log rows, state names)
+def analyze(path, reference=None):
+    import numpy as np
+    from robotlib.trajectory import open_trajectory
+
+    records, states, start_time = open_trajectory(path)
+    code = dict((name, states.index(name)) for name in states)
+    times = np.asarray(records['time'], dtype=np.float64)
+    state = np.asarray(records['state'])
+    x = np.asarray(records['x'], dtype=np.float64)
+    y = np.asarray(records['y'], dtype=np.float64)
+
+    def times_of(name):
+        return times[state == code[name]] if name in code else times[:0]
+
+    started = times_of('program_start')
+    ended = times_of('program_end')
+    first = started[0] if len(started) else (times[0] if len(times) else 0.0)
+    finished = len(ended) > 0
+    last = ended[0] if finished else (times[-1] if len(times) else first)
+    crosses = times_of('grey_detected') - first
+
+    deviation_mean = deviation_max = float('nan')
+    if reference is not None:
+        following = state == code.get('moving', -1)
+        distances = nearest_distances(x[following], y[following], reference)
+        if len(distances):
+            deviation_mean = float(distances.mean())
+            deviation_max = float(distances.max())
+
+    row = (run_id(path), start_time, last - first, finished, len(crosses),
+           crosses[0] if len(crosses) > 0 else float('nan'), crosses[1] if len(crosses) > 1 else float('nan'),
+           float(np.hypot(np.diff(x), np.diff(y)).sum()), deviation_mean, deviation_max, len(records), 0)
+    columns = dict((name, np.array(records[name])) for name in records.dtype.names)
+    return row, columns, states
+
+
+# Distances of points to the nearest point of a reference path (an array of x, y rows)
+def nearest_distances(x, y, reference):
+    import numpy as np
+
+    distances = []
+    for start in range(0, len(x), CHUNK_ROWS):
+        dx = x[start:start + CHUNK_ROWS, None] - reference[None, :, 0]
+        dy = y[start:start + CHUNK_ROWS, None] - reference[None, :, 1]
+        distances.append(np.sqrt((dx * dx + dy * dy).min(axis=1)))
+    return np.concatenate(distances) if distances else np.zeros(0)
+
+
+# The reference path of a log, its line following rows resampled every cm
+def load_reference(path):
+    import numpy as np
+    from robotlib.pursuit import ReferencePath
+
+    return np.array(ReferencePath.load(path).points, dtype=np.float64)
+
+
+def _analyze(arguments):
+    return analyze(*arguments)
+
+
+# A method to write one shard of analyzed runs
+def write_shard(path, analyzed):
+    import numpy as np
+
+    names = []
+    for _, _, states in analyzed:
+        names.extend(name for name in states if name not in names)
+    codes = dict((name, code) for code, name in enumerate(names))
+
+    table = []
+    columns = {}
+    offset = 0
+    for index, (row, log, states) in enumerate(analyzed):
+        table.append(row[:-1] + (offset,))
+        offset += row[-2]
+        # State codes of the shard's list of names
+        remap = np.array([codes[name] for name in states], dtype=np.uint8)
+        log = dict(log, state=remap[log['state']] if len(states) else log['state'],
+                   run=np.full(len(log['time']), index, dtype=np.int32))
+        for name, values in log.items():
+            columns.setdefault(name, []).append(values)
+
+    arrays = dict(('rows_' + name, np.concatenate(values)) for name, values in columns.items())
+    np.savez(path, runs=np.array(table, dtype=np.dtype(RUN_FIELDS)), states=np.array(names), **arrays)
+
+
+# A method to read the run tables of a store, without the log rows
+def load_runs(store):
+    import glob
+    import numpy as np
+
+    tables = []
+    for path in sorted(glob.glob(os.path.join(store, 'shard_*.npz'))):
+        with np.load(path) as shard:
+            tables.append(shard['runs'])
+    if not tables:
+        return np.zeros(0, dtype=np.dtype(RUN_FIELDS))
+    return np.concatenate(tables)
+
+
+# A method to add path logs to a store, returns the number of runs added
+def collect(store, paths, reference=None, jobs=None, shard_runs=SHARD_RUNS):
+    import glob
+    import multiprocessing
+
+    if not os.path.isdir(store):
+        os.makedirs(store)
+    known = set(load_runs(store)['run'].tolist())
+    paths = [path for path in paths if run_id(path) not in known]
+    if not paths:
+        return 0
+
+    reference_points = load_reference(reference) if reference else None
+    shard = len(glob.glob(os.path.join(store, 'shard_*.npz')))
+    pool = multiprocessing.Pool(jobs or multiprocessing.cpu_count())
+    try:
+        batch = []
+        for analyzed in pool.imap(_analyze, [(path, reference_points) for path in paths], chunksize=4):
+            batch.append(analyzed)
+            if len(batch) == shard_runs:
+                write_shard(os.path.join(store, 'shard_{:05d}.npz'.format(shard)), batch)
+                shard += 1
+                batch = []
+        if batch:
+            write_shard(os.path.join(store, 'shard_{:05d}.npz'.format(shard)), batch)
+    finally:
+        pool.close()
+        pool.join()
+    return len(paths)
+
+
+# The day a run started on, from the date in its id (the simulator's clock starts at
+# 0) or else from the start time in its log
+def day(run, start_time):
+    try:
+        return time.strftime('%Y-%m-%d', time.strptime(run[:8], '%Y%m%d'))
+    except ValueError:
+        return time.strftime('%Y-%m-%d', time.localtime(start_time))
+
+
+# A method to summarize the runs of a store, grouped by the day they started on
+# (by='day') or all together. Returns a list of (group, summary dict)
+def summarize(runs, by=None):
+    import numpy as np
+
+    if by == 'day':
+        groups = np.array([day(run, start) for run, start in zip(runs['run'].tolist(), runs['start_time'].tolist())])
+    else:
+        groups = np.array(['all'] * len(runs))
+
+    def statistics(values):
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return None
+        return {'mean': float(values.mean()), 'median': float(np.median(values)),
+                'p90': float(np.percentile(values, 90)), 'min': float(values.min()), 'max': float(values.max())}
+
+    summaries = []
+    for group in sorted(set(groups.tolist())):
+        selected = runs[groups == group]
+        finished = selected[selected['finished']]
+        summaries.append((group, {
+            'runs': len(selected),
+            'finished': len(finished),
+            'lap_time': statistics(finished['lap_time']),
+            'first_cross': statistics(selected['first_cross']),
+            'second_cross': statistics(selected['second_cross']),
+            'path_length': statistics(finished['path_length']),
+            'deviation_mean': statistics(selected['deviation_mean']),
+            'deviation_max': statistics(selected['deviation_max']),
+        }))
+    return summaries
+
+
+def main(argv=None):
+    import argparse
+    import glob
+    import json
+
+    parser = argparse.ArgumentParser(description="Collect path logs of many runs into a store and compare them")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    collect_parser = commands.add_parser('collect', help="add path logs to a store")
+    collect_parser.add_argument('store', help="directory of the NPZ shards")
+    collect_parser.add_argument('logs', nargs='+', help="binary path logs or glob patterns")
+    collect_parser.add_argument('--reference', help="path log the deviation of the runs is measured against")
+    collect_parser.add_argument('--jobs', type=int, help="worker processes (all cores by default)")
+    collect_parser.add_argument('--shard-runs', type=int, default=SHARD_RUNS, help="runs per shard")
+
+    stats_parser = commands.add_parser('stats', help="print the statistics of the runs in a store")
+    stats_parser.add_argument('store')
+    stats_parser.add_argument('--by', choices=['day'], help="group the runs by the day they started on")
+    stats_parser.add_argument('--json', help="write the statistics to this file")
+    args = parser.parse_args(argv)
+
+    if args.command == 'collect':
+        started = time.time()
+        paths = sorted(set(path for pattern in args.logs for path in (glob.glob(pattern) or [pattern])))
+        added = collect(args.store, paths, args.reference, args.jobs, args.shard_runs)
+        print("{} of {} runs added in {:.2f} s".format(added, len(paths), time.time() - started))
+        return 0
+
+    summaries = summarize(load_runs(args.store), args.by)
+    for group, summary in summaries:
+        print("{}: {} runs, {} finished".format(group, summary['runs'], summary['finished']))
+        for name in ('lap_time', 'first_cross', 'second_cross', 'path_length', 'deviation_mean', 'deviation_max'):
+            values = summary[name]
+            if values is not None:
+                print("  {:15s} mean {mean:8.2f}  median {median:8.2f}  p90 {p90:8.2f}  "
+                      "min {min:8.2f}  max {max:8.2f}".format(name, **values))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(summaries, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+
+    sys.exit(main())
@@ -0,0 +1,48 @@
+# Sensor sampling, once per control tick
+#
+# Every sensor property read on the EV3 is a sysfs file read. Instead of reading the
+# color sensor in every helper that needs it, the control loop samples all sensors
+# once at the start of a tick and every decision in that tick uses the snapshot.
+from robotlib.clock import now
+
+
+# The sensor values of one control tick, attributes are named after the sampler sources
+class Snapshot(object):
+    pass
+
+
+class Sampler(object):
+    # When set, snapshots are filled by override(name) instead of reading the
+    # sensors (used by robotlib.replay to feed recorded traces)
+    override = None
+
+    # clock   - function returning the current time, stored as snapshot.time
+    # sources - keyword arguments of snapshot attribute name -> function reading it
+    def __init__(self, clock=now, **sources):
+        self.clock = clock
+        self.ticks = 0
+        self.reads = 0
+        self._sources = sorted(sources.items())
+        self.names = [name for name, _ in self._sources]
+
+        # The same snapshot object is refilled every tick so sampling allocates nothing new
+        self.snapshot = Snapshot()
+        self.snapshot.time = None
+        for name, _ in self._sources:
+            setattr(self.snapshot, name, None)
+
+    # A method to replace every read function with wrapper(name, read), e.g. to time it
+    def instrument(self, wrapper):
+        self._sources = [(name, wrapper(name, read)) for name, read in self._sources]
+
+    # A method to read every sensor once and return the filled snapshot
+    def sample(self):
+        snapshot = self.snapshot
+        snapshot.time = self.clock()
+        override = Sampler.override
+        for name, read in self._sources:
+            setattr(snapshot, name, read() if override is None else override(name))
+
+        self.ticks += 1
+        self.reads += len(self._sources)
+        return snapshot
@@ -0,0 +1,89 @@
+# Fixed-rate control loop
+#
+# Sleeping a fixed 10 ms after every pass makes the real period drift with however
+# long the pass took. The scheduler instead sleeps until the next deadline, keeps
+# the deadlines on a fixed grid and counts the ticks that overran their period.
+#
+# Long maneuvers (turning to an angle, driving until a color is seen) are written as
+# tasks: generators that yield once per tick and get the tick's sensor snapshot
+# back from the yield, e.g.
+#
+#     def spin():
+#         move_steering.on(steering=100, speed=20)
+#         snapshot = yield
+#         while snapshot.gyro < 345:
+#             snapshot = yield
+#
+# The scheduler steps the running task once per tick, so the rest of the tick
+# (obstacle checks, logging) keeps running while the robot turns.
+from robotlib.clock import now, sleep
+
+
+class Scheduler(object):
+    def __init__(self, period=0.01, clock=now, sleep=sleep):
+        self.period = period
+        self.clock = clock
+        self.sleep = sleep
+        self.task = None
+
+        # Functions called after every tick (e.g. trace recording)
+        self.after_tick = []
+
+        # Loop timing statistics
+        self.ticks = 0
+        self.overruns = 0
+        self.max_lateness = 0.0
+
+    # A method to call tick() every period until done() returns True
+    def run(self, tick, done):
+        deadline = self.clock()
+        while not done():
+            tick()
+            for function in self.after_tick:
+                function()
+            self.ticks += 1
+
+            deadline += self.period
+            delay = deadline - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+            else:
+                # The tick took longer than its period, skip the missed deadlines
+                # instead of running a burst of short ticks to catch up
+                self.overruns += 1
+                self.max_lateness = max(self.max_lateness, -delay)
+                deadline += (int(-delay / self.period) + 1) * self.period
+                # The clock moved on since delay was read, time.sleep() raises on a
+                # negative length if that put the new deadline behind it too
+                self.sleep(max(0.0, deadline - self.clock()))
+
+    # A method to make a task the running one, it runs up to its first yield right away
+    def start(self, task):
+        self.task = task
+        self._advance(None)
+
+    # A method to stop the running task
+    def cancel(self):
+        if self.task is not None:
+            self.task.close()
+            self.task = None
+
+    def busy(self):
+        return self.task is not None
+
+    # A method to step the running task with the tick's snapshot,
+    # returns False when there is no task (anymore)
+    def step(self, snapshot):
+        if self.task is None:
+            return False
+        self._advance(snapshot)
+        return self.task is not None
+
+    def _advance(self, snapshot):
+        task = self.task
+        try:
+            task.send(snapshot)
+        except StopIteration:
+            # A task may have started another one before finishing
+            if self.task is task:
+                self.task = None
@@ -0,0 +1,109 @@
+# Finding the line again after losing it
+#
+# The old searches swept a fixed schedule: left by an angle, right by twice the
+# angle, back to the middle, then the same with a wider angle, each sweep going
+# over the ground the previous one had already seen. This search
+#
+#   - first tries the offsets it found the line at in earlier searches that started
+#     the same way (the robot turning to the same side), so losing the line on the
+#     same curve again is a short turn
+#   - then turns back to the heading where the line was last seen, a bit past it
+#   - then widens the sweep alternately on the likely side and the other one
+#
+# It keeps the covered arc (relative to the heading the search started at), skips
+# targets inside it and turns fast while crossing it, so only new ground is swept
+# at the scanning speed. Readings that look like the line slow the turn down, so a
+# check that needs several readings in a row gets them before the line is passed.
+
+
+class LineSearch(object):
+    # move_steering - the robot's MoveSteering
+    # found         - function(snapshot) returning True once the line is under the sensor
+    # near          - function(snapshot) returning True for a reading that may be the line
+    # angles        - sweep widths in degrees, the search fails after the widest one
+    # speed         - turning speed over new ground
+    # fast_speed    - turning speed over ground already covered
+    # creep_speed   - turning speed while near() is True
+    # margin        - degrees to sweep past a heading where the line is expected
+    # memory        - number of found offsets to remember
+    def __init__(self, move_steering, found, near=None, angles=(30, 60, 90, 120, 150, 180), speed=20,
+                 fast_speed=40, creep_speed=10, margin=15, memory=5):
+        self.move_steering = move_steering
+        self.found = found
+        self.near = near
+        self.angles = angles
+        self.speed = speed
+        self.fast_speed = fast_speed
+        self.creep_speed = creep_speed
+        self.margin = margin
+        self.memory = memory
+
+        # (side, offset) of the headings the line was found at, relative to the
+        # heading the search started at, newest last
+        self.history = []
+
+    # A method to list the headings to sweep to, relative to the start heading
+    def targets(self, side, last_seen=None):
+        targets = [self.past(offset) for seen_side, offset in reversed(self.history) if seen_side == side]
+        if last_seen is not None:
+            targets.append(self.past(last_seen))
+        for angle in self.angles:
+            targets.append(side * angle)
+            targets.append(-side * angle)
+        return targets
+
+    # The search task, run it with "found = yield from search.run(...)"
+    #
+    # side      - 1 if the robot was turning clockwise when it lost the line, -1 if not,
+    #             the side the widening sweep starts on and the key of the remembered offsets
+    # last_seen - heading where the line was last seen relative to the current one, if known
+    #
+    # Returns True with the robot still turning over the line, or False with the
+    # motors stopped when the widest sweep did not find it.
+    def run(self, side=1, last_seen=None):
+        side = side or 1
+        snapshot = yield
+        start = snapshot.gyro
+        low = high = 0
+
+        for target in self.targets(side, last_seen):
+            if low <= target <= high:
+                continue
+            direction = 1 if target > snapshot.gyro - start else -1
+            current_speed = None
+
+            while True:
+                angle = snapshot.gyro - start
+                if self.found(snapshot):
+                    self.remember(side, angle)
+                    return True
+                if (angle - target) * direction >= 0:
+                    break
+
+                # Cross the covered arc fast, scan new ground slowly
+                if self.near is not None and self.near(snapshot):
+                    speed = self.creep_speed
+                elif low < angle < high:
+                    speed = self.fast_speed
+                else:
+                    speed = self.speed
+                if speed != current_speed:
+                    self.move_steering.on(steering=100 * direction, speed=speed)
+                    current_speed = speed
+                low = min(low, angle)
+                high = max(high, angle)
+                snapshot = yield
+
+            low = min(low, snapshot.gyro - start)
+            high = max(high, snapshot.gyro - start)
+
+        self.move_steering.off()
+        return False
+
+    # The target to sweep to for a heading where the line is expected
+    def past(self, offset):
+        return offset + (self.margin if offset >= 0 else -self.margin)
+
+    def remember(self, side, offset):
+        self.history.append((side, offset))
+        del self.history[:-self.memory]
@@ -0,0 +1,103 @@
+# A fixed-size history of sensor readings
+#
+# The robots used to keep the last readings in a list, pop(0) the oldest one and
+# rescan a slice of the list on every color check. SensorWindow keeps the readings
+# in a preallocated ring buffer instead and maintains running counts of how many of
+# the most recent readings fall into every color band. Pushing a reading and asking
+# "how many of the last 5 readings were grey" are both O(1) and allocate nothing.
+
+
+class SensorWindow(object):
+    # size  - number of readings kept
+    # bands - dict of band name -> (low, high) inclusive limits, None for an open end.
+    #         Bands may overlap (e.g. black and green are both dark)
+    # spans - numbers of most recent readings for which band counts are kept
+    def __init__(self, size, bands, spans):
+        self.size = size
+        self.length = 0
+
+        self._values = [0] * size
+        self._masks = [0] * size
+        self._head = 0 # index the next reading goes to
+
+        self._index = {}
+        self._limits = []
+        for index, name in enumerate(sorted(bands)):
+            self._index[name] = index
+            self._limits.append(bands[name])
+
+        # counts[span][band] is the number of the last span readings inside the band
+        self._spans = sorted(set(spans))
+        for span in self._spans:
+            if not 0 < span <= size:
+                raise ValueError("span {} does not fit a window of {}".format(span, size))
+        self._counts = dict((span, [0] * len(self._limits)) for span in self._spans)
+
+    # A method to add the most recent reading
+    def push(self, value):
+        mask = 0
+        bit = 1
+        for low, high in self._limits:
+            if (low is None or value >= low) and (high is None or value <= high):
+                mask |= bit
+            bit <<= 1
+
+        head = self._head
+        for span in self._spans:
+            counts = self._counts[span]
+            # The reading that falls out of this span
+            if self.length >= span:
+                self._update(counts, self._masks[(head - span) % self.size], -1)
+            self._update(counts, mask, 1)
+
+        self._values[head] = value
+        self._masks[head] = mask
+        self._head = (head + 1) % self.size
+        if self.length < self.size:
+            self.length += 1
+
+    # A method to change the band limits, the counts are rebuilt from the kept readings
+    def set_bands(self, bands):
+        for name, limits in bands.items():
+            self._limits[self._index[name]] = limits
+
+        values = [self._values[(self._head - self.length + index) % self.size] for index in range(self.length)]
+        self.clear()
+        for value in values:
+            self.push(value)
+
+    # A method to empty the window, e.g. after the thresholds changed
+    def clear(self):
+        self.length = 0
+        self._head = 0
+        for counts in self._counts.values():
+            for band in range(len(counts)):
+                counts[band] = 0
+
+    def is_full(self):
+        return self.length == self.size
+
+    # The most recent reading
+    def latest(self):
+        return self._values[(self._head - 1) % self.size]
+
+    # Number of the last span readings that were inside the band
+    def count(self, band, span):
+        return self._counts[span][self._index[band]]
+
+    # Whether all of the last span readings were inside the band
+    def all_in(self, band, span):
+        return self.length >= span and self._counts[span][self._index[band]] == span
+
+    # Whether at least needed of the last span readings were inside the band
+    def at_least(self, band, needed, span):
+        return self._counts[span][self._index[band]] >= needed
+
+    @staticmethod
+    def _update(counts, mask, step):
+        band = 0
+        while mask:
+            if mask & 1:
+                counts[band] += step
+            mask >>= 1
+            band += 1
@@ -0,0 +1,5 @@
+# A hardware-free stand-in for the ev3dev2 devices used by the lab robots.
+#
+# world.World simulates a differential drive robot on a track.Track, devices.py
+# exposes it through the ev3dev2 classes the programs use and run.py runs a lab
+# program against it. Select it with ROBOT_BACKEND=sim.
@@ -0,0 +1,103 @@
+# Simulated versions of the ev3dev2 devices used by the lab robots
+#
+# Only the parts of the ev3dev2 API the programs use are provided. Every device
+# forwards to the current world (see world.get_world()), so a new world can be
+# set between runs without rebuilding the devices.
+from robotlib.sim.world import get_world, LEFT_MOTOR, RIGHT_MOTOR
+
+OUTPUT_A = 'outA'
+OUTPUT_B = LEFT_MOTOR
+OUTPUT_C = RIGHT_MOTOR
+OUTPUT_D = 'outD'
+INPUT_1 = 'in1'
+INPUT_2 = 'in2'
+INPUT_3 = 'in3'
+INPUT_4 = 'in4'
+
+
+class Motor(object):
+    def __init__(self, address):
+        self.address = address
+
+    @property
+    def position(self):
+        return get_world().motor_position(self.address)
+
+    @property
+    def speed(self):
+        return get_world().motor_speed(self.address)
+
+
+class MoveSteering(object):
+    def __init__(self, left_motor_port, right_motor_port, desc=None, motor_class=None):
+        self.left_motor = Motor(left_motor_port)
+        self.right_motor = Motor(right_motor_port)
+
+    # Same split of speed between the wheels as ev3dev2's MoveSteering
+    def get_speed_steering(self, steering, speed):
+        if not -100 <= steering <= 100:
+            raise ValueError("{} is an invalid steering, must be between -100 and 100 (inclusive)".format(steering))
+
+        left_speed = speed
+        right_speed = speed
+        speed_factor = (50 - abs(float(steering))) / 50
+        if steering >= 0:
+            right_speed *= speed_factor
+        else:
+            left_speed *= speed_factor
+        return left_speed, right_speed
+
+    def on(self, steering, speed, brake=True, block=False):
+        left_speed, right_speed = self.get_speed_steering(steering, speed)
+        world = get_world()
+        world.command(steering, speed)
+        world.set_motor(self.left_motor.address, left_speed)
+        world.set_motor(self.right_motor.address, right_speed)
+
+    def off(self, brake=True):
+        world = get_world()
+        world.command(0, 0)
+        world.set_motor(self.left_motor.address, 0)
+        world.set_motor(self.right_motor.address, 0)
+
+
+class ColorSensor(object):
+    def __init__(self, address=None):
+        self.address = address or 'color'
+
+    @property
+    def reflected_light_intensity(self):
+        return get_world().reflected_light(self.address)
+
+
+class GyroSensor(object):
+    def __init__(self, address=None):
+        self.address = address or 'gyro'
+
+    @property
+    def angle(self):
+        return get_world().gyro_angle(self.address)
+
+    @property
+    def rate(self):
+        return get_world().gyro_rate(self.address)
+
+    def reset(self):
+        get_world().gyro_reset(self.address)
+
+
+class UltrasonicSensor(object):
+    def __init__(self, address=None):
+        self.address = address or 'ultrasonic'
+
+    @property
+    def distance_centimeters(self):
+        return get_world().ultrasonic_distance(self.address)
+
+
+class Sound(object):
+    def beep(self, *args, **kwargs):
+        get_world().beep()
+
+    def speak(self, *args, **kwargs):
+        pass
@@ -0,0 +1,131 @@
+# Run a lab program against the simulator
+#
+#   python -m robotlib.sim.run myrobot_2/main.py --laps 100
+#
+# Every lap runs the program from scratch in a fresh world inside a temporary
+# directory (so files like robot_path.csv don't pile up) and reports the simulated
+# lap time, whether the program finished the course, the distance driven and how
+# often the program lost the line. A program that returns before the time limit has
+# only finished if the robot stopped in the track's finish area and its mission (if
+# it has one with an end) got to the end, a program that took the wrong landmark for
+# the last one ended early.
+import argparse
+import json
+import os
+import runpy
+import sys
+import tempfile
+import time
+
+os.environ['ROBOT_BACKEND'] = 'sim'
+
+from robotlib.sim import tracks
+from robotlib.sim.world import World, SimTimeout, set_world
+
+
+# A method to run one lap of a program and return its result
+def run_lap(program, track, lap=0, time_limit=300.0, color_noise=0.0, gyro_drift=0.0, seed=0,
+            trace_dir=None, light=1.0, light_drift=0.0, glitches=0.0):
+    world = World(tracks.load(track), color_noise=color_noise, light=light, light_drift=light_drift,
+                  ultrasonic_glitches=glitches, gyro_drift=gyro_drift, time_limit=time_limit, seed=seed + lap)
+    set_world(world)
+
+    program = os.path.abspath(program)
+    cwd = os.getcwd()
+    started = time.time()
+    losses = None
+    finished = None # None when the lap timed out
+
+    # Let the program record a sensor trace of the lap (see robotlib/trace.py), only
+    # for this lap: the variable is put back afterwards
+    trace = os.environ.pop('ROBOT_TRACE', None)
+    if trace_dir:
+        os.environ['ROBOT_TRACE'] = os.path.abspath(os.path.join(trace_dir, "lap_{:04d}.csv".format(lap)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            namespace = runpy.run_path(program, run_name='__main__')
+            # The programs built on robotlib.robot keep their Robot in 'robot' and
+            # their Mission in 'mission'
+            losses = getattr(namespace.get('robot'), 'losses', None)
+            mission = namespace.get('mission')
+            finished = world.track.at_finish(world.x, world.y) and (
+                mission is None or not mission.ends or mission.over())
+        except SimTimeout:
+            pass
+        finally:
+            os.chdir(cwd)
+            if trace is None:
+                os.environ.pop('ROBOT_TRACE', None)
+            else:
+                os.environ['ROBOT_TRACE'] = trace
+
+    return {
+        'lap': lap,
+        'finished': bool(finished),
+        'ended_early': finished is False,
+        'time': round(world.time, 3),
+        'distance': round(world.odometer, 1),
+        'position': (round(world.x, 1), round(world.y, 1)),
+        'beeps': world.beeps,
+        'losses': losses,
+        'wall_time': round(time.time() - started, 3),
+    }
+
+
+# How a lap ended, for the lap lines
+def lap_state(result):
+    if result['finished']:
+        return 'finished'
+    return 'ended early' if result['ended_early'] else 'timed out'
+
+
+# Default track of a program, picked from the name of its directory
+def program_track(program):
+    name = os.path.basename(os.path.dirname(os.path.abspath(program)))
+    return tracks.PROGRAM_TRACKS.get(name, 'green_line')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a lab program on the simulated track")
+    parser.add_argument('program', help="path of the program, e.g. myrobot/main.py")
+    parser.add_argument('--track', choices=sorted(tracks.TRACKS), help="track to drive on")
+    parser.add_argument('--laps', type=int, default=1)
+    parser.add_argument('--time-limit', type=float, default=300.0, help="simulated seconds per lap")
+    parser.add_argument('--noise', type=float, default=0.0, help="color sensor noise (standard deviation)")
+    parser.add_argument('--light', type=float, default=1.0, help="scale of the reflected light")
+    parser.add_argument('--light-drift', type=float, default=0.0, help="change of the light scale per second")
+    parser.add_argument('--glitches', type=float, default=0.0, help="share of stray ultrasonic readings")
+    parser.add_argument('--drift', type=float, default=0.0, help="gyro drift in degrees per second")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="write the lap results to this file")
+    parser.add_argument('--config', help="json file of settings overriding the program's (ROBOT_CONFIG)")
+    parser.add_argument('--trace-dir', help="record a sensor trace of every lap into this directory")
+    args = parser.parse_args(argv)
+
+    track = args.track or program_track(args.program)
+    if args.config:
+        os.environ['ROBOT_CONFIG'] = os.path.abspath(args.config)
+    if args.trace_dir and not os.path.isdir(args.trace_dir):
+        os.makedirs(args.trace_dir)
+    started = time.time()
+    results = []
+    for lap in range(args.laps):
+        result = run_lap(args.program, track, lap, args.time_limit, args.noise, args.drift, args.seed,
+                         args.trace_dir, args.light, args.light_drift, args.glitches)
+        results.append(result)
+        print("lap {lap}: {state} after {time:.2f} s, {distance} cm driven ({wall_time:.2f} s wall time)".format(
+            state=lap_state(result), **result))
+
+    finished = [result for result in results if result['finished']]
+    print("{} of {} laps finished, {:.2f} s wall time".format(len(finished), len(results), time.time() - started))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'program': args.program, 'track': track, 'laps': results}, file, indent=2)
+    return 0 if len(finished) == len(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
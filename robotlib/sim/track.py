@@ -0,0 +1,135 @@
+# A 2D model of a track mat
+#
+# Coordinates are in cm with x pointing right and y pointing forward (up the mat).
+# The surface is rasterized into a grid of reflected light values once when it is
+# painted, so reading the color sensor is a couple of array lookups.
+import math
+
+
+class Track(object):
+    # width, height - mat size in cm
+    # background    - reflected light value of the bare mat
+    # resolution    - raster cell size in cm
+    # start         - robot start pose (x, y, heading in degrees, clockwise from +y)
+    # finish        - area (x0, y0, x1, y1) the robot stops in at the real end of the
+    #                 course, None if any place counts
+    def __init__(self, width, height, background=70, resolution=0.5, start=(0.0, 0.0, 0.0), finish=None):
+        self.width = width
+        self.height = height
+        self.background = background
+        self.resolution = resolution
+        self.start = start
+        self.finish = finish
+        self.boxes = []
+
+        self._columns = int(math.ceil(width / resolution))
+        self._rows = int(math.ceil(height / resolution))
+        self._cells = bytearray([background]) * (self._columns * self._rows)
+
+    # A method to paint a strip of tape along a list of (x, y) points
+    def add_line(self, points, width, value):
+        radius = width / 2.0
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            self._paint(min(x0, x1) - radius, min(y0, y1) - radius,
+                        max(x0, x1) + radius, max(y0, y1) + radius,
+                        value, lambda x, y: _segment_distance(x, y, x0, y0, x1, y1) <= radius)
+
+    # A method to paint a filled rectangle (e.g. a grey cross)
+    def add_rect(self, x0, y0, x1, y1, value):
+        self._paint(x0, y0, x1, y1, value, None)
+
+    # A method to place an obstacle the ultrasonic sensor can see, it is not painted
+    def add_box(self, x0, y0, x1, y1):
+        self.boxes.append((min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)))
+
+    # True if a robot stopping at a point has reached the end of the course
+    def at_finish(self, x, y):
+        if self.finish is None:
+            return True
+        x0, y0, x1, y1 = self.finish
+        return x0 <= x <= x1 and y0 <= y <= y1
+
+    # Reflected light value at a point, the mat around the track reads as background
+    def value(self, x, y):
+        column = int(x / self.resolution)
+        row = int(y / self.resolution)
+        if 0 <= column < self._columns and 0 <= row < self._rows:
+            return self._cells[row * self._columns + column]
+        return self.background
+
+    # Average reflected light over the light spot of the sensor (its center and
+    # eight points around it)
+    def reflectance(self, x, y, radius):
+        if radius <= 0:
+            return self.value(x, y)
+        total = self.value(x, y)
+        for dx, dy in _SPOT:
+            total += self.value(x + dx * radius, y + dy * radius)
+        return total / 9.0
+
+    # Distance along a ray to the closest box, None if nothing is hit
+    def raycast(self, x, y, heading):
+        dx = math.sin(math.radians(heading))
+        dy = math.cos(math.radians(heading))
+        closest = None
+        for box in self.boxes:
+            hit = _ray_box(x, y, dx, dy, box)
+            if hit is not None and (closest is None or hit < closest):
+                closest = hit
+        return closest
+
+    def _paint(self, x0, y0, x1, y1, value, inside):
+        step = self.resolution
+        first_column = max(0, int(x0 / step))
+        last_column = min(self._columns - 1, int(x1 / step))
+        first_row = max(0, int(y0 / step))
+        last_row = min(self._rows - 1, int(y1 / step))
+
+        for row in range(first_row, last_row + 1):
+            cy = (row + 0.5) * step
+            offset = row * self._columns
+            for column in range(first_column, last_column + 1):
+                if inside is None or inside((column + 0.5) * step, cy):
+                    self._cells[offset + column] = value
+
+
+_SPOT = [(math.sin(math.radians(angle)), math.cos(math.radians(angle))) for angle in range(0, 360, 45)]
+
+
+# Points of a circular arc, angles are compass angles (0 is +y, 90 is +x)
+def arc(cx, cy, radius, start, end, steps=12):
+    points = []
+    for step in range(steps + 1):
+        angle = math.radians(start + (end - start) * step / float(steps))
+        points.append((cx + radius * math.sin(angle), cy + radius * math.cos(angle)))
+    return points
+
+
+def _segment_distance(px, py, x0, y0, x1, y1):
+    dx = x1 - x0
+    dy = y1 - y0
+    length = dx * dx + dy * dy
+    t = 0.0
+    if length > 0:
+        t = max(0.0, min(1.0, ((px - x0) * dx + (py - y0) * dy) / length))
+    return math.hypot(px - x0 - t * dx, py - y0 - t * dy)
+
+
+# Slab test of a ray against an axis aligned box
+def _ray_box(x, y, dx, dy, box):
+    near = 0.0
+    far = float('inf')
+    for origin, direction, low, high in ((x, dx, box[0], box[2]), (y, dy, box[1], box[3])):
+        if abs(direction) < 1e-12:
+            if origin < low or origin > high:
+                return None
+            continue
+        t0 = (low - origin) / direction
+        t1 = (high - origin) / direction
+        if t0 > t1:
+            t0, t1 = t1, t0
+        near = max(near, t0)
+        far = min(far, t1)
+        if near > far:
+            return None
+    return near
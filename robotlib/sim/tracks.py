@@ -0,0 +1,63 @@
+# Tracks modelled after the lab courses
+#
+# Reflected light values: green tape 8, grey cross 38 and white mat 70 for the first
+# two labs, black tape 8 on a bright mat 90 for the third one.
+from robotlib.sim.track import Track, arc
+
+GREEN = 8
+GREY = 38
+WHITE = 70
+BLACK = 8
+BRIGHT_WHITE = 90
+
+
+# Labs 1 and 2: a clockwise green line with two grey crosses, the program ends on the second
+def green_line():
+    # The robot starts with the color sensor over the left edge of the line and stops
+    # with it on the second cross, the one at the bottom of the mat
+    track = Track(340, 280, background=WHITE, start=(49.3, 13.0, 0.0), finish=(140, 5, 175, 35))
+
+    path = [(50, 10)]
+    path += arc(110, 170, 60, 270, 360)
+    path += arc(220, 170, 60, 0, 90)
+    path += arc(220, 80, 60, 90, 180)
+    path += [(110, 20)]
+    track.add_line(path, 2.0, GREEN)
+
+    track.add_rect(163, 222, 168, 238, GREY)
+    track.add_rect(148, 12, 153, 28, GREY)
+    return track
+
+
+# Lab 3: a black line interrupted by a removable box. Near the end the line branches
+# to the right and runs on into a dead end in front of a wall
+def black_line():
+    # The robot starts with the color sensor over the right edge of the line and ends
+    # where the branch runs out
+    track = Track(260, 300, background=BRIGHT_WHITE, start=(50.8, 13.0, 0.0), finish=(180, 210, 215, 240))
+    track.add_line([(50, 10), (50, 250)], 2.0, BLACK)
+    track.add_line([(50, 224), (200, 224)], 2.0, BLACK)
+
+    track.add_box(43, 120, 57, 134)
+    track.add_box(20, 262, 80, 272)
+    return track
+
+
+TRACKS = {
+    'green_line': green_line,
+    'black_line': black_line,
+}
+
+# The track each lab program is meant for
+PROGRAM_TRACKS = {
+    'myrobot': 'green_line',
+    'myrobot_2': 'green_line',
+    'myrobot_3': 'black_line',
+}
+
+
+# A method to build a track by name
+def load(name):
+    if name not in TRACKS:
+        raise ValueError("unknown track {!r}, expected one of {}".format(name, ", ".join(sorted(TRACKS))))
+    return TRACKS[name]()
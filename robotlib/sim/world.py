@@ -0,0 +1,182 @@
+# Differential drive simulation of the lab robot
+#
+# The world only moves forward when the robot program sleeps, so sensor reads are
+# free and a run takes as long as the program needs to compute it instead of the
+# time it would take on the track.
+import math
+import os
+import random
+
+# Motor and sensor addresses used when a device is created without one
+LEFT_MOTOR = 'outB'
+RIGHT_MOTOR = 'outC'
+
+
+class SimTimeout(Exception):
+    pass
+
+
+class World(object):
+    # track             - track.Track the robot drives on
+    # wheel_diameter    - in cm, the standard EV3 wheel
+    # axle              - distance between the wheels in cm
+    # max_speed         - motor speed at 100% in degrees per second (EV3 large motor)
+    # motor_lag         - time constant of the motor speed response in seconds
+    # color_offset      - distance of the color sensor ahead of the axle in cm
+    # color_spot        - radius of the color sensor light spot in cm
+    # color_noise       - standard deviation of the color reading noise
+    # light             - scale of the reflected light (room lighting)
+    # light_drift       - change of the light scale per second
+    # ultrasonic_offset - distance of the ultrasonic sensor ahead of the axle in cm
+    # ultrasonic_glitches - share of ultrasonic readings that are a stray echo at a random distance
+    # gyro_drift        - gyro drift in degrees per second
+    # step              - physics integration step in seconds
+    # time_limit        - simulated seconds after which sleep() raises SimTimeout
+    def __init__(self, track, wheel_diameter=5.6, axle=12.0, max_speed=1050.0, motor_lag=0.05,
+                 color_offset=7.0, color_spot=0.6, color_noise=0.0, light=1.0, light_drift=0.0,
+                 ultrasonic_offset=9.0, ultrasonic_glitches=0.0, gyro_drift=0.0, step=0.005, time_limit=None, seed=0,
+                 left_motor=LEFT_MOTOR, right_motor=RIGHT_MOTOR):
+        self.track = track
+        self.axle = axle
+        self.max_speed = max_speed
+        self.motor_lag = motor_lag
+        self.color_offset = color_offset
+        self.color_spot = color_spot
+        self.color_noise = color_noise
+        self.light = light
+        self.light_drift = light_drift
+        self.ultrasonic_offset = ultrasonic_offset
+        self.ultrasonic_glitches = ultrasonic_glitches
+        self.gyro_drift = gyro_drift
+        self.step = step
+        self.time_limit = time_limit
+        self.random = random.Random(seed)
+
+        self.cm_per_degree = math.pi * wheel_diameter / 360.0
+        self.x, self.y, self.heading = track.start
+        self.time = 0.0
+        self.odometer = 0.0
+        self.rate = 0.0
+        self.beeps = 0
+
+        # The last steering and speed sent to MoveSteering
+        self.steering = 0
+        self.speed = 0
+
+        # Per motor: [target speed, current speed, position], speeds in degrees per second
+        self.left_motor = left_motor
+        self.right_motor = right_motor
+        self.motors = {left_motor: [0.0, 0.0, 0.0], right_motor: [0.0, 0.0, 0.0]}
+        self.gyro_offsets = {}
+        self.gyro_bias = 0.0
+
+    def now(self):
+        return self.time
+
+    # A method to let the simulated time pass
+    def sleep(self, seconds):
+        end = self.time + seconds
+        while end - self.time > 1e-9:
+            self.advance(min(self.step, end - self.time))
+
+        if self.time_limit is not None and self.time >= self.time_limit:
+            raise SimTimeout("simulated time limit of {} s reached".format(self.time_limit))
+
+    # A method to integrate the robot motion over dt seconds
+    def advance(self, dt):
+        left = self.motors[self.left_motor]
+        right = self.motors[self.right_motor]
+
+        # First order response of the motor speed to the commanded speed
+        k = 1.0 if self.motor_lag <= 0 else min(1.0, dt / self.motor_lag)
+        for motor in (left, right):
+            motor[1] += (motor[0] - motor[1]) * k
+            motor[2] += motor[1] * dt
+
+        left_distance = left[1] * dt * self.cm_per_degree
+        right_distance = right[1] * dt * self.cm_per_degree
+        distance = (left_distance + right_distance) / 2
+        rotation = (left_distance - right_distance) / self.axle # clockwise, in radians
+
+        heading = math.radians(self.heading) + rotation / 2
+        self.x += distance * math.sin(heading)
+        self.y += distance * math.cos(heading)
+        self.heading += math.degrees(rotation)
+        self.rate = math.degrees(rotation) / dt
+        self.odometer += abs(distance)
+        self.gyro_bias += self.gyro_drift * dt
+        self.time += dt
+
+    # Motors
+
+    def command(self, steering, speed):
+        self.steering = steering
+        self.speed = speed
+
+    def set_motor(self, address, percent):
+        self.motors[address][0] = percent * self.max_speed / 100.0
+
+    def motor_position(self, address):
+        return int(round(self.motors[address][2]))
+
+    def motor_speed(self, address):
+        return int(round(self.motors[address][1]))
+
+    # Sensors
+
+    def reflected_light(self, address):
+        x, y = self._ahead(self.color_offset)
+        value = self.track.reflectance(x, y, self.color_spot) * (self.light + self.light_drift * self.time)
+        if self.color_noise:
+            value += self.random.gauss(0, self.color_noise)
+        return int(round(max(0, min(100, value))))
+
+    def gyro_angle(self, address):
+        return int(round(self.heading + self.gyro_bias - self.gyro_offsets.get(address, 0.0)))
+
+    def gyro_rate(self, address):
+        return int(round(self.rate + self.gyro_drift))
+
+    def gyro_reset(self, address):
+        self.gyro_offsets[address] = self.heading + self.gyro_bias
+
+    def ultrasonic_distance(self, address):
+        if self.ultrasonic_glitches and self.random.random() < self.ultrasonic_glitches:
+            return round(self.random.uniform(0, 255), 1)
+        x, y = self._ahead(self.ultrasonic_offset)
+        distance = self.track.raycast(x, y, self.heading)
+        if distance is None or distance > 255:
+            return 255.0
+        return round(distance, 1)
+
+    def beep(self):
+        self.beeps += 1
+
+    def _ahead(self, offset):
+        heading = math.radians(self.heading)
+        return self.x + offset * math.sin(heading), self.y + offset * math.cos(heading)
+
+
+_world = None
+
+
+# The world the simulated devices talk to, created from ROBOT_TRACK on first use
+def get_world():
+    global _world
+    if _world is None:
+        from robotlib.sim import tracks
+        _world = World(tracks.load(os.environ.get('ROBOT_TRACK', 'green_line')))
+    return _world
+
+
+def set_world(world):
+    global _world
+    _world = world
+
+
+def now():
+    return get_world().now()
+
+
+def sleep(seconds):
+    get_world().sleep(seconds)
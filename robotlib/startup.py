@@ -0,0 +1,109 @@
+# Startup timing
+#
+# On the EV3 a program takes seconds from the python3 command to the first motor
+# command: the interpreter starts, the modules are imported, the settings, the robot
+# and the log files are set up, the devices are looked up in sysfs and the first tick
+# reads every sensor. A program marks the end of each phase with phase(name), Robot
+# marks the devices and the start of the loop, and the first motor command ends the
+# startup. With ROBOT_STARTUP=<file> set the phases are written to the file as json
+# right after that command (nothing is written without it, marking a phase only
+# appends to a list).
+#
+#   ROBOT_STARTUP=startup.json python3 myrobot_2/main.py
+#   python -m robotlib.startup startup.json
+#
+# The first phase, 'interpreter', runs from the start of the process (read from
+# /proc) to the import of this module, so the programs import it first.
+import os
+import time
+
+# (phase name, wall time its end was marked at)
+PHASES = []
+
+
+# Wall time the process was started at, or None where /proc can't tell
+def process_start():
+    try:
+        with open('/proc/self/stat', 'r') as file:
+            # The fields after the name, which is in parentheses and may hold spaces
+            fields = file.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime', 'r') as file:
+            uptime = float(file.read().split()[0])
+        started = int(fields[19]) / float(os.sysconf('SC_CLK_TCK'))
+    except (OSError, IndexError, ValueError):
+        return None
+    return time.time() - (uptime - started)
+
+
+STARTED = process_start()
+
+
+# A method to mark the end of a startup phase
+def phase(name):
+    PHASES.append((name, time.time()))
+
+
+phase('interpreter')
+
+
+# A method to end the startup with the first motor command of a MoveSteering, only
+# when ROBOT_STARTUP is set
+def watch_motors(move_steering):
+    path = os.environ.get('ROBOT_STARTUP')
+    if not path:
+        return
+    on = move_steering.on
+
+    def first_on(*args, **kwargs):
+        # Only the first command is timed, then the plain method is back
+        move_steering.on = on
+        result = on(*args, **kwargs)
+        phase('first_motor_command')
+        save(path)
+        return result
+    move_steering.on = first_on
+
+
+# The phases as a list of (name, seconds the phase took, seconds since the start).
+# Without the process start time the first phase is left out
+def summary(phases, started):
+    if started is None:
+        started = phases[0][1]
+        phases = phases[1:]
+    rows = []
+    last = started
+    for name, end in phases:
+        rows.append((name, end - last, end - started))
+        last = end
+    return rows
+
+
+def save(path):
+    import json
+
+    with open(path, 'w') as file:
+        json.dump({'started': STARTED, 'phases': PHASES}, file)
+
+
+# A method to print the phases as a table of milliseconds
+def report(data):
+    lines = ["{:<22} {:>10} {:>10}".format('phase', 'ms', 'total ms')]
+    for name, seconds, total in summary([tuple(entry) for entry in data['phases']], data['started']):
+        lines.append("{:<22} {:>10.1f} {:>10.1f}".format(name, seconds * 1000, total * 1000))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Print the startup phases written with ROBOT_STARTUP")
+    parser.add_argument('startup')
+    args = parser.parse_args(argv)
+
+    with open(args.startup, 'r') as file:
+        print(report(json.load(file)))
+
+
+if __name__ == '__main__':
+    main()
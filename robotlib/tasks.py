@@ -0,0 +1,19 @@
+# Building blocks for scheduler tasks, combine them with "yield from"
+from robotlib.clock import now
+
+
+# Wait for the given number of seconds, the motors keep doing what they did
+def wait(seconds):
+    end = now() + seconds
+    snapshot = yield
+    while snapshot.time < end:
+        snapshot = yield
+    return snapshot
+
+
+# Wait until condition(snapshot) is true
+def until(condition):
+    snapshot = yield
+    while not condition(snapshot):
+        snapshot = yield
+    return snapshot
@@ -0,0 +1,354 @@
+# Live telemetry from the brick
+#
+# With ROBOT_TELEMETRY=<host>:<port> set, a program streams a frame per control tick
+# to a workstation over UDP: the pose, the color reading, the state and the loop
+# period. The control loop only queues the values, a sender thread packs them into
+# 32 byte frames and sends up to MAX_BATCH of them per datagram on a non-blocking
+# socket. Nothing ever waits for the network: when the queue is full the oldest
+# frames are dropped, and so is a datagram the socket can't take right away. The
+# frames are numbered, so the receiver sees the gaps. Without ROBOT_TELEMETRY
+# nothing is started.
+#
+#   python -m robotlib.telemetry receive --port 5005
+#   ROBOT_TELEMETRY=192.168.0.10:5005 python3 myrobot_2/main.py
+#
+#   python -m robotlib.telemetry loopback myrobot_2/main.py
+#
+# The receiver plots the path as it comes in, redrawing only the path, the robot and
+# the text over a saved background (blitting), and the whole figure only when the
+# path leaves the axes. loopback runs a simulated lap of a program sending to a
+# receiver on 127.0.0.1 in the same process and reports what arrived.
+import atexit
+import collections
+import os
+import struct
+import sys
+import threading
+import time
+
+from robotlib.trajectory import STATES
+
+MAGIC = b'RT'
+# magic, frame number, time since start, x, y, heading (radians), state (index into
+# the names of robotlib/trajectory.py), color value, loop period (seconds)
+FRAME = struct.Struct('<2sIdfffBBf')
+MAX_BATCH = 32 # frames per datagram, 1 KiB
+PORT = 5005
+
+
+# A method to start the sender if ROBOT_TELEMETRY is set, returns it or None
+def start_telemetry():
+    address = os.environ.get('ROBOT_TELEMETRY')
+    if not address:
+        return None
+    host, _, port = address.rpartition(':')
+    return TelemetrySender((host or '127.0.0.1', int(port or PORT)))
+
+
+class TelemetrySender(object):
+    # address        - (host, port) of the receiver
+    # max_frames     - queue cap, the oldest frames are dropped when it is full
+    # batch_frames   - wake the sender up as soon as this many frames are waiting
+    # flush_interval - otherwise the sender sends every flush_interval seconds
+    def __init__(self, address, states=STATES, max_frames=256, batch_frames=8, flush_interval=0.05):
+        self.address = address
+        self.batch_frames = batch_frames
+        self.flush_interval = flush_interval
+        self.sent = 0
+        self.dropped = 0
+        self._codes = dict((state, code) for code, state in enumerate(states))
+        self._number = 0
+
+        self._frames = collections.deque(maxlen=max_frames)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+
+        # socket is slow to import on the brick and only needed with ROBOT_TELEMETRY
+        import socket
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+        self._thread = threading.Thread(target=self._run, name="telemetry-sender")
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.close)
+
+    # A method to queue a frame, it never touches the socket
+    def send(self, now, x, y, heading, state, color, period):
+        with self._lock:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+            self._number += 1
+            self._frames.append((self._number, now, x, y, heading, state, color, period))
+            waiting = len(self._frames)
+
+        if waiting >= self.batch_frames:
+            self._wake.set()
+
+    # A method to send every queued frame right away
+    def flush(self):
+        with self._lock:
+            frames = list(self._frames)
+            self._frames.clear()
+
+        pack = FRAME.pack
+        codes = self._codes
+        for start in range(0, len(frames), MAX_BATCH):
+            batch = frames[start:start + MAX_BATCH]
+            datagram = b''.join(pack(MAGIC, number, now, x, y, heading, codes.get(state, 255),
+                                     max(0, min(255, int(color))), period)
+                                for number, now, x, y, heading, state, color, period in batch)
+            try:
+                self._socket.sendto(datagram, self.address)
+                self.sent += len(batch)
+            except OSError:
+                # The socket buffer is full or nobody listens, the frames are gone
+                self.dropped += len(batch)
+
+    # A method to stop the sender thread and send whatever is still queued
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        self._socket.close()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+# A received frame, state is the name
+Frame = collections.namedtuple('Frame', 'number time x y heading state color period')
+
+
+class TelemetryReceiver(object):
+    # port - UDP port to listen on, 0 picks a free one (see self.port)
+    def __init__(self, port=PORT, host='', states=STATES):
+        import socket
+
+        self.states = list(states)
+        self.received = 0
+        self.lost = 0 # frames missing between the received ones
+        self.last = None
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._timeout = socket.timeout
+        self._socket.bind((host, port))
+        self.port = self._socket.getsockname()[1]
+
+    # A method to read the datagrams that arrived, waiting at most timeout seconds
+    # for the first one. Returns a list of Frames
+    def receive(self, timeout=0.05):
+        frames = []
+        self._socket.settimeout(timeout)
+        while True:
+            try:
+                datagram = self._socket.recv(MAX_BATCH * FRAME.size)
+            except (self._timeout, BlockingIOError):
+                break
+            frames.extend(self.decode(datagram))
+            # Read on without waiting while datagrams are queued
+            self._socket.settimeout(0)
+        return frames
+
+    # A method to unpack the frames of a datagram, frames with a wrong magic are skipped
+    def decode(self, datagram):
+        frames = []
+        states = self.states
+        size = len(datagram) - len(datagram) % FRAME.size
+        for magic, number, now, x, y, heading, state, color, period in FRAME.iter_unpack(datagram[:size]):
+            if magic != MAGIC:
+                continue
+            if self.last is not None and number > self.last + 1:
+                self.lost += number - self.last - 1
+            if self.last is None or number > self.last:
+                self.last = number
+            self.received += 1
+            frames.append(Frame(number, now, x, y, heading, states[state] if state < len(states) else str(state),
+                                color, period))
+        return frames
+
+    def close(self):
+        self._socket.close()
+
+
+# States drawn as markers on the path
+MARKS = ('grey_detected', 'program_end')
+
+
+class Dashboard(object):
+    # A live plot of the path with the robot, the marks and a line of text
+    def __init__(self, extent=60.0, max_points=20000):
+        import matplotlib.pyplot as plot
+
+        self.plot = plot
+        self.max_points = max_points
+        self.xs = collections.deque(maxlen=max_points)
+        self.ys = collections.deque(maxlen=max_points)
+        self.mark_xs = []
+        self.mark_ys = []
+
+        self.figure, self.axes = plot.subplots()
+        self.axes.set_aspect('equal')
+        self.axes.set_xlim(-extent, extent)
+        self.axes.set_ylim(-extent, extent)
+        self.axes.set_title("Live telemetry")
+        self.path, = self.axes.plot([], [], '-', color='tab:green', animated=True)
+        self.robot, = self.axes.plot([], [], 'o', color='tab:red', animated=True)
+        self.marks, = self.axes.plot([], [], 'x', color='tab:gray', markersize=10, animated=True)
+        self.text = self.axes.text(0.02, 0.98, '', transform=self.axes.transAxes, va='top',
+                                   family='monospace', animated=True)
+        self.artists = (self.path, self.marks, self.robot, self.text)
+
+        plot.show(block=False)
+        self.redraw()
+
+    # A method to draw the whole figure and keep it as the background of the blits
+    def redraw(self):
+        canvas = self.figure.canvas
+        canvas.draw()
+        self.background = canvas.copy_from_bbox(self.figure.bbox)
+        self.blit()
+
+    def blit(self):
+        canvas = self.figure.canvas
+        canvas.restore_region(self.background)
+        for artist in self.artists:
+            self.axes.draw_artist(artist)
+        canvas.blit(self.figure.bbox)
+        canvas.flush_events()
+
+    # A method to add received frames and update the plot
+    def update(self, frames, receiver):
+        if frames:
+            for frame in frames:
+                self.xs.append(frame.x)
+                self.ys.append(frame.y)
+                if frame.state in MARKS:
+                    self.mark_xs.append(frame.x)
+                    self.mark_ys.append(frame.y)
+            last = frames[-1]
+            self.path.set_data(self.xs, self.ys)
+            self.marks.set_data(self.mark_xs, self.mark_ys)
+            self.robot.set_data([last.x], [last.y])
+            self.text.set_text("t {:7.2f} s  {:13s}  color {:3d}  period {:5.1f} ms\n"
+                               "frames {}  lost {}".format(last.time, last.state, last.color,
+                                                           1000 * last.period, receiver.received, receiver.lost))
+            if self.grow(last.x, last.y):
+                self.redraw()
+                return
+        self.blit()
+
+    # A method to widen the axes when a point leaves them, returns True if they changed
+    def grow(self, x, y):
+        low_x, high_x = self.axes.get_xlim()
+        low_y, high_y = self.axes.get_ylim()
+        if low_x <= x <= high_x and low_y <= y <= high_y:
+            return False
+        margin = 0.25 * max(high_x - low_x, high_y - low_y)
+        self.axes.set_xlim(min(low_x, x - margin), max(high_x, x + margin))
+        self.axes.set_ylim(min(low_y, y - margin), max(high_y, y + margin))
+        return True
+
+    def is_open(self):
+        return self.plot.fignum_exists(self.figure.number)
+
+
+# A method to show the frames of a receiver until the window is closed
+def show(receiver, extent=60.0):
+    dashboard = Dashboard(extent)
+    while dashboard.is_open():
+        dashboard.update(receiver.receive(0.03), receiver)
+
+
+# A method to print a line per second about the frames of a receiver, without a display
+def watch(receiver, duration=None):
+    started = time.time()
+    while duration is None or time.time() - started < duration:
+        frames = receiver.receive(1.0)
+        if frames:
+            last = frames[-1]
+            print("t {:7.2f} s  ({:6.1f}, {:6.1f})  {:13s}  color {:3d}  period {:5.1f} ms  "
+                  "frames {}  lost {}".format(last.time, last.x, last.y, last.state, last.color,
+                                               1000 * last.period, receiver.received, receiver.lost))
+
+
+# A method to run a simulated lap of a program streaming to a receiver in this process,
+# returns (lap result, wall time, received Frames, receiver)
+def loopback(program, noise=1.0, seed=0):
+    from robotlib.sim import run as sim_run
+
+    receiver = TelemetryReceiver(0, '127.0.0.1')
+    frames = []
+    done = threading.Event()
+
+    def drain():
+        while not done.is_set():
+            frames.extend(receiver.receive(0.05))
+        frames.extend(receiver.receive(0.2))
+
+    thread = threading.Thread(target=drain, name="telemetry-loopback")
+    thread.start()
+    os.environ['ROBOT_TELEMETRY'] = '127.0.0.1:{}'.format(receiver.port)
+    try:
+        started = time.time()
+        lap = sim_run.run_lap(program, sim_run.program_track(program), color_noise=noise, seed=seed)
+        wall_time = time.time() - started
+    finally:
+        os.environ.pop('ROBOT_TELEMETRY', None)
+        done.set()
+        thread.join()
+        receiver.close()
+    return lap, wall_time, frames, receiver
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Receive and show the telemetry of a running program")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    receive_parser = commands.add_parser('receive', help="plot the frames sent to a port")
+    receive_parser.add_argument('--port', type=int, default=PORT)
+    receive_parser.add_argument('--extent', type=float, default=60.0, help="cm shown around the start at first")
+    receive_parser.add_argument('--text', action='store_true', help="print a line per second instead of plotting")
+
+    loopback_parser = commands.add_parser('loopback', help="run a simulated lap sending to this process")
+    loopback_parser.add_argument('program', help="path of the program, e.g. myrobot_2/main.py")
+    loopback_parser.add_argument('--noise', type=float, default=1.0, help="color sensor noise")
+    loopback_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == 'loopback':
+        lap, wall_time, frames, receiver = loopback(args.program, args.noise, args.seed)
+        print("lap {} after {:.2f} s ({:.2f} s wall time)".format(
+            "finished" if lap['finished'] else "not finished", lap['time'], wall_time))
+        print("{} frames received, {} lost, last frame {}".format(
+            receiver.received, receiver.lost, receiver.last))
+        marks = [frame for frame in frames if frame.state in MARKS]
+        for frame in marks:
+            print("  {} at {:.2f} s ({:.1f}, {:.1f})".format(frame.state, frame.time, frame.x, frame.y))
+        return 0 if frames else 1
+
+    receiver = TelemetryReceiver(args.port)
+    try:
+        if args.text:
+            watch(receiver)
+        else:
+            show(receiver, args.extent)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        receiver.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
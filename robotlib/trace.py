@@ -0,0 +1,61 @@
+# Per-tick sensor traces
+#
+# With ROBOT_TRACE=<file> set, a program records the sensor snapshot of every control
+# tick together with the steering and speed it commanded in that tick. The traces can
+# be replayed on a workstation with robotlib.replay to check that a change to the
+# control code still reacts to real sensor data the same way.
+import os
+
+from robotlib.logger import BufferedLogger
+
+
+class TraceRecorder(object):
+    def __init__(self, path, sampler, move_steering):
+        self.sampler = sampler
+        self.names = sampler.names
+        self.steering = 0
+        self.speed = 0
+        self._watch(move_steering)
+        self.logger = BufferedLogger(path, header=['time'] + self.names + ['steering', 'speed'],
+                                     max_rows=50000, batch_rows=500)
+
+    # A method to record the current tick, called once the tick made its decisions
+    def record(self):
+        snapshot = self.sampler.snapshot
+        row = [snapshot.time]
+        for name in self.names:
+            row.append(getattr(snapshot, name))
+        row.append(self.steering)
+        row.append(self.speed)
+        self.logger.log(row)
+
+    def close(self):
+        self.logger.close()
+
+    # Remember every command sent to the motors
+    def _watch(self, move_steering):
+        on = move_steering.on
+        off = move_steering.off
+
+        def recorded_on(steering, speed, *args, **kwargs):
+            self.steering = steering
+            self.speed = speed
+            return on(steering, speed, *args, **kwargs)
+
+        def recorded_off(*args, **kwargs):
+            self.steering = 0
+            self.speed = 0
+            return off(*args, **kwargs)
+
+        move_steering.on = recorded_on
+        move_steering.off = recorded_off
+
+
+# A method to start recording if ROBOT_TRACE is set, the trace is written after every tick
+def start_recording(sampler, move_steering, scheduler):
+    path = os.environ.get('ROBOT_TRACE')
+    if not path:
+        return None
+    recorder = TraceRecorder(path, sampler, move_steering)
+    scheduler.after_tick.append(recorder.record)
+    return recorder
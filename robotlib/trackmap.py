@@ -0,0 +1,244 @@
+# Track maps built from logged trajectories
+#
+#   python -m robotlib.trackmap build track.npz runs/*/robot_path.bin --cell 2 --jobs 8
+#   python -m robotlib.trackmap ahead track.npz 0 40 --heading 90
+#
+# A map is a grid of square cells over the floor, in the coordinates of the path logs
+# (the start of the run is the origin, y points ahead of the robot at the start, so
+# runs that start at the same place share the map). Every cell keeps how often the
+# color sensor saw it and the sum of the readings, so the mean reading of a cell is
+# the expected color there. The sensor sits ahead of the wheels, the readings are
+# placed sensor_offset cm ahead of the logged position along the logged heading.
+# Rows of marker states (grey crosses, obstacles) are kept as points and grouped
+# into places: markers of all runs within mark_radius of each other are averaged
+# into one location.
+#
+# The cells are a dict keyed by (column, row), which is also the spatial index:
+# color_at() and ahead() look cells up by position. The logs are memory mapped and
+# read in chunks, every file is reduced to a partial map in a pool of worker
+# processes and the partial maps are merged as they come in. The counts and sums
+# are integers, so the map does not depend on the order of the merges.
+import argparse
+import glob
+import math
+import multiprocessing
+import sys
+
+from robotlib.trajectory import open_trajectory
+
+CELL = 2.0          # cm, side of a color cell
+MARK_RADIUS = 10.0   # cm, markers closer than this to a place belong to it
+SENSOR_OFFSET = 7.0  # cm from the wheel axle to the color sensor
+
+# Logged states that mark places on the track, every other row is only a color reading.
+# myrobot_2 marks the grey crosses, myrobot_3 the boxes and the wall where it met them
+MARKS = ('grey_detected', 'obstacle')
+
+# Rows read from a log at a time
+CHUNK_ROWS = 100000
+
+
+class TrackMap(object):
+    def __init__(self, cell=CELL):
+        self.cell = cell
+        self.cells = {} # (column, row) -> [count, sum of the readings]
+        self.marks = {} # state -> list of (x, y) where the sensor was
+        self.runs = 0
+
+    # A method to add the readings of one run, arrays as read from a trajectory log
+    def add(self, x, y, heading, color, states, state_names, sensor_offset=SENSOR_OFFSET):
+        import numpy as np
+
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        # csv logs converted to the binary format have no heading (NaN), their readings
+        # stay at the logged position
+        heading = np.asarray(heading, dtype=np.float64)
+        unknown = np.isnan(heading)
+        offset = np.where(unknown, 0.0, sensor_offset)
+        heading = np.where(unknown, 0.0, heading)
+        sensor_x = x + offset * np.sin(heading)
+        sensor_y = y + offset * np.cos(heading)
+
+        columns = np.floor(sensor_x / self.cell).astype(np.int64)
+        rows = np.floor(sensor_y / self.cell).astype(np.int64)
+        keys, inverse = np.unique(np.column_stack([columns, rows]), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse, minlength=len(keys))
+        sums = np.bincount(inverse, weights=np.asarray(color, dtype=np.float64), minlength=len(keys))
+        cells = self.cells
+        for (column, row), count, total in zip(keys.tolist(), counts.tolist(), sums.tolist()):
+            entry = cells.get((column, row))
+            if entry is None:
+                cells[(column, row)] = [count, int(total)]
+            else:
+                entry[0] += count
+                entry[1] += int(total)
+
+        states = np.asarray(states)
+        for code, name in enumerate(state_names):
+            if name not in MARKS:
+                continue
+            marked = states == code
+            self.marks.setdefault(name, []).extend(zip(sensor_x[marked].tolist(), sensor_y[marked].tolist()))
+
+    # A method to add another map of the same cell size to this one
+    def merge(self, other):
+        if other.cell != self.cell:
+            raise ValueError("maps with different cell sizes can't be merged")
+        for key, (count, total) in other.cells.items():
+            entry = self.cells.get(key)
+            if entry is None:
+                self.cells[key] = [count, total]
+            else:
+                entry[0] += count
+                entry[1] += total
+        for name, points in other.marks.items():
+            self.marks.setdefault(name, []).extend(points)
+        self.runs += other.runs
+        return self
+
+    # The mean reading of the cell under x, y, None if the cell was never seen
+    def color_at(self, x, y):
+        entry = self.cells.get((int(math.floor(x / self.cell)), int(math.floor(y / self.cell))))
+        if entry is None:
+            return None
+        return entry[1] / float(entry[0])
+
+    # The expected readings ahead of a position, one per cell length up to distance cm
+    # along heading (radians, clockwise from y like the logs). Returns a list of
+    # (distance, mean reading or None)
+    def ahead(self, x, y, heading, distance, step=None):
+        step = step or self.cell
+        sin = math.sin(heading)
+        cos = math.cos(heading)
+        count = int(distance / step)
+        return [(i * step, self.color_at(x + i * step * sin, y + i * step * cos)) for i in range(count + 1)]
+
+    # The marked places of a state as a list of (x, y, number of markers), most seen
+    # first. Every marker joins the first place within radius of it
+    def places(self, state, radius=MARK_RADIUS):
+        places = [] # [count, sum of x, sum of y]
+        for x, y in sorted(self.marks.get(state, ())):
+            for place in places:
+                if math.hypot(place[1] / place[0] - x, place[2] / place[0] - y) <= radius:
+                    place[0] += 1
+                    place[1] += x
+                    place[2] += y
+                    break
+            else:
+                places.append([1, x, y])
+        return sorted(((sum_x / count, sum_y / count, count) for count, sum_x, sum_y in places),
+                      key=lambda place: -place[2])
+
+    # The map as arrays for numpy.savez
+    def to_arrays(self):
+        import numpy as np
+
+        keys = sorted(self.cells)
+        arrays = {
+            'cell': np.array(self.cell),
+            'runs': np.array(self.runs),
+            'cells': np.array(keys, dtype=np.int64).reshape(-1, 2),
+            'counts': np.array([self.cells[key][0] for key in keys], dtype=np.int64),
+            'sums': np.array([self.cells[key][1] for key in keys], dtype=np.int64),
+        }
+        for name, points in self.marks.items():
+            arrays['mark_' + name] = np.array(sorted(points), dtype=np.float64).reshape(-1, 2)
+        return arrays
+
+    def save(self, path):
+        import numpy as np
+
+        np.savez_compressed(path, **self.to_arrays())
+
+    @classmethod
+    def load(cls, path):
+        import numpy as np
+
+        with np.load(path) as data:
+            track_map = cls(float(data['cell']))
+            track_map.runs = int(data['runs'])
+            for key, count, total in zip(data['cells'].tolist(), data['counts'].tolist(), data['sums'].tolist()):
+                track_map.cells[tuple(key)] = [count, total]
+            for name in data.files:
+                if name.startswith('mark_'):
+                    track_map.marks[name[5:]] = [tuple(point) for point in data[name].tolist()]
+        return track_map
+
+
+# A method to build the map of one trajectory log, streaming it in chunks
+def map_log(path, cell=CELL, sensor_offset=SENSOR_OFFSET, chunk_rows=CHUNK_ROWS):
+    records, states, _ = open_trajectory(path)
+    track_map = TrackMap(cell)
+    for start in range(0, len(records), chunk_rows):
+        chunk = records[start:start + chunk_rows]
+        track_map.add(chunk['x'], chunk['y'], chunk['heading'], chunk['color'], chunk['state'], states,
+                      sensor_offset)
+    track_map.runs = 1
+    return track_map
+
+
+def _map_log(arguments):
+    return map_log(*arguments)
+
+
+# A method to build the map of many logs on all cores
+def build(paths, cell=CELL, sensor_offset=SENSOR_OFFSET, jobs=None):
+    track_map = TrackMap(cell)
+    arguments = [(path, cell, sensor_offset) for path in paths]
+    if jobs == 1 or len(paths) <= 1:
+        for partial in map(_map_log, arguments):
+            track_map.merge(partial)
+        return track_map
+
+    pool = multiprocessing.Pool(jobs or multiprocessing.cpu_count())
+    try:
+        for partial in pool.imap_unordered(_map_log, arguments):
+            track_map.merge(partial)
+    finally:
+        pool.close()
+        pool.join()
+    return track_map
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build track maps from trajectory logs and look them up")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    build_parser = commands.add_parser('build', help="build a map from binary trajectory logs")
+    build_parser.add_argument('map', help="npz file the map is written to")
+    build_parser.add_argument('logs', nargs='+', help="trajectory logs or glob patterns (csv logs "
+                                                      "need python -m robotlib.trajectory from-csv first)")
+    build_parser.add_argument('--cell', type=float, default=CELL, help="side of a color cell in cm")
+    build_parser.add_argument('--sensor-offset', type=float, default=SENSOR_OFFSET,
+                              help="cm from the wheel axle to the color sensor")
+    build_parser.add_argument('--jobs', type=int, help="worker processes (all cores by default)")
+
+    ahead_parser = commands.add_parser('ahead', help="print the expected readings ahead of a position")
+    ahead_parser.add_argument('map')
+    ahead_parser.add_argument('x', type=float)
+    ahead_parser.add_argument('y', type=float)
+    ahead_parser.add_argument('--heading', type=float, default=0.0, help="degrees clockwise from y")
+    ahead_parser.add_argument('--distance', type=float, default=20.0, help="cm to look ahead")
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        paths = sorted(set(path for pattern in args.logs for path in (glob.glob(pattern) or [pattern])))
+        track_map = build(paths, args.cell, args.sensor_offset, args.jobs)
+        track_map.save(args.map)
+        print("{} runs, {} cells of {} cm".format(track_map.runs, len(track_map.cells), track_map.cell))
+        for name in sorted(track_map.marks):
+            for x, y, count in track_map.places(name):
+                print("{} at ({:.1f}, {:.1f}), seen {} times".format(name, x, y, count))
+        return 0
+
+    track_map = TrackMap.load(args.map)
+    for distance, color in track_map.ahead(args.x, args.y, math.radians(args.heading), args.distance):
+        print("{:6.1f} cm  {}".format(distance, "-" if color is None else "{:.1f}".format(color)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+# Compact binary trajectory logs
+#
+# A file is a small header followed by fixed-width little-endian records:
+#
+#   header: magic b'RTRJ', uint16 version, uint16 record size, float64 start time
+#           (wall clock), uint8 number of states, then every state name as 32
+#           null-padded bytes
+#   record: float64 time since start, float32 x, float32 y, float32 heading
+#           (radians), uint8 state (index into the state names), uint8 color value
+#
+# The color value field holds 0..255 (reflected light readings are 0..100). Values
+# outside of it are clamped: silently by the logger on the brick, with a warning
+# counting the changed rows by the csv converter.
+#
+# The writer only needs struct, so it runs on the brick. The reader maps the file
+# with numpy.memmap, and the converter goes to and from the csv layout myrobot_2
+# used to write (timestamp, x, y, state, color_value).
+#
+#   python -m robotlib.trajectory to-csv robot_path.bin robot_path.csv
+#   python -m robotlib.trajectory from-csv robot_path.csv robot_path.bin
+import struct
+
+from robotlib.logger import BufferedLogger
+
+MAGIC = b'RTRJ'
+VERSION = 1
+HEADER = struct.Struct('<4sHHdB')
+RECORD = struct.Struct('<dfffBB')
+NAME_SIZE = 32
+
+# States written by the lab programs, other names are added by the converter
+STATES = ('program_start', 'moving', 'grey_detected', 'program_end', 'maneuver', 'obstacle')
+
+# numpy dtype of a record, built lazily so the brick never imports numpy
+DTYPE_FIELDS = [('time', '<f8'), ('x', '<f4'), ('y', '<f4'), ('heading', '<f4'),
+                ('state', 'u1'), ('color', 'u1')]
+
+
+# A method to build the header bytes
+def pack_header(start_time, states=STATES):
+    if len(states) > 255:
+        raise ValueError("at most 255 states fit into a trajectory file")
+    names = b''.join(state.encode('ascii')[:NAME_SIZE].ljust(NAME_SIZE, b'\0') for state in states)
+    return HEADER.pack(MAGIC, VERSION, RECORD.size, start_time, len(states)) + names
+
+
+# A method to read the header, returns (start time, state names, size of the header in bytes)
+def read_header(file):
+    fixed = file.read(HEADER.size)
+    magic, version, record_size, start_time, count = HEADER.unpack(fixed)
+    if magic != MAGIC:
+        raise ValueError("not a trajectory file")
+    if version != VERSION or record_size != RECORD.size:
+        raise ValueError("unsupported trajectory file version {} (record size {})".format(version, record_size))
+
+    names = file.read(count * NAME_SIZE)
+    states = [names[i:i + NAME_SIZE].rstrip(b'\0').decode('ascii') for i in range(0, len(names), NAME_SIZE)]
+    return start_time, states, HEADER.size + count * NAME_SIZE
+
+
+# A buffered logger writing trajectory records, log() takes
+# (time, x, y, heading, state name, color value) tuples
+class TrajectoryLogger(BufferedLogger):
+    def __init__(self, path, start_time, states=STATES, **kwargs):
+        self.start_time = start_time
+        self.states = list(states)
+        self._codes = dict((state, code) for code, state in enumerate(self.states))
+        BufferedLogger.__init__(self, path, **kwargs)
+
+    def open_file(self):
+        file = open(self.path, 'wb')
+        file.write(pack_header(self.start_time, self.states))
+        return file
+
+    def write_rows(self, rows):
+        pack = RECORD.pack
+        codes = self._codes
+        self._file.write(b''.join(pack(now, x, y, heading, codes[state], max(0, min(255, int(color))))
+                                  for now, x, y, heading, state, color in rows))
+
+
+# A method to map a trajectory file without reading it, returns
+# (numpy record array, state names, start time)
+def open_trajectory(path):
+    import numpy as np
+
+    with open(path, 'rb') as file:
+        start_time, states, offset = read_header(file)
+    records = np.memmap(path, dtype=np.dtype(DTYPE_FIELDS), mode='r', offset=offset)
+    return records, states, start_time
+
+
+# Elapsed time formatted the way the csv logs do (HH:MM:SS.fff)
+def format_time(seconds):
+    return "{:02d}:{:02d}:{:06.3f}".format(int(seconds // 3600), int((seconds % 3600) // 60), seconds % 60)
+
+
+def parse_time(text):
+    hours, minutes, seconds = text.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+# A method to write a trajectory file as csv (the heading is not part of the csv layout)
+def to_csv(source, target):
+    import csv
+
+    records, states, _ = open_trajectory(source)
+    with open(target, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['timestamp', 'x', 'y', 'state', 'color_value'])
+        for record in records:
+            writer.writerow([format_time(float(record['time'])), "{:.2f}".format(record['x']),
+                             "{:.2f}".format(record['y']), states[record['state']], int(record['color'])])
+
+
+# A method to turn a csv log (with or without header) into a trajectory file,
+# the heading is unknown and stored as NaN. Color values outside 0..255 are clamped
+# with a warning, returns the number of rows that were changed
+def from_csv(source, target, start_time=0.0):
+    import csv
+
+    with open(source, 'r', newline='') as file:
+        rows = [row for row in csv.reader(file) if row]
+    first_line = 1
+    if rows and rows[0][0] == 'timestamp':
+        rows = rows[1:]
+        first_line = 2
+
+    states = list(STATES)
+    for row in rows:
+        if row[3] not in states:
+            states.append(row[3])
+
+    codes = dict((state, code) for code, state in enumerate(states))
+    clamped = []
+    with open(target, 'wb') as file:
+        file.write(pack_header(start_time, states))
+        for line, row in enumerate(rows, first_line):
+            color = int(row[4])
+            if not 0 <= color <= 255:
+                clamped.append((line, color))
+                color = max(0, min(255, color))
+            file.write(RECORD.pack(parse_time(row[0]), float(row[1]), float(row[2]), float('nan'),
+                                   codes[row[3]], color))
+
+    if clamped:
+        import warnings
+
+        warnings.warn("{}: {} of {} rows have a color value outside 0..255 and were clamped "
+                      "(first on line {}: {})".format(source, len(clamped), len(rows), *clamped[0]),
+                      stacklevel=2)
+    return len(clamped)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert trajectory logs between the binary and csv formats")
+    parser.add_argument('command', choices=['to-csv', 'from-csv'])
+    parser.add_argument('source')
+    parser.add_argument('target')
+    args = parser.parse_args(argv)
+
+    if args.command == 'to-csv':
+        to_csv(args.source, args.target)
+    else:
+        from_csv(args.source, args.target)
+
+
+if __name__ == '__main__':
+    main()
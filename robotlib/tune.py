@@ -0,0 +1,236 @@
+# Parameter sweeps of the lab programs on the simulator
+#
+#   python -m robotlib.tune myrobot/main.py --param kp=1.5,2,2.5 --param max_speed=60,70,80 \
+#       --param search_angles='[30,90,180]','[30,60,90,120,150,180]' --laps 3
+#   python -m robotlib.tune myrobot_3/main.py --space space.json --samples 40 --jobs 8
+#
+# Every candidate is a set of program settings (the ones a program passes through
+# robotlib/config.py, so any ROBOT_CONFIG key) run for a few simulated laps in a pool
+# of worker processes. A candidate scores its mean lap time plus loss_penalty
+# seconds per time the program lost the line, a lap that does not finish counts
+# as the time limit. That includes a lap the program ended early, e.g. at the wrong
+# grey cross (see robotlib/sim/run.py), otherwise settings that make the robot stop
+# early would look fast. Lower is better.
+#
+# The candidates are the whole grid of the values given per setting, or samples
+# of them picked at random from it. Results are appended to a cache file as they
+# come in, keyed by a hash of the settings and of everything else the laps depend
+# on, so an interrupted sweep picks up where it stopped and a sweep with more
+# values only runs the new candidates. The code is not part of the key, start a
+# new cache after changing it (RESULTS goes into the key, it changes with what the
+# lap results mean).
+#
+# Recorded sensor traces can't score changed settings: the readings depend on how
+# the robot steered when they were recorded, so the sweeps only run on the simulator.
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from robotlib.sim import run as sim_run
+
+CACHE = 'tune_cache.jsonl'
+# Version of the lap results, 2 since laps that end early don't count as finished
+RESULTS = 2
+
+
+# A method to parse name=value,value,... into (name, [values]), every value is json
+# (numbers, lists in brackets) or else a string
+def parse_param(text):
+    name, _, values = text.partition('=')
+    if not name or not values:
+        raise argparse.ArgumentTypeError("expected name=value,value,... but got {!r}".format(text))
+
+    parsed = []
+    depth = 0
+    current = ''
+    # Commas inside brackets belong to a list value
+    for character in values + ',':
+        if character == ',' and depth == 0:
+            try:
+                parsed.append(json.loads(current))
+            except ValueError:
+                parsed.append(current)
+            current = ''
+            continue
+        depth += {'[': 1, ']': -1}.get(character, 0)
+        current += character
+    return name, parsed
+
+
+# A method to list the candidates of a space (setting name -> list of values), the
+# whole grid or samples of it drawn without repeats
+def candidates(space, samples=None, seed=0):
+    names = sorted(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+    if samples is not None and samples < len(grid):
+        grid = random.Random(seed).sample(grid, samples)
+    return grid
+
+
+# The cache key of a candidate, everything the laps depend on goes into it
+def key(program, settings, options):
+    text = json.dumps({'program': os.path.basename(os.path.dirname(os.path.abspath(program))),
+                       'settings': settings, 'options': options, 'results': RESULTS}, sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+# A method to score a list of lap results, laps that timed out or ended early
+# count as the time limit
+def score(laps, time_limit, loss_penalty):
+    total = 0.0
+    for lap in laps:
+        total += lap['time'] if lap['finished'] else time_limit
+        total += loss_penalty * (lap['losses'] or 0)
+    return total / len(laps)
+
+
+# A method to run the laps of one candidate, in a worker process
+def evaluate(program, settings, options):
+    result = {'key': key(program, settings, options), 'settings': settings}
+    started = time.time()
+    handle, path = tempfile.mkstemp(suffix='.json')
+    try:
+        with os.fdopen(handle, 'w') as file:
+            json.dump(settings, file)
+        os.environ['ROBOT_CONFIG'] = path
+        laps = [sim_run.run_lap(program, options['track'], lap, options['time_limit'], options['noise'],
+                                options['drift'], options['seed'])
+                for lap in range(options['laps'])]
+    except Exception as error:
+        # e.g. a setting the program does not know
+        result['error'] = "{}: {}".format(type(error).__name__, error)
+        return result
+    finally:
+        os.environ.pop('ROBOT_CONFIG', None)
+        os.remove(path)
+
+    finished = [lap for lap in laps if lap['finished']]
+    result.update({
+        'score': score(laps, options['time_limit'], options['loss_penalty']),
+        'laps_finished': len(finished),
+        'laps_ended_early': sum(1 for lap in laps if lap['ended_early']),
+        'lap_time': sum(lap['time'] for lap in finished) / len(finished) if finished else None,
+        'losses': sum(lap['losses'] or 0 for lap in laps) / float(len(laps)),
+        'wall_time': time.time() - started,
+    })
+    return result
+
+
+def _evaluate(arguments):
+    return evaluate(*arguments)
+
+
+# A method to read the results cached so far, by key
+def load_cache(path):
+    results = {}
+    if path and os.path.exists(path):
+        with open(path, 'r') as file:
+            for line in file:
+                line = line.strip()
+                if line:
+                    result = json.loads(line)
+                    results[result['key']] = result
+    return results
+
+
+# A method to run a sweep, returns the results of all candidates (cached ones
+# included) sorted best first. Settings the candidates share go into base
+def sweep(program, space, base=None, samples=None, laps=3, noise=1.0, drift=0.0, seed=0, track=None,
+          time_limit=120.0, loss_penalty=1.0, cache=CACHE, jobs=None, report=None):
+    options = {'track': track or sim_run.program_track(program), 'laps': laps, 'noise': noise, 'drift': drift,
+               'seed': seed, 'time_limit': time_limit, 'loss_penalty': loss_penalty}
+    todo = []
+    results = load_cache(cache)
+    known = []
+    for candidate in candidates(space, samples, seed):
+        settings = dict(base or {})
+        settings.update(candidate)
+        candidate_key = key(program, settings, options)
+        if candidate_key in results:
+            known.append(results[candidate_key])
+        else:
+            todo.append((program, settings, options))
+
+    total = len(known) + len(todo)
+    pool = multiprocessing.Pool(jobs or multiprocessing.cpu_count())
+    try:
+        with open(cache, 'a') if cache else open(os.devnull, 'w') as file:
+            for result in pool.imap_unordered(_evaluate, todo):
+                if 'error' not in result:
+                    file.write(json.dumps(result, sort_keys=True) + '\n')
+                    file.flush()
+                known.append(result)
+                if report:
+                    report(result, len(known), total)
+    finally:
+        pool.close()
+        pool.join()
+    return sorted(known, key=lambda result: result.get('score', float('inf')))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search the settings of a lab program on the simulator")
+    parser.add_argument('program', help="path of the program, e.g. myrobot/main.py")
+    parser.add_argument('--param', action='append', type=parse_param, default=[],
+                        help="name=value,value,... values of one setting to try (json values)")
+    parser.add_argument('--space', help="json file of setting name -> list of values to try")
+    parser.add_argument('--config', help="json file of settings every candidate starts from")
+    parser.add_argument('--samples', type=int, help="candidates drawn at random from the grid (all by default)")
+    parser.add_argument('--laps', type=int, default=3, help="simulated laps per candidate")
+    parser.add_argument('--noise', type=float, default=1.0, help="color sensor noise")
+    parser.add_argument('--drift', type=float, default=0.0, help="gyro drift in degrees per second")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--track', help="track to drive on (the program's by default)")
+    parser.add_argument('--time-limit', type=float, default=120.0, help="simulated seconds per lap")
+    parser.add_argument('--loss-penalty', type=float, default=1.0, help="seconds added per line loss")
+    parser.add_argument('--cache', default=CACHE, help="file the results are kept in (empty for none)")
+    parser.add_argument('--jobs', type=int, help="worker processes (all cores by default)")
+    parser.add_argument('--top', type=int, default=10, help="number of best candidates printed")
+    parser.add_argument('--json', help="write all results to this file")
+    args = parser.parse_args(argv)
+
+    space = {}
+    if args.space:
+        with open(args.space, 'r') as file:
+            space.update(json.load(file))
+    space.update(args.param)
+    if not space:
+        parser.error("nothing to search, give --param or --space")
+    base = None
+    if args.config:
+        with open(args.config, 'r') as file:
+            base = json.load(file)
+
+    def report(result, done, total):
+        if 'error' in result:
+            print("[{}/{}] {} failed: {}".format(done, total, json.dumps(result['settings']), result['error']))
+        else:
+            print("[{}/{}] score {:.2f}, {} laps finished, {} ended early, {:.1f} losses: {}".format(
+                done, total, result['score'], result['laps_finished'], result['laps_ended_early'], result['losses'],
+                json.dumps(result['settings'], sort_keys=True)))
+
+    results = sweep(args.program, space, base, args.samples, args.laps, args.noise, args.drift, args.seed,
+                    args.track, args.time_limit, args.loss_penalty, args.cache or None, args.jobs, report)
+
+    print("best of {} candidates:".format(len(results)))
+    for result in results[:args.top]:
+        if 'error' not in result:
+            print("  {:.2f}  lap {}  losses {:.1f}  {}".format(
+                result['score'], "{:.2f}".format(result['lap_time']) if result['lap_time'] else "-",
+                result['losses'], json.dumps(result['settings'], sort_keys=True)))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 0 if results and 'error' not in results[0] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
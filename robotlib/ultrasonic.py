@@ -0,0 +1,78 @@
+# Distance readings off the control loop
+#
+# Reading the ultrasonic sensor is the slowest sysfs read of a tick and single
+# readings can be stray echoes: one of them at 3 cm starts a maneuver around a box
+# that isn't there. A DistanceMonitor reads the sensor at its own rate in a
+# background thread, keeps the median of the last readings and publishes it, so
+# the control loop only picks up the latest filtered value and never waits for
+# the sensor.
+#
+# In the simulator time only passes while the loop sleeps, a thread would read the
+# sensor at arbitrary simulated times. There the monitor reads from the loop
+# instead, whenever its period is over, which keeps the runs repeatable.
+import threading
+import time
+
+from robotlib import clock
+
+
+class DistanceMonitor(object):
+    # read   - function returning one distance reading in cm
+    # period - seconds between readings
+    # size   - number of readings the median is taken over
+    def __init__(self, read, period=0.03, size=3):
+        self.read = read
+        self.period = period
+        self.size = size
+        self.readings = [] # the last size raw readings, oldest first
+        self.count = 0
+        self.distance = None # median of the readings, replaced as a whole so it is safe to read
+        self._next = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    # A method to take the first reading and start reading at the monitor's own rate,
+    # in a background thread unless threaded is False (the default in the simulator)
+    def start(self, threaded=None):
+        self._measure()
+        if threaded is None:
+            threaded = not clock.SIMULATED
+        if threaded:
+            self._thread = threading.Thread(target=self._loop, name='distance-monitor')
+            self._thread.daemon = True
+            self._thread.start()
+        else:
+            self._next = clock.now() + self.period
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # The latest filtered distance, a sampler source. It never waits for the sensor
+    # when the monitor runs in its thread
+    def value(self):
+        if self._next is not None:
+            now = clock.now()
+            if now >= self._next:
+                self._measure()
+                # After a long tick the next reading is a period away, not due at once
+                self._next = max(self._next + self.period, now + self.period / 2)
+        return self.distance
+
+    def _loop(self):
+        while not self._stop.is_set():
+            started = time.time()
+            self._measure()
+            self._stop.wait(max(0.0, self.period - (time.time() - started)))
+
+    def _measure(self):
+        readings = self.readings
+        readings.append(self.read())
+        if len(readings) > self.size:
+            del readings[0]
+        self.count += 1
+        ordered = sorted(readings)
+        self.distance = ordered[len(ordered) // 2]
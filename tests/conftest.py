@@ -0,0 +1,6 @@
+# Make the shared robotlib package in the repository root importable, the same way
+# the lab programs do
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
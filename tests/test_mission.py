@@ -0,0 +1,159 @@
+import pytest
+
+from robotlib.mission import Mission
+from robotlib.scheduler import Scheduler
+
+# The green line course of myrobot and myrobot_2
+ROWS = [['outbound', 'grey', 'returning', 'spin_around', 'clear_of_cross'],
+        ['returning', 'grey', 'done', 'finish', 'clear_of_cross']]
+
+
+class Snapshot(object):
+    def __init__(self, time, driven=0.0):
+        self.time = time
+        self.driven = driven
+
+
+# The mission of the green line with its actions recorded, the spin takes three ticks
+# and clear_of_cross lets grey count 20 cm after the start or the spin
+class Course(object):
+    def __init__(self, rows=ROWS):
+        self.scheduler = Scheduler()
+        self.done = []
+        self.spun_at = 0.0
+        self.mission = Mission(rows, actions=dict(spin_around=self.spin_around, finish=self.finish),
+                               guards=dict(clear_of_cross=self.clear_of_cross), scheduler=self.scheduler)
+
+    def spin_around(self, snapshot):
+        self.done.append('spin_around')
+        for _ in range(3):
+            snapshot = yield
+        self.spun_at = snapshot.driven
+
+    def finish(self, snapshot):
+        self.done.append('finish')
+
+    def clear_of_cross(self, snapshot):
+        return snapshot.driven - self.spun_at >= 20
+
+    # A method to step the running action like Robot.tick does
+    def step(self, snapshot):
+        self.scheduler.step(snapshot)
+
+
+def test_events_take_the_rows_of_the_current_state():
+    course = Course()
+    transitions = []
+    course.mission.on_transition.append(lambda *transition: transitions.append(transition))
+
+    assert course.mission.fire('grey', Snapshot(1.0, driven=100))
+    assert course.mission.state == 'returning'
+    assert course.done == ['spin_around']
+    for tick in range(3):
+        course.step(Snapshot(1.1 + tick * 0.1, driven=100))
+    assert not course.mission.active
+
+    assert course.mission.fire('grey', Snapshot(5.0, driven=300))
+    assert course.mission.state == 'done'
+    assert course.done == ['spin_around', 'finish']
+    assert transitions == [(1.0, 'outbound', 'grey', 'returning'), (5.0, 'returning', 'grey', 'done')]
+    assert list(course.mission.history) == transitions
+
+
+def test_unknown_events_change_nothing():
+    course = Course()
+    assert not course.mission.fire('box', Snapshot(1.0, driven=100))
+    assert course.mission.state == 'outbound'
+    assert not course.mission.history
+
+
+def test_events_are_ignored_while_an_action_runs():
+    course = Course()
+    course.mission.fire('grey', Snapshot(1.0, driven=100))
+    assert course.mission.active
+    assert not course.mission.fire('grey', Snapshot(1.1, driven=300))
+    assert course.mission.state == 'returning'
+
+
+def test_a_cross_is_not_counted_twice():
+    course = Course()
+    course.mission.fire('grey', Snapshot(1.0, driven=100))
+    for tick in range(3):
+        course.step(Snapshot(1.1 + tick * 0.1, driven=104))
+
+    # Grey readings right after the spin are still the same cross
+    for driven in (104, 110, 123):
+        assert not course.mission.fire('grey', Snapshot(2.0, driven=driven))
+    assert course.mission.state == 'returning'
+
+    # The next cross
+    assert course.mission.fire('grey', Snapshot(9.0, driven=400))
+    assert course.mission.state == 'done'
+
+
+def test_without_the_guard_the_same_cross_counts_twice():
+    course = Course([row[:4] for row in ROWS])
+    course.mission.fire('grey', Snapshot(1.0, driven=100))
+    for tick in range(3):
+        course.step(Snapshot(1.1 + tick * 0.1, driven=104))
+    assert course.mission.fire('grey', Snapshot(1.5, driven=105))
+    assert course.mission.state == 'done'
+
+
+def test_grey_at_the_start_does_not_count():
+    course = Course()
+    assert not course.mission.fire('grey', Snapshot(0.5, driven=1))
+    assert course.mission.state == 'outbound'
+
+
+def test_guards_are_tried_in_order():
+    rows = [['wait', 'box', 'near', None, 'close'],
+            ['wait', 'box', 'far', None]]
+    mission = Mission(rows, actions={}, scheduler=Scheduler(),
+                      guards=dict(close=lambda snapshot: snapshot.driven < 10))
+    mission.fire('box', Snapshot(1.0, driven=50))
+    assert mission.state == 'far'
+
+    mission = Mission(rows, actions={}, scheduler=Scheduler(),
+                      guards=dict(close=lambda snapshot: snapshot.driven < 10))
+    mission.fire('box', Snapshot(1.0, driven=5))
+    assert mission.state == 'near'
+
+
+def test_timeouts_fire_once_the_state_lasted_long_enough():
+    rows = [['returning', 'grey', 'done', None],
+            ['returning', 60, 'given_up', None]]
+    mission = Mission(rows, actions={}, scheduler=Scheduler())
+    # The start state's timeout counts from the first tick
+    assert not mission.tick(Snapshot(10.0))
+    assert not mission.tick(Snapshot(69.9))
+    assert mission.tick(Snapshot(70.0))
+    assert mission.state == 'given_up'
+    assert mission.history[-1] == (70.0, 'returning', 60, 'given_up')
+
+
+def test_end_states_are_the_ones_no_row_leaves():
+    course = Course()
+    assert course.mission.ends == {'done'}
+    assert not course.mission.over()
+    course.mission.enter('done', 1.0)
+    assert course.mission.over()
+
+    # The obstacle course of myrobot_3 has no end
+    rows = [['before_box', 'box', 'after_box', None],
+            ['after_box', 'box', 'after_box', None]]
+    assert not Mission(rows, actions={}, scheduler=Scheduler()).ends
+
+
+def test_bad_rows_are_rejected():
+    scheduler = Scheduler()
+    with pytest.raises(ValueError):
+        Mission([['a', 'b', 'c']], actions={}, scheduler=scheduler)
+    with pytest.raises(ValueError):
+        Mission([['a', 'b', 'c', 'jump']], actions={}, scheduler=scheduler)
+    with pytest.raises(ValueError):
+        Mission([['a', 'b', 'c', None, 'ready']], actions={}, scheduler=scheduler)
+    with pytest.raises(ValueError):
+        Mission([['a', 5, 'b', None], ['a', 6, 'c', None]], actions={}, scheduler=scheduler)
+    with pytest.raises(ValueError):
+        Mission([], actions={}, scheduler=scheduler)
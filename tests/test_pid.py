@@ -0,0 +1,56 @@
+from robotlib.pid import PID
+
+
+# A method to update a controller with the same error every 10 ms, returns the last output
+def run(pid, error, ticks, start=0.0):
+    output = None
+    for tick in range(ticks):
+        output = pid.update(error, start + tick * 0.01)
+    return output
+
+
+def test_the_integral_does_not_wind_up_while_the_output_is_saturated():
+    pid = PID(kp=10.0, ki=5.0, limits=(-80, 80), integral_limit=1000.0)
+    assert run(pid, 20.0, 500) == 80
+    # 20 * 10 saturates from the first tick, nothing was integrated
+    assert pid.integral == 0.0
+
+    # As soon as the error turns around the output leaves the limit
+    assert pid.update(-1.0, 5.0) < 0
+
+
+def test_the_integral_grows_until_it_saturates_the_output():
+    pid = PID(kp=1.0, ki=10.0, limits=(-80, 80), integral_limit=1000.0)
+    run(pid, 5.0, 1000)
+    assert pid.output == 80
+    # It stopped close to where the output reached the limit
+    assert 7.5 - 0.1 <= pid.integral <= 7.5 + 0.1
+
+
+def test_the_integral_term_is_bounded():
+    pid = PID(kp=0.0, ki=2.0, limits=(-80, 80), integral_limit=10.0)
+    assert run(pid, 3.0, 1000) == 10.0
+    assert run(pid, -3.0, 2000, start=10.0) == -10.0
+
+
+def test_the_derivative_is_filtered():
+    pid = PID(kp=0.0, kd=1.0, derivative_tau=0.03)
+    pid.update(0.0, 0.0)
+    # A single step of the error does not kick the output by the raw derivative
+    output = pid.update(1.0, 0.01)
+    assert 0 < output < 1.0 / 0.01 / 2
+
+
+def test_feed_forward_is_added_before_the_clamp():
+    pid = PID(kp=1.0, limits=(-80, 80))
+    assert pid.update(5.0, 0.0, feed_forward=10.0) == 15.0
+    assert pid.update(5.0, 0.01, feed_forward=100.0) == 80
+
+
+def test_a_long_gap_restarts_the_controller():
+    pid = PID(kp=1.0, ki=10.0, integral_limit=1000.0, max_gap=0.1)
+    run(pid, 2.0, 50)
+    assert pid.integral > 0
+    pid.update(2.0, 10.0)
+    assert pid.integral == 0.0
+    assert pid.derivative == 0.0
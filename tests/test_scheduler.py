@@ -0,0 +1,143 @@
+import time
+
+from robotlib.profiling import Profiler
+from robotlib.scheduler import Scheduler
+
+
+# A clock that only moves when told to, and by a microsecond at every read like a
+# real one between two reads. Its sleep refuses negative lengths like time.sleep
+class FakeClock(object):
+    def __init__(self, read_time=1e-6):
+        self.time = 0.0
+        self.read_time = read_time
+        self.sleeps = []
+
+    def now(self):
+        now = self.time
+        self.time += self.read_time
+        return now
+
+    def sleep(self, seconds):
+        if seconds < 0:
+            raise ValueError("sleep length must be non-negative")
+        self.sleeps.append(seconds)
+        self.time += seconds
+
+
+# A method to run ticks that take the given seconds each, returns the times they started at
+def run(scheduler, clock, durations):
+    started = []
+    durations = list(durations)
+
+    def tick():
+        started.append(clock.time)
+        clock.time += durations[len(started) - 1]
+
+    scheduler.run(tick, lambda: len(started) == len(durations))
+    return started
+
+
+def test_ticks_stay_on_the_period_grid():
+    clock = FakeClock(read_time=0.0)
+    scheduler = Scheduler(period=0.01, clock=clock.now, sleep=clock.sleep)
+    started = run(scheduler, clock, [0.002, 0.007, 0.001, 0.005])
+    assert [round(time, 9) for time in started] == [0.0, 0.01, 0.02, 0.03]
+    assert scheduler.ticks == 4
+    assert scheduler.overruns == 0
+
+
+def test_an_overrun_skips_the_missed_deadlines():
+    clock = FakeClock(read_time=0.0)
+    scheduler = Scheduler(period=0.01, clock=clock.now, sleep=clock.sleep)
+    started = run(scheduler, clock, [0.002, 0.025, 0.002, 0.002])
+    # The second tick ended at 0.035, the deadlines at 0.02 and 0.03 are skipped
+    assert [round(time, 9) for time in started] == [0.0, 0.01, 0.04, 0.05]
+    assert scheduler.overruns == 1
+    assert abs(scheduler.max_lateness - 0.015) < 1e-9
+
+
+def test_the_clock_passing_the_new_deadline_does_not_sleep_a_negative_time():
+    # The tick ends just short of two periods late, the microsecond between the
+    # clock reads puts the rounded up deadline behind the clock
+    clock = FakeClock()
+    scheduler = Scheduler(period=0.01, clock=clock.now, sleep=clock.sleep)
+    run(scheduler, clock, [0.0299989999, 0.001])
+    assert scheduler.overruns == 1
+    assert min(clock.sleeps) == 0.0
+
+
+def test_the_profiled_sleep_gets_the_same_lengths():
+    clock = FakeClock()
+    scheduler = Scheduler(period=0.01, clock=clock.now, sleep=clock.sleep)
+    # Without a path nothing is written at exit, the scheduler can still be watched
+    profiler = Profiler()
+    profiler.watch_scheduler(scheduler)
+    run(scheduler, clock, [0.0299989999, 0.001, 0.001])
+    assert min(clock.sleeps) == 0.0
+    assert profiler.period.count == 2
+
+    summary = profiler.summary()
+    assert summary['overruns'] == 1
+    assert summary['ticks'] == 3
+
+
+def test_tasks_are_stepped_with_the_snapshots():
+    scheduler = Scheduler()
+    seen = []
+
+    def task():
+        snapshot = yield
+        while snapshot != 'stop':
+            seen.append(snapshot)
+            snapshot = yield
+
+    scheduler.start(task())
+    assert scheduler.busy()
+    assert scheduler.step('a')
+    assert scheduler.step('b')
+    assert not scheduler.step('stop')
+    assert not scheduler.busy()
+    assert seen == ['a', 'b']
+
+
+def test_a_task_may_start_the_next_one():
+    scheduler = Scheduler()
+    ran = []
+
+    def second():
+        ran.append('second')
+        yield
+
+    def first():
+        yield
+        scheduler.start(second())
+
+    scheduler.start(first())
+    scheduler.step(None)
+    assert ran == ['second']
+    assert scheduler.busy()
+
+
+def test_cancel_closes_the_task():
+    scheduler = Scheduler()
+    closed = []
+
+    def task():
+        try:
+            while True:
+                yield
+        finally:
+            closed.append(True)
+
+    scheduler.start(task())
+    scheduler.cancel()
+    assert closed == [True]
+    assert not scheduler.busy()
+
+
+def test_with_time_sleep():
+    # The real sleep raises on negative lengths, the scheduler must never pass one
+    scheduler = Scheduler(period=0.001, clock=time.monotonic, sleep=time.sleep)
+    ticks = []
+    scheduler.run(lambda: ticks.append(time.sleep(0.0025)), lambda: len(ticks) == 5)
+    assert scheduler.overruns >= 1
@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+from robotlib.sensor_window import SensorWindow
+
+BANDS = {'green': (None, 20), 'grey': (30, 45), 'white': (55, None), 'dark': (None, 40)}
+
+
+# The counts the window should have, from a plain list of all readings
+def expected(values, bands, band, span):
+    low, high = bands[band]
+    return sum(1 for value in values[-span:] if (low is None or value >= low) and (high is None or value <= high))
+
+
+def test_counts_bands_over_every_span():
+    window = SensorWindow(5, BANDS, spans=(3, 5))
+    for value in (10, 38, 70, 38, 40):
+        window.push(value)
+
+    assert window.count('grey', 5) == 3
+    assert window.count('grey', 3) == 2
+    assert window.count('white', 5) == 1
+    assert window.count('white', 3) == 1
+    # Overlapping bands count the same reading
+    assert window.count('dark', 5) == 4
+    assert window.count('green', 3) == 0
+
+
+def test_old_readings_fall_out_when_the_buffer_wraps_around():
+    window = SensorWindow(4, BANDS, spans=(2, 4))
+    for value in (38, 38, 38, 38):
+        window.push(value)
+    assert window.all_in('grey', 4)
+
+    # Six more pushes go around the ring buffer one and a half times
+    for value in (70, 38, 10, 70, 70, 10):
+        window.push(value)
+    assert window.latest() == 10
+    assert window.count('grey', 4) == 0
+    assert window.count('white', 4) == 2
+    assert window.count('white', 2) == 1
+    assert window.count('green', 2) == 1
+    assert window.length == 4 and window.is_full()
+
+
+def test_matches_a_plain_list_of_readings():
+    generator = random.Random(1)
+    spans = (1, 5, 7, 12)
+    window = SensorWindow(15, BANDS, spans=spans)
+    values = []
+    for _ in range(500):
+        value = generator.randint(0, 100)
+        window.push(value)
+        values.append(value)
+        for band in BANDS:
+            for span in spans:
+                assert window.count(band, span) == expected(values, BANDS, band, span)
+
+
+def test_all_in_needs_the_whole_span():
+    window = SensorWindow(5, BANDS, spans=(3,))
+    window.push(70)
+    window.push(70)
+    assert not window.all_in('white', 3)
+    assert window.at_least('white', 2, 3)
+    window.push(70)
+    assert window.all_in('white', 3)
+
+
+def test_new_bands_recount_the_kept_readings():
+    window = SensorWindow(4, BANDS, spans=(4,))
+    for value in (10, 22, 25, 70):
+        window.push(value)
+    assert window.count('green', 4) == 1
+
+    window.set_bands({'green': (None, 26)})
+    assert window.count('green', 4) == 3
+    assert window.length == 4
+    assert window.latest() == 70
+
+
+def test_clear_empties_the_counts():
+    window = SensorWindow(3, BANDS, spans=(3,))
+    for value in (38, 38, 38):
+        window.push(value)
+    window.clear()
+    assert window.length == 0
+    assert window.count('grey', 3) == 0
+
+
+def test_a_span_must_fit_the_window():
+    with pytest.raises(ValueError):
+        SensorWindow(5, BANDS, spans=(6,))
+    with pytest.raises(ValueError):
+        SensorWindow(5, BANDS, spans=(0,))
@@ -0,0 +1,111 @@
+import io
+import math
+import os
+
+import pytest
+
+from robotlib import trajectory
+from robotlib.trajectory import TrajectoryLogger, from_csv, open_trajectory, pack_header, read_header, to_csv
+
+SHIPPED_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'myrobot_test', 'robot_path.csv')
+
+ROWS = [(0.0, 0.0, 0.0, 0.0, 'program_start', 49),
+        (0.1, 0.5, 1.25, 0.125, 'moving', 8),
+        (0.2, 1.0, 2.5, -0.25, 'grey_detected', 38),
+        (0.3, 1.5, 3.75, math.pi, 'obstacle', 90),
+        (0.4, 2.0, 5.0, 0.0, 'program_end', 300)]
+
+
+def write_log(path, rows=ROWS, start_time=1234.5):
+    logger = TrajectoryLogger(path, start_time)
+    for row in rows:
+        logger.log(row)
+    logger.close()
+
+
+def test_header_round_trip():
+    states = ['program_start', 'moving', 'a_state_name_longer_than_32_bytes_is_cut']
+    data = pack_header(12.5, states)
+    start_time, names, size = read_header(io.BytesIO(data))
+    assert start_time == 12.5
+    assert names == states[:2] + [states[2][:trajectory.NAME_SIZE]]
+    assert size == len(data) == trajectory.HEADER.size + 3 * trajectory.NAME_SIZE
+
+
+def test_not_a_trajectory_file():
+    with pytest.raises(ValueError):
+        read_header(io.BytesIO(b'timestamp,x,y,state,color_value\n' + b'\0' * 32))
+
+
+def test_records_are_written_and_mapped_back(tmp_path):
+    path = str(tmp_path / 'robot_path.bin')
+    write_log(path)
+    records, states, start_time = open_trajectory(path)
+
+    assert start_time == 1234.5
+    assert list(states) == list(trajectory.STATES)
+    assert os.path.getsize(path) == trajectory.HEADER.size + len(states) * trajectory.NAME_SIZE + \
+        len(ROWS) * trajectory.RECORD.size
+    assert len(records) == len(ROWS)
+    for record, (time, x, y, heading, state, color) in zip(records, ROWS):
+        assert record['time'] == time
+        assert record['x'] == pytest.approx(x)
+        assert record['y'] == pytest.approx(y)
+        assert record['heading'] == pytest.approx(heading)
+        assert states[record['state']] == state
+    # Colors are stored as a byte, the logger clamps them into 0..255
+    assert records['color'].tolist() == [49, 8, 38, 90, 255]
+
+
+def test_csv_round_trip(tmp_path):
+    binary = str(tmp_path / 'robot_path.bin')
+    text = str(tmp_path / 'robot_path.csv')
+    again = str(tmp_path / 'again.bin')
+    write_log(binary)
+
+    to_csv(binary, text)
+    with open(text) as file:
+        lines = file.read().splitlines()
+    assert lines[0] == 'timestamp,x,y,state,color_value'
+    assert lines[3] == '00:00:00.200,1.00,2.50,grey_detected,38'
+
+    assert from_csv(text, again) == 0
+    records, states, _ = open_trajectory(again)
+    original, _, _ = open_trajectory(binary)
+    assert records['time'] == pytest.approx(original['time'])
+    assert records['x'].tolist() == original['x'].tolist()
+    assert records['y'].tolist() == original['y'].tolist()
+    assert records['color'].tolist() == original['color'].tolist()
+    assert [states[code] for code in records['state']] == [row[4] for row in ROWS]
+    # The csv layout has no heading
+    assert all(math.isnan(heading) for heading in records['heading'].tolist())
+
+
+def test_csv_without_header_and_new_states(tmp_path):
+    text = tmp_path / 'old.csv'
+    text.write_text('01:00:00.000,0.0,0.0,program_start,49\n'
+                    '01:00:01.500,1.0,2.0,found_during_search,12\n')
+    binary = str(tmp_path / 'old.bin')
+    from_csv(str(text), binary)
+    records, states, _ = open_trajectory(binary)
+    assert records['time'].tolist() == [3600.0, 3601.5]
+    assert states[records['state'][1]] == 'found_during_search'
+
+
+def test_colors_out_of_range_are_counted_and_clamped(tmp_path):
+    text = tmp_path / 'noisy.csv'
+    text.write_text('timestamp,x,y,state,color_value\n'
+                    '00:00:00.000,0.0,0.0,program_start,49\n'
+                    '00:00:00.100,0.0,1.0,moving,-12\n'
+                    '00:00:00.200,0.0,2.0,moving,300\n')
+    binary = str(tmp_path / 'noisy.bin')
+    with pytest.warns(UserWarning, match=r"2 of 3 rows .* \(first on line 3: -12\)"):
+        assert from_csv(str(text), binary) == 2
+    assert open_trajectory(binary)[0]['color'].tolist() == [49, 0, 255]
+
+
+def test_the_shipped_csv_converts(tmp_path):
+    binary = str(tmp_path / 'robot_path.bin')
+    with pytest.warns(UserWarning, match="94 of 221 rows"):
+        from_csv(SHIPPED_CSV, binary)
+    assert len(open_trajectory(binary)[0]) == 221